@@ -1,6 +1,8 @@
 try:
     from comms import Comms
     from robot_commands import RobotCommands
+    from dynamics import RobotDynamics, CommandDelay
 except (SystemError, ImportError):
     from .comms import Comms
     from .robot_commands import RobotCommands
+    from .dynamics import RobotDynamics, CommandDelay
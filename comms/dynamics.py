@@ -0,0 +1,139 @@
+import numpy as np
+from collections import deque
+try:
+    from robot_commands import RobotCommands
+except (SystemError, ImportError):
+    from .robot_commands import RobotCommands
+
+"""
+Models how robots actually follow speed commands: commands arrive late,
+wheels have a top speed, and speeds change with limited acceleration + jerk.
+Speeds + commands are (x, y, w) from the robot's perspective, like
+RobotCommands (x to the robot's right, y straight ahead), and every
+function works on any number of robots at once ((..., 3) arrays).
+"""
+
+
+class RobotDynamics(object):
+    # limits for each of (x, y, w)
+    MAX_ACCELERATION = np.array([2000., 2500., 30.])  # mm/s^2, rad/s^2
+    MAX_JERK = np.array([20000., 25000., 300.])  # mm/s^3, rad/s^3
+    # omni wheels: angle of each wheel around the robot (counterclockwise
+    # from the robot's x axis), and distance from the center (mm)
+    WHEEL_ANGLES = np.radians([60., 120., 225., 315.])
+    WHEEL_DISTANCE = 80
+    # top wheel (ground) speed from max power to motors, no load (mm/s)
+    MAX_WHEEL_SPEED = 1090
+    # time from sending a command until the wheels start following it (s)
+    # (the same latency the trajectory planner plans ahead for)
+    LATENCY = RobotCommands.COMMAND_LATENCY
+    # step size used when predicting further ahead
+    PREDICTION_STEP = .02
+
+    def __init__(self, max_acceleration=None, max_jerk=None,
+                 max_wheel_speed=None, latency=None):
+        if max_acceleration is not None:
+            self.MAX_ACCELERATION = np.asarray(max_acceleration, dtype=float)
+        if max_jerk is not None:
+            self.MAX_JERK = np.asarray(max_jerk, dtype=float)
+        if max_wheel_speed is not None:
+            self.MAX_WHEEL_SPEED = max_wheel_speed
+        if latency is not None:
+            self.LATENCY = latency
+        # (each wheel's drive direction, tangent to the robot)
+        self._wheel_directions = np.stack([-np.sin(self.WHEEL_ANGLES),
+                                           np.cos(self.WHEEL_ANGLES)], axis=1)
+
+    def wheel_speeds(self, speeds):
+        """(..., 4) ground speed of each wheel to drive at speeds"""
+        speeds = np.asarray(speeds, dtype=float)
+        return speeds[..., :2] @ self._wheel_directions.T + \
+            self.WHEEL_DISTANCE * speeds[..., 2:3]
+
+    def saturate(self, speeds):
+        """speeds scaled down (keeping their direction) so no wheel has to go
+        faster than it can"""
+        speeds = np.asarray(speeds, dtype=float)
+        fastest = np.abs(self.wheel_speeds(speeds)).max(axis=-1)
+        scale = np.maximum(fastest / self.MAX_WHEEL_SPEED, 1)
+        return speeds / scale[..., np.newaxis]
+
+    def step(self, poses, velocities, accelerations, commands, delta_time):
+        """Move robots at (..., 3) field poses delta_time seconds towards
+        their commanded speeds (the commands that have arrived, see
+        CommandDelay), returns new (poses, velocities, accelerations)"""
+        velocities = np.asarray(velocities, dtype=float)
+        accelerations = np.asarray(accelerations, dtype=float)
+        targets = self.saturate(commands)
+        errors = targets - velocities
+        # most acceleration that can still ramp back down to 0 (at the jerk
+        # limit) by the time the speed gets to the target, so it doesn't
+        # overshoot
+        desired = np.sign(errors) * np.sqrt(2 * self.MAX_JERK * np.abs(errors))
+        desired = np.clip(desired, -self.MAX_ACCELERATION,
+                          self.MAX_ACCELERATION)
+        max_change = self.MAX_JERK * delta_time
+        new_accelerations = accelerations + \
+            np.clip(desired - accelerations, -max_change, max_change)
+        new_velocities = velocities + \
+            (accelerations + new_accelerations) / 2 * delta_time
+        # (snap to the target once it is reached)
+        is_reached = (targets - new_velocities) * errors <= 0
+        new_velocities = np.where(is_reached, targets, new_velocities)
+        new_accelerations = np.where(is_reached, 0, new_accelerations)
+        new_poses = RobotCommands.predict_poses(
+            poses, (velocities + new_velocities) / 2, delta_time
+        )
+        return new_poses, new_velocities, new_accelerations
+
+    def predict(self, poses, velocities, commands, duration,
+                accelerations=None):
+        """Where robots (..., 3) will be after duration seconds, if they were
+        just sent commands (they keep their current speed until the
+        commands arrive)"""
+        poses = np.asarray(poses, dtype=float)
+        velocities = np.asarray(velocities, dtype=float)
+        if accelerations is None:
+            accelerations = np.zeros_like(velocities)
+        current_speeds = velocities
+        time_passed = 0
+        while time_passed < duration:
+            delta_time = min(self.PREDICTION_STEP, duration - time_passed)
+            targets = commands if time_passed >= self.LATENCY \
+                else current_speeds
+            poses, velocities, accelerations = self.step(
+                poses, velocities, accelerations, targets, delta_time
+            )
+            time_passed += delta_time
+        return poses
+
+    @staticmethod
+    def to_robot_perspective(poses, field_velocities):
+        """(..., 3) field velocities (vx, vy, vw) as (x, y, w) speeds from
+        the robot's perspective (the inverse of predict_poses' transform)"""
+        poses = np.asarray(poses, dtype=float)
+        field_velocities = np.asarray(field_velocities, dtype=float)
+        cos_w, sin_w = np.cos(poses[..., 2]), np.sin(poses[..., 2])
+        fx, fy = field_velocities[..., 0], field_velocities[..., 1]
+        return np.stack([fx * sin_w - fy * cos_w,
+                         fx * cos_w + fy * sin_w,
+                         field_velocities[..., 2]], axis=-1)
+
+
+class CommandDelay(object):
+    """Holds back commands until latency seconds after they were sent"""
+    def __init__(self, latency):
+        self._latency = latency
+        self._sent = deque()  # (time, {key: command})
+        self._arrived = dict()  # key : command
+
+    def send(self, timestamp, commands):
+        self._sent.append((timestamp, dict(commands)))
+
+    def arrived(self, timestamp):
+        """{key: latest command} of commands sent at least latency ago"""
+        # (with a little slack for rounding in the timestamps)
+        arrival_time = timestamp - self._latency + 1e-9
+        while self._sent and self._sent[0][0] <= arrival_time:
+            self._arrived = self._sent.popleft()[1]
+        return self._arrived
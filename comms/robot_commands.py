@@ -1,5 +1,9 @@
 import math
 import numpy as np
+try:
+    from trajectory import next_speeds, braking_speeds, arrival_times
+except (SystemError, ImportError):
+    from .trajectory import next_speeds, braking_speeds, arrival_times
 
 # serialization constants - must match with firmware
 MIN_X = -1000
@@ -37,11 +41,23 @@ class RobotCommands:
     # Goal is to get upper bound on what firmware can obey accurately
     ROBOT_MAX_SPEED = 500
     ROBOT_MAX_W = 6.14
+    # accelerations to plan trajectories with (a bit under what the robots
+    # can manage, see RobotDynamics)
+    ROBOT_MAX_ACCELERATION = 2000
+    ROBOT_MAX_W_ACCELERATION = 20
     MAX_KICK_SPEED = 2500  # TODO
     MAX_CHARGE_LEVEL = 250  # volts? should be whatever the board measures in
     CHARGE_RATE = 60  # volts per second?
 
     # constants for deriving speed from waypoints
+    # how speeds are derived: 'trajectory' (accelerate + brake at the limits)
+    # or 'proportional' (to the distance left)
+    MOTION_CONTROL = 'trajectory'
+    # time until the speeds are next derived, if not given (seconds)
+    CONTROL_STEP = .1
+    # time until commands reach the robot, planned ahead for (seconds)
+    # (RobotDynamics.LATENCY, what the simulator delays commands by, is this)
+    COMMAND_LATENCY = .05
     # default proportional scaling constant for distance differences
     SPEED_SCALE = .9
     ROTATION_SPEED_SCALE = 3
@@ -49,6 +65,7 @@ class RobotCommands:
     def __init__(self):
         # maximum speed at which robot will pursue waypoints
         self._speed_limit = self.ROBOT_MAX_SPEED
+        self.motion_control = self.MOTION_CONTROL
         # each waypoint is a position (x, y, w)
         self.waypoints = []
         self._prev_waypoint = None
@@ -56,6 +73,8 @@ class RobotCommands:
         self._x = 0  # speed x mm/s
         self._y = 0  # speed y mm/s
         self._w = 0  # speed robot radians/s
+        # ((x, y) speeds, field velocity) of the last trajectory command
+        self._trajectory_command = None
         # other commands
         self.is_dribbling = False
         self.is_charging = False
@@ -213,34 +232,61 @@ class RobotCommands:
         speed_factor = self.charge_level / self.MAX_CHARGE_LEVEL
         return self.MAX_KICK_SPEED * speed_factor
 
+    def get_speeds(self):
+        "commanded (x, y, w) speeds from the robot's perspective"
+        return np.array([self._x, self._y, self._w])
+
     # predict where the robot will be if it follows the current command
-    def predict_pos(self, pos, delta_time):
+    # (instantly, unless given RobotDynamics + its current velocity from its
+    # perspective, to account for acceleration limits + command latency)
+    def predict_pos(self, pos, delta_time, dynamics=None, velocity=None):
         assert(len(pos) == 3 and type(pos) == np.ndarray)
-        x, y, w = pos
-        robot_x, robot_y = self.field_to_robot_perspective(w, np.array([x, y]))
-        robot_x = robot_x + delta_time * self._x
-        robot_y = robot_y + delta_time * self._y
-        new_w = (w + delta_time * self._w) % (np.pi * 2)
-        # transform the x and y back to field perspective
-        new_x, new_y = self.robot_to_field_perspective(
-            w, np.array([robot_x, robot_y])
-        )
-        return np.array([new_x, new_y, new_w])
+        if dynamics is None:
+            return self.predict_poses(pos, self.get_speeds(), delta_time)
+        if velocity is None:
+            velocity = self.get_speeds()
+        return dynamics.predict(pos, velocity, self.get_speeds(), delta_time)
+
+    @staticmethod
+    def predict_poses(poses, speeds, delta_time):
+        """predict_pos for any number of robots at once: poses are (..., 3)
+        field (x, y, w) arrays, speeds the matching robot perspective
+        commands (x, y, w) (delta_time can also be one per robot)"""
+        poses = np.asarray(poses, dtype=float)
+        speeds = np.asarray(speeds, dtype=float)
+        delta_time = np.asarray(delta_time, dtype=float)
+        w = poses[..., 2]
+        cos_w, sin_w = np.cos(w), np.sin(w)
+        # robot perspective x is to the robot's right, y is straight ahead
+        dx = (speeds[..., 1] * cos_w + speeds[..., 0] * sin_w) * delta_time
+        dy = (speeds[..., 1] * sin_w - speeds[..., 0] * cos_w) * delta_time
+        new_w = (w + speeds[..., 2] * delta_time) % (np.pi * 2)
+        return np.stack([poses[..., 0] + dx, poses[..., 1] + dy, new_w],
+                        axis=-1)
 
     # use the waypoints to calculate desired speeds from robot perspective
-    def derive_speeds(self, current_position):
+    # (delta_time is how long until the speeds are next derived)
+    def derive_speeds(self, current_position, delta_time=None):
         if not self.waypoints:
             self.set_speeds(0, 0, 0)
             return
-        og_x, og_y, og_w = current_position
+        if delta_time is None:
+            delta_time = self.CONTROL_STEP
         if self._prev_waypoint is None:
             self._prev_waypoint = current_position
         # if close enough to first waypoint, delete and move to next one
         while len(self.waypoints) > 1 and \
                 self.close_enough(current_position, self.waypoints[0]):
-            goal_pos = self.waypoints[0]
             self._prev_waypoint = self.waypoints.pop(0)
         goal_pos = self.waypoints[0]
+        if self.motion_control == 'proportional':
+            self.derive_proportional_speeds(current_position, goal_pos)
+        else:
+            self.derive_trajectory_speeds(current_position, goal_pos,
+                                          delta_time)
+
+    def derive_proportional_speeds(self, current_position, goal_pos):
+        og_x, og_y, og_w = current_position
         goal_x, goal_y, goal_w = goal_pos
         delta = (goal_pos - current_position)[:2]
         # normalized offsets from robot's perspective
@@ -249,35 +295,7 @@ class RobotCommands:
         norm_w = self.trim_angle(goal_w - og_w)
         # move with speed proportional to delta
         linear_speed = self.magnitude(delta) * self.SPEED_SCALE
-        # slow down less for intermediate waypoints based on angle
-        # (always slows down fully for the final waypoint)
-        min_waypoint_speed = 0
-        if len(self.waypoints) > 1:
-            next_delta = (self.waypoints[1] - goal_pos)[:2]
-            if next_delta.any():
-                m1 = np.linalg.norm(delta)
-                m2 = np.linalg.norm(next_delta)
-                # get angle between vectors (arccos -> 0 to pi)
-                inner_formula = np.dot(delta, next_delta)/(m1*m2)
-                if inner_formula > 1:
-                    # catch rounding errors
-                    assert(inner_formula - 1 < .001)
-                    inner_formula = 1
-                trimmed_angle = np.arccos(inner_formula)
-                if not (0 <= trimmed_angle <= np.pi):
-                    # not sure why this was ever triggering?
-                    print("how is trimmed angle:" + str(trimmed_angle))
-                    trimmed_angle = max(trimmed_angle, 0)
-                    trimmed_angle = min(trimmed_angle, np.pi)
-                trimmed_angle = min(trimmed_angle, np.pi / 2)
-                # slow down depending on the sharpness of the turn
-                # (to a floor for >90 degree turns, keep speed if straight)
-                MIN_SLOWDOWN = .15  # (proportion of max speed)
-                slowdown_factor = 1 - trimmed_angle / (np.pi / 2)
-                slowdown_factor = max(slowdown_factor, MIN_SLOWDOWN)
-                assert(slowdown_factor <= 1)
-                min_waypoint_speed = self._speed_limit * slowdown_factor
-        linear_speed = linear_speed + min_waypoint_speed
+        linear_speed = linear_speed + self.waypoint_speed(goal_pos, delta)
         linear_speed = min(linear_speed, self._speed_limit)
         self._x = linear_speed * norm_x
         # print("x: {}, goal_x: {}, vx: {}".format(og_x, goal_x, self._x))
@@ -286,7 +304,99 @@ class RobotCommands:
         self._w = min(self._w, self.ROBOT_MAX_W)
         self._w = max(self._w, -self.ROBOT_MAX_W)
         # print("w: {}, goal_w: {}, d_w: {}, self_w: {}".format(og_w, goal_w, norm_w, self._w))
-        
+
+    def derive_trajectory_speeds(self, current_position, goal_pos,
+                                 delta_time):
+        """head straight for goal_pos as fast as we can still brake for it
+        (to the corner speed for intermediate waypoints), changing speed by
+        at most the acceleration limits since the last command"""
+        if delta_time <= 0:
+            # (no time to change speed in since the last command)
+            return
+        og_w = current_position[2]
+        # (assume the robot is doing what it was last told, and plan from
+        # where that gets it before this command arrives)
+        velocity = self.commanded_field_velocity(og_w)
+        delta = (goal_pos - current_position)[:2] - \
+            velocity * self.COMMAND_LATENCY
+        speed = braking_speeds(self.magnitude(delta), self._speed_limit,
+                               self.ROBOT_MAX_ACCELERATION, delta_time,
+                               self.waypoint_speed(goal_pos, delta))
+        change = self.normalize(delta) * speed - velocity
+        max_change = self.ROBOT_MAX_ACCELERATION * delta_time
+        if self.magnitude(change) > max_change:
+            change = self.normalize(change) * max_change
+        velocity = velocity + change
+        self._x, self._y = self.field_to_robot_perspective(og_w, velocity)
+        self._trajectory_command = (np.array([self._x, self._y]), velocity)
+        turn = self.trim_angle(goal_pos[2] - og_w) - \
+            self._w * self.COMMAND_LATENCY
+        self._w = float(next_speeds(turn, self._w, self.ROBOT_MAX_W,
+                                    self.ROBOT_MAX_W_ACCELERATION,
+                                    delta_time))
+
+    def commanded_field_velocity(self, w_robot):
+        "field (x, y) velocity the robot is commanded at, facing w_robot"
+        # (the field velocity a trajectory command was for, even if the
+        # robot has turned since, unless speeds have been set another way)
+        if self._trajectory_command is not None:
+            speeds, velocity = self._trajectory_command
+            if speeds[0] == self._x and speeds[1] == self._y:
+                return velocity.copy()
+        return self.robot_to_field_perspective(
+            w_robot, np.array([self._x, self._y], dtype=float)
+        )
+
+    def waypoint_speed(self, goal_pos, delta):
+        """speed to pass through goal_pos at (the first waypoint, delta away)
+        slowing down less for intermediate waypoints based on angle
+        (always slows down fully for the final waypoint)"""
+        if len(self.waypoints) < 2:
+            return 0
+        next_delta = (self.waypoints[1] - goal_pos)[:2]
+        if not next_delta.any() or not delta.any():
+            return 0
+        m1 = np.linalg.norm(delta)
+        m2 = np.linalg.norm(next_delta)
+        # get angle between vectors (arccos -> 0 to pi)
+        inner_formula = np.dot(delta, next_delta)/(m1*m2)
+        if inner_formula > 1:
+            # catch rounding errors
+            assert(inner_formula - 1 < .001)
+            inner_formula = 1
+        trimmed_angle = np.arccos(inner_formula)
+        if not (0 <= trimmed_angle <= np.pi):
+            # not sure why this was ever triggering?
+            print("how is trimmed angle:" + str(trimmed_angle))
+            trimmed_angle = max(trimmed_angle, 0)
+            trimmed_angle = min(trimmed_angle, np.pi)
+        trimmed_angle = min(trimmed_angle, np.pi / 2)
+        # slow down depending on the sharpness of the turn
+        # (to a floor for >90 degree turns, keep speed if straight)
+        MIN_SLOWDOWN = .15  # (proportion of max speed)
+        slowdown_factor = 1 - trimmed_angle / (np.pi / 2)
+        slowdown_factor = max(slowdown_factor, MIN_SLOWDOWN)
+        assert(slowdown_factor <= 1)
+        return self._speed_limit * slowdown_factor
+
+    def predict_arrival_time(self, current_position):
+        """seconds until the robot gets to its final waypoint, following the
+        trajectory from its current commanded speed (not counting slowing
+        down for corners), 0 if it has no waypoints"""
+        if not self.waypoints:
+            return 0
+        path = np.array([current_position] + self.waypoints, dtype=float)
+        distance = np.linalg.norm(np.diff(path[:, :2], axis=0), axis=1).sum()
+        velocity = self.commanded_field_velocity(current_position[2])
+        direction = self.normalize(path[1, :2] - path[0, :2])
+        linear_time = arrival_times(distance, np.dot(velocity, direction),
+                                    self._speed_limit,
+                                    self.ROBOT_MAX_ACCELERATION)
+        turn = self.trim_angle(path[-1, 2] - current_position[2])
+        turn_time = arrival_times(turn, self._w, self.ROBOT_MAX_W,
+                                  self.ROBOT_MAX_W_ACCELERATION)
+        return float(max(linear_time, turn_time))
+
     # used for eliminating intermediate waypoints
     def close_enough(self, current, goal):
         # distance condition helpful for simulator b.c. won't overrun waypoint
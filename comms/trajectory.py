@@ -0,0 +1,58 @@
+'''Time-optimal (trapezoidal) speed profiles along one axis: accelerate at
+   the limit up to max speed, cruise, then brake at the limit to arrive.
+
+   Every function works on numpy arrays (any number of robots or axes at
+   once); distances are signed along the axis, speeds signed the same way.
+'''
+import numpy as np
+
+
+def braking_speeds(distances, max_speeds, max_accelerations, delta_time,
+                   end_speeds=0):
+    """fastest speeds (>= 0) to move towards targets at for the next
+    delta_time seconds, and still slow down to end_speeds by the time they
+    get there (changing speed once per delta_time)"""
+    distances = np.abs(np.asarray(distances, dtype=float))
+    step = max_accelerations * delta_time
+    # (v^2 = end^2 + 2ad, for speeds that only change every delta_time)
+    speeds = step * (np.sqrt(.25 + (2 * max_accelerations * distances +
+                                    end_speeds ** 2 + end_speeds * step) /
+                             step ** 2) - .5)
+    return np.minimum(speeds, max_speeds)
+
+
+def next_speeds(distances, speeds, max_speeds, max_accelerations, delta_time,
+                end_speeds=0):
+    """speed setpoints for the next delta_time seconds, going from speeds
+    towards the fastest speeds that can still stop at distances"""
+    targets = np.sign(distances) * braking_speeds(
+        distances, max_speeds, max_accelerations, delta_time, end_speeds
+    )
+    step = max_accelerations * delta_time
+    return np.clip(targets, speeds - step, speeds + step)
+
+
+def arrival_times(distances, speeds, max_speeds, max_accelerations):
+    """seconds to travel distances and stop there, starting at speeds,
+    following the fastest trapezoidal profile"""
+    distances = np.asarray(distances, dtype=float)
+    speeds = np.asarray(speeds, dtype=float)
+    signs = np.where(distances < 0, -1., 1.)
+    distances, speeds = distances * signs, speeds * signs
+    # first stop if heading away, or too fast to stop in time (then go back)
+    stopping_distances = speeds ** 2 / (2 * max_accelerations)
+    must_stop = (speeds < 0) | (stopping_distances > distances)
+    stop_times = np.where(must_stop, np.abs(speeds) / max_accelerations, 0)
+    distances = np.where(must_stop, np.abs(distances - np.sign(speeds) *
+                                           stopping_distances), distances)
+    speeds = np.where(must_stop, 0, np.minimum(speeds, max_speeds))
+    # speed up to a peak (lower than max speed if it's too close to get
+    # there), cruise at it, then brake
+    peaks = np.minimum(np.sqrt(max_accelerations * distances + speeds ** 2 / 2),
+                       max_speeds)
+    ramp_distances = (2 * peaks ** 2 - speeds ** 2) / (2 * max_accelerations)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        cruise_times = np.where(peaks > 0,
+                                (distances - ramp_distances) / peaks, 0)
+    return stop_times + (2 * peaks - speeds) / max_accelerations + \
+        np.maximum(cruise_times, 0)
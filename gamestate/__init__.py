@@ -1 +1,2 @@
 from .gamestate import GameState
+from .clock import WallClock, VirtualClock
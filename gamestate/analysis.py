@@ -1,5 +1,10 @@
 import numpy as np
 
+try:
+    from ball_trajectory import BallTrajectory
+except (SystemError, ImportError):
+    from .ball_trajectory import BallTrajectory
+
 
 # Part of the Gamestate class we've separated out for readability
 class Analysis(object):
@@ -14,6 +19,9 @@ class Analysis(object):
     # PHYSICS CONSTANTS
     # ball constant slowdown due to friction
     BALL_DECCELERATION = 350  # mm/s^2
+    # fraction of the ball's speed into a wall it bounces back with
+    # (robots are modeled as absorbing it, the ball rolls along them)
+    BALL_WALL_RESTITUTION = .5
 
     # returns the amount of overlap between circles as (x, y) vector
     def overlap(self, pos1, pos2, radius_sum):
@@ -30,6 +38,34 @@ class Analysis(object):
     def robot_overlap(self, pos1, pos2, buffer_dist=0):
         return self.overlap(pos1, pos2, self.ROBOT_RADIUS * 2 + buffer_dist)
 
+    # returns N x N x 2 array of overlap vectors between every pair of circles
+    # ([i, j] is the same as overlap(positions[i], positions[j], radius_sum))
+    def pairwise_overlaps(self, positions, radius_sum):
+        # (positions can also be a stack of worlds, (..., N, 3))
+        xy = np.asarray(positions, dtype=float)[..., :2]
+        delta = xy[..., np.newaxis, :, :] - xy[..., :, np.newaxis, :]
+        distance = np.linalg.norm(delta, axis=-1)
+        is_touching = (distance > 0) & (distance <= radius_sum)
+        scale = np.zeros_like(distance)
+        scale[is_touching] = radius_sum / distance[is_touching] - 1
+        overlaps = delta * scale[..., np.newaxis]
+        # circles at the exact same spot get pushed apart along x
+        # (in opposite directions, so each pair still separates)
+        coincident = (distance == 0) & ~np.eye(xy.shape[-2], dtype=bool)
+        overlaps[np.triu(coincident)] = [radius_sum, 0]
+        overlaps[np.tril(coincident)] = [-radius_sum, 0]
+        return overlaps
+
+    # returns N x 2 array of how far to move each robot to resolve collisions
+    # (each overlapping pair is pushed apart equally, from the given positions)
+    def resolve_robot_overlaps(self, positions, buffer_dist=0):
+        if len(positions) == 0:
+            return np.zeros((0, 2))
+        overlaps = self.pairwise_overlaps(
+            positions, self.ROBOT_RADIUS * 2 + buffer_dist
+        )
+        return -overlaps.sum(axis=1) / 2
+
     # if position is in front face of robot
     def is_robot_front_sector(self, robot_pos, pos):
         dx, dy = pos[:2] - robot_pos[:2]
@@ -82,27 +118,22 @@ class Analysis(object):
         # TODO: kicking version of this function incorporates breakbeam sensor?
         MAX_DIST = self.ROBOT_RADIUS + 32  # fairly lenient constants,
         DRIBBLE_ZONE_RADIUS = 60
-        in_zone = np.linalg.norm(ball_pos - ideal_pos) < DRIBBLE_ZONE_RADIUS
-        close_enough = np.linalg.norm(ball_pos - robot_pos[:2]) < MAX_DIST
+        # (also works on an array of ball positions, one result per row)
+        in_zone = np.linalg.norm(ball_pos - ideal_pos, axis=-1) < DRIBBLE_ZONE_RADIUS
+        close_enough = np.linalg.norm(ball_pos - robot_pos[:2], axis=-1) < MAX_DIST
         #print(close_enough)
-        return in_zone and close_enough
+        return np.logical_and(in_zone, close_enough)
 
     def ball_in_dribbler(self, team, robot_id):
-        positions = self._ball_position
         MIN_TIME_INTERVAL = 1
-        i = 0
-        if len(positions) <= 1:
-            return False
-        if not self.ball_in_dribbler_single_frame(team, robot_id, positions[0][1]):
+        if len(self._ball_position) <= 1:
             return False
-        # look back from 0 (most recent) until big enough interval
-        while i < len(positions) - 1 and \
-              positions[0][0] - positions[i][0] < MIN_TIME_INTERVAL:
-            ball_pos = positions[i][1]
-            i += 1
-            if not self.ball_in_dribbler_single_frame(team, robot_id, ball_pos):
-                return False
-        return True
+        times, positions = self._ball_position.all()
+        # check every frame less than the interval older than the newest one
+        # (the oldest frame in the history is never used)
+        recent = times[1:] > times[-1] - MIN_TIME_INTERVAL
+        positions = positions[1:][recent]
+        return bool(self.ball_in_dribbler_single_frame(team, robot_id, positions).all())
 
     # return whether robot can be in a location without colliding another robot
     def is_position_open(self, pos, team, robot_id, buffer_dist=0):
@@ -113,6 +144,58 @@ class Analysis(object):
                 return False
         return True
 
+    # batched is_position_open: returns whether each of the given points is open
+    def are_positions_open(self, points, team, robot_id, buffer_dist=0):
+        points = np.asarray(points, dtype=float).reshape(-1, 2)
+        is_open = np.ones(len(points), dtype=bool)
+        radius = self.ROBOT_RADIUS * 2 + buffer_dist
+        for key, robot_pos in self.get_all_robot_positions():
+            if key == (team, robot_id):
+                continue
+            delta = points - robot_pos[:2]
+            is_open &= (delta * delta).sum(axis=1) >= radius ** 2
+        return is_open
+
+    # returns how far along each segment (starts[i] -> ends[i]) can be travelled
+    # before coming within radius of any of the obstacle centers (N x 2)
+    # (the segment length if it is never blocked). Obstacles that already
+    # overlap the start only block a segment heading further into them.
+    def segment_free_lengths(self, starts, ends, obstacles, radius):
+        starts = np.asarray(starts, dtype=float).reshape(-1, 2)
+        ends = np.asarray(ends, dtype=float).reshape(-1, 2)
+        obstacles = np.asarray(obstacles, dtype=float).reshape(-1, 2)
+        path = ends - starts
+        length = np.linalg.norm(path, axis=1)
+        direction = np.zeros_like(path)
+        is_moving = length > 0
+        direction[is_moving] = path[is_moving] / length[is_moving, np.newaxis]
+        if len(obstacles) == 0:
+            return length
+        # (segments x obstacles) distances along + away from each segment
+        to_center = obstacles[np.newaxis, :, :] - starts[:, np.newaxis, :]
+        projection = (to_center * direction[:, np.newaxis, :]).sum(axis=2)
+        center_distance_sq = (to_center * to_center).sum(axis=2)
+        half_chord_sq = radius ** 2 - (center_distance_sq - projection ** 2)
+        half_chord = np.sqrt(np.maximum(half_chord_sq, 0))
+        enter = projection - half_chord
+        leave = projection + half_chord
+        hits = (half_chord_sq > 0) & (enter < length[:, np.newaxis]) & (leave > 0)
+        starts_inside = center_distance_sq < radius ** 2
+        hits &= ~starts_inside | (projection > 0)
+        hit_distance = np.where(hits, np.maximum(enter, 0), np.inf)
+        return np.minimum(hit_distance.min(axis=1), length)
+
+    # returns (is_blocked, free_pos) for a straight path between two positions,
+    # where free_pos is the farthest point reachable before hitting an obstacle
+    def segment_collision(self, start, end, obstacles, radius):
+        start = np.asarray(start[:2], dtype=float)
+        end = np.asarray(end[:2], dtype=float)
+        free_length = self.segment_free_lengths(start, end, obstacles, radius)[0]
+        length = np.linalg.norm(end - start)
+        if free_length >= length:
+            return False, end
+        return True, start + (end - start) / length * free_length
+
     # return robot team and id occupying a current position, if any
     def robot_at_position(self, pos):
         for (team, robot_id), robot_pos in self.get_all_robot_positions():
@@ -124,18 +207,17 @@ class Analysis(object):
     def get_ball_velocity(self):
         # TOOD: smooth out this value by averaging?
         # prev_velocity = self.ball_velocity
-        positions = self._ball_position
         MIN_TIME_INTERVAL = .05
-        i = 0
-        if len(positions) <= 1:
+        if len(self._ball_position) <= 1:
             return np.array([0, 0])
-        # look back from 0 (most recent) until big enough interval
-        while i < len(positions) - 1 and \
-              positions[0][0] - positions[i][0] < MIN_TIME_INTERVAL:
-            i += 1
+        times, positions = self._ball_position.all()
+        # look back from the most recent until big enough interval
+        # (or use the oldest point if the whole history is too short)
+        i = np.searchsorted(times, times[-1] - MIN_TIME_INTERVAL, side='right') - 1
+        i = min(max(i, 0), len(times) - 2)
         # use those two points as reference for calculation
-        time1, pos1 = positions[i]
-        time2, pos2 = positions[0]
+        time1, pos1 = times[i], positions[i]
+        time2, pos2 = times[-1], positions[-1]
         delta_pos = pos2 - pos1
         delta_time = time2 - time1
         midpoint_velocity = delta_pos / delta_time
@@ -156,50 +238,37 @@ class Analysis(object):
         # print("after adjust: {}".format(velocity_now))
         return velocity_now
 
+    def get_ball_trajectory(self):
+        """closed form model of where the ball is rolling (see BallTrajectory)"""
+        return BallTrajectory(self.get_ball_position(),
+                              self.get_ball_velocity(),
+                              self.BALL_DECCELERATION)
+
     def predict_ball_pos(self, delta_time):
-        velocity_initial = self.get_ball_velocity()
-        # print(f"{velocity_initial}")
-        if not velocity_initial.any():
-            return (self.get_ball_position())
-        accel_direction = -velocity_initial / np.linalg.norm(velocity_initial)
-        accel = accel_direction * self.BALL_DECCELERATION
-        # truncate if we're going past the time where the ball would stop
-        velocity_final = accel * delta_time + velocity_initial
-        if ((velocity_initial * velocity_final) < 0).any():
-            assert(((velocity_initial * velocity_final) <= 0).all())
-# We need to use two cases here because one coordinate of initial velocity can be zero which
-# would cause us to divide by zero if we use that axis.
-            if not accel[0] == 0:
-                time_to_stop = -1 * velocity_initial[0] / accel[0]
-            else:
-                time_to_stop = -1 * velocity_initial[1] / accel[1]
-            # print("dt: {} TTS: {}".format(delta_time, time_to_stop))
-            delta_time = time_to_stop
-        predicted_pos_change = \
-            0.5 * accel * delta_time ** 2 + velocity_initial * delta_time
-        # print("dt: {} PPC: {}".format(delta_time, predicted_pos_change))
-        predicted_pos = predicted_pos_change + self.get_ball_position()
-        return predicted_pos
+        return self.get_ball_trajectory().position_at(delta_time)
 
     # TODO: move to strategy analysis
     # return where in goal ball is going to if it is going in
     def is_shot_coming(self, team):
-        start_ball_pos = self.get_ball_position()
-        start_x = start_ball_pos[0]
-        start_y = start_ball_pos[1]
-        final_ball_pos = self.predict_ball_pos(10)
-        final_x = final_ball_pos[0]
-        final_y = final_ball_pos[1]
+        trajectory = self.get_ball_trajectory()
+        if not trajectory.is_moving():
+            return None
         defense_goal = self.get_defense_goal(team)
         x_pos_of_goal = defense_goal[0][0]
         GOAL_WIDTH_BUFFER = 250 # assumes shots slightly wide are going in
         GOAL_X_BUFFER = 500 # assumes shots stopping slightly short are going in
+        SHOT_TIME_HORIZON = 10 # only look at where the ball is in this long
+        start_x = trajectory.position[0]
+        final_x = trajectory.position_at(SHOT_TIME_HORIZON)[0]
         x1 = x_pos_of_goal + GOAL_X_BUFFER
         x2 = x_pos_of_goal - GOAL_X_BUFFER
         if (min(final_x, start_x) <= x1 <= max(final_x, start_x)) or \
            (min(final_x, start_x) <= x2 <= max(final_x, start_x)):
-            slope = (start_y - final_y)/(start_x - final_x)
-            y_intercept = slope * (x_pos_of_goal - start_x) + start_y
+            # where the ball's line (even if it stops short) meets the goal
+            distance = trajectory.line_crossing_distance(*defense_goal)
+            if distance is None:
+                return None
+            _, y_intercept = trajectory.position + trajectory.direction * distance
             if -self.GOAL_WIDTH/2 - GOAL_WIDTH_BUFFER <= y_intercept <= self.GOAL_WIDTH/2 + GOAL_WIDTH_BUFFER:
                 return np.array([x_pos_of_goal, y_intercept])
         return None
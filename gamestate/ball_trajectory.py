@@ -0,0 +1,217 @@
+import numpy as np
+
+
+class BallTrajectory(object):
+    """Closed form model of a rolling ball: it moves in a straight line from
+       its position, slowing down at a constant rate until it stops.
+       Built once from the ball's position + velocity, then any number of
+       future positions (or arrays of them) can be read without recomputing
+       the velocity from the position history.
+       Times are seconds from when the trajectory was made.
+    """
+    # intercept solver: coarse samples to bracket when robots can first
+    # (and last) reach the ball, then a fixed number of bisection steps
+    # (at least INTERCEPT_SAMPLES, close enough together that short windows
+    # aren't skipped over, plus when each robot is closest to being able to
+    # reach the ball as it passes, where the shortest windows are)
+    INTERCEPT_SAMPLES = 20
+    INTERCEPT_MAX_SAMPLE_SPACING = .05
+    INTERCEPT_ITERATIONS = 20
+
+    def __init__(self, position, velocity, deceleration):
+        self.position = np.array(position[:2], dtype=float)
+        self.velocity = np.array(velocity[:2], dtype=float)
+        self.deceleration = deceleration
+        self.speed = np.linalg.norm(self.velocity)
+        if self.speed > 0:
+            self.direction = self.velocity / self.speed
+            self.stop_time = self.speed / deceleration
+        else:
+            self.direction = np.array([0., 0.])
+            self.stop_time = 0.
+        # how far the ball will roll before stopping (mm)
+        self.stop_distance = self.speed * self.stop_time / 2
+
+    def is_moving(self):
+        return self.speed > 0
+
+    def distances_at(self, times):
+        """distance travelled along the path at each time"""
+        t = np.clip(times, 0, self.stop_time)
+        return self.speed * t - .5 * self.deceleration * t ** 2
+
+    def positions_at(self, times):
+        """ball position at each time (N x 2 for an array of N times)"""
+        distances = np.asarray(self.distances_at(times))
+        return self.position + distances[..., np.newaxis] * self.direction
+
+    def position_at(self, time):
+        return self.positions_at(time)
+
+    def velocities_at(self, times):
+        t = np.clip(times, 0, self.stop_time)
+        speeds = np.asarray(self.speed - self.deceleration * t)
+        return speeds[..., np.newaxis] * self.direction
+
+    def stop_position(self):
+        return self.position + self.direction * self.stop_distance
+
+    def time_at_distance(self, distance):
+        """when the ball has rolled the given distance, or None if it stops
+           before getting that far"""
+        if distance < 0 or distance > self.stop_distance:
+            return None
+        if distance == 0:
+            return 0.
+        # solve distance = speed * t - deceleration * t^2 / 2 (earlier root)
+        discriminant = max(self.speed ** 2 - 2 * self.deceleration * distance, 0)
+        return (self.speed - np.sqrt(discriminant)) / self.deceleration
+
+    def line_crossing_distance(self, point1, point2):
+        """distance along the ball's path (extended past where it stops) to
+           the line through point1 + point2, or None if the ball is still or
+           moving parallel to/away from the line"""
+        if not self.is_moving():
+            return None
+        point1 = np.asarray(point1[:2], dtype=float)
+        line = np.asarray(point2[:2], dtype=float) - point1
+        # solve position + direction * s = point1 + line * u for s
+        denominator = self.direction[0] * line[1] - self.direction[1] * line[0]
+        if denominator == 0:
+            return None
+        offset = point1 - self.position
+        s = (offset[0] * line[1] - offset[1] * line[0]) / denominator
+        if s < 0:
+            return None
+        return s
+
+    def line_crossing(self, point1, point2):
+        """(time, position) when the ball crosses the line through point1 +
+           point2, or None if it never gets there"""
+        distance = self.line_crossing_distance(point1, point2)
+        if distance is None:
+            return None
+        crossing_time = self.time_at_distance(distance)
+        if crossing_time is None:
+            return None
+        return crossing_time, self.position + self.direction * distance
+
+    def exit_time(self, min_x, max_x, min_y, max_y):
+        """when the ball leaves the given box, or None if it stops inside"""
+        x, y = self.position
+        if not (min_x <= x <= max_x and min_y <= y <= max_y):
+            return 0.
+        if not self.is_moving():
+            return None
+        distances = []
+        for pos, direction, low, high in ((x, self.direction[0], min_x, max_x),
+                                          (y, self.direction[1], min_y, max_y)):
+            if direction > 0:
+                distances.append((high - pos) / direction)
+            elif direction < 0:
+                distances.append((low - pos) / direction)
+        return self.time_at_distance(min(distances))
+
+    def _reach_margins(self, positions, max_speeds, times):
+        """how much farther than needed robots could go by each time
+           (>= 0 means the robot can be at the ball then)
+           positions is N x 2, max_speeds N, times N x K"""
+        ball_positions = self.positions_at(times)
+        distances = np.linalg.norm(
+            ball_positions - positions[:, np.newaxis, :], axis=2)
+        return max_speeds[:, np.newaxis] * times - distances
+
+    def _bisect(self, positions, max_speeds, lo, hi, is_reachable_at_hi):
+        """narrow down [lo, hi] (for every robot at once) to where the
+           robot switches between unable + able to reach the ball"""
+        for _ in range(self.INTERCEPT_ITERATIONS):
+            mid = (lo + hi) / 2
+            is_reachable = self._reach_margins(
+                positions, max_speeds, mid[:, np.newaxis])[:, 0] >= 0
+            moves_hi = is_reachable == is_reachable_at_hi
+            hi = np.where(moves_hi, mid, hi)
+            lo = np.where(moves_hi, lo, mid)
+        # (return the side of the bracket where the robot can reach)
+        return hi if is_reachable_at_hi else lo
+
+    def _peak_margin_times(self, positions, max_speeds, horizon):
+        """when the ball passes closest to each robot, and when the robot's
+           reach margin peaks just after that (where the shortest windows to
+           reach the ball are). The margin only rises until the ball passes,
+           and once the ball is slower than the robot, so the peak is found
+           by a ternary search in between."""
+        along = (positions - self.position) @ self.direction
+        closest = np.minimum(self.stop_time, horizon) * np.ones(len(along))
+        for i, distance in enumerate(along):
+            closest_time = self.time_at_distance(max(distance, 0))
+            if closest_time is not None:
+                closest[i] = min(closest_time, horizon)
+        slow_times = np.clip((self.speed - max_speeds) / self.deceleration,
+                             0, horizon)
+        lo, hi = closest.copy(), np.maximum(slow_times, closest)
+        for _ in range(self.INTERCEPT_ITERATIONS):
+            third = (hi - lo) / 3
+            margins = self._reach_margins(
+                positions, max_speeds,
+                np.stack([lo + third, hi - third], axis=1))
+            is_rising = margins[:, 0] < margins[:, 1]
+            lo = np.where(is_rising, lo + third, lo)
+            hi = np.where(is_rising, hi, hi - third)
+        return np.stack([closest, (lo + hi) / 2], axis=1)
+
+    def intercept_windows(self, positions, max_speeds, end_time=None):
+        """Earliest + latest times robots can be where the ball is, for
+           robots at positions (N x 2 or N x 3) moving at up to max_speeds
+           (one per robot, or one for all), stopping when the ball stops or
+           at end_time (e.g. when it leaves the field).
+           Returns two arrays of N times, NaN where the robot can't make it.
+           Work grows only with how long the ball rolls for.
+        """
+        positions = np.asarray(positions, dtype=float)
+        positions = positions.reshape(-1, positions.shape[-1])[:, :2]
+        num_robots = len(positions)
+        max_speeds = np.broadcast_to(
+            np.asarray(max_speeds, dtype=float), (num_robots,))
+        horizon = self.stop_time
+        if end_time is not None:
+            horizon = min(horizon, end_time)
+        earliest = np.full(num_robots, np.nan)
+        latest = np.full(num_robots, np.nan)
+        if num_robots == 0:
+            return earliest, latest
+        num_samples = max(self.INTERCEPT_SAMPLES, int(np.ceil(
+            horizon / self.INTERCEPT_MAX_SAMPLE_SPACING)))
+        sample_times = np.sort(np.concatenate([
+            np.tile(np.linspace(0, horizon, num_samples + 1), (num_robots, 1)),
+            self._peak_margin_times(positions, max_speeds, horizon)
+        ], axis=1), axis=1)
+        robots = np.arange(num_robots)
+        is_reachable = self._reach_margins(
+            positions, max_speeds, sample_times) >= 0
+        can_reach = is_reachable.any(axis=1)
+        # earliest: between the last unreachable + first reachable sample
+        first = np.argmax(is_reachable, axis=1)
+        start = self._bisect(positions, max_speeds,
+                             sample_times[robots, np.maximum(first - 1, 0)],
+                             sample_times[robots, first], True)
+        start[first == 0] = 0
+        # latest: between the last reachable + next unreachable sample,
+        # or the end of the horizon if the robot can keep up until then
+        is_lost_after = ~is_reachable & \
+            (np.arange(sample_times.shape[1]) > first[:, np.newaxis])
+        has_end = is_lost_after.any(axis=1)
+        last = np.maximum(np.argmax(is_lost_after, axis=1), 1)
+        end = self._bisect(positions, max_speeds,
+                           sample_times[robots, last - 1],
+                           sample_times[robots, last], False)
+        end[~has_end] = horizon
+        earliest[can_reach] = start[can_reach]
+        latest[can_reach] = end[can_reach]
+        # robots too slow to catch it rolling can still meet it where it stops
+        if end_time is None or self.stop_time <= end_time:
+            distances = np.linalg.norm(positions - self.stop_position(), axis=1)
+            with np.errstate(divide='ignore', invalid='ignore'):
+                stop_meet_times = np.maximum(distances / max_speeds, horizon)
+            is_late = ~can_reach & np.isfinite(stop_meet_times)
+            earliest[is_late] = latest[is_late] = stop_meet_times[is_late]
+        return earliest, latest
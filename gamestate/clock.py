@@ -0,0 +1,45 @@
+import threading
+import time
+
+
+class WallClock(object):
+    """Real time - the default clock"""
+    def time(self):
+        return time.time()
+
+    def sleep(self, seconds):
+        time.sleep(seconds)
+
+
+class VirtualClock(object):
+    """Time that only moves when told to, e.g. by a log replay feeding in
+       recorded timestamps or a stepped simulator (so the game can run faster
+       than real time). Other threads still run whenever they get scheduled,
+       so this alone doesn't make runs repeatable (see simulator.headless)
+    """
+    def __init__(self, start_time=0.):
+        self._time = start_time
+        self._time_changed = threading.Condition()
+
+    def time(self):
+        return self._time
+
+    def set_time(self, timestamp):
+        with self._time_changed:
+            # (never go backwards, lost/stale checks assume time moves forward)
+            self._time = max(self._time, timestamp)
+            self._time_changed.notify_all()
+
+    def advance(self, delta_time):
+        with self._time_changed:
+            self._time += delta_time
+            self._time_changed.notify_all()
+
+    def sleep(self, seconds):
+        """Wait until the clock has moved forward by seconds. Also gives up
+        after that much real time, so nothing hangs if the clock stops (and
+        nothing runs slower than it would on the wall clock)."""
+        with self._time_changed:
+            wake_time = self._time + seconds
+            self._time_changed.wait_for(lambda: self._time >= wake_time,
+                                        seconds)
@@ -0,0 +1,156 @@
+'''Swept circle collision tests for the ball, solved exactly along its path
+   (so a fast ball can't skip through something between simulation steps)
+
+   Every function takes ball start positions (..., 2) and unit directions
+   (..., 2), and returns, per obstacle, the distance the ball rolls before it
+   first touches it (inf if it never does, or is already touching it) and
+   the unit normal pushing the ball away from the obstacle at that point.
+'''
+import numpy as np
+
+# (ignore glancing rays that are numerically parallel to the surface, so a
+# ball sliding along something doesn't keep hitting it)
+MIN_APPROACH = 1e-9
+# how far inside an obstacle a start position can be and still hit it
+# (a ball left exactly on a surface by the last collision)
+CONTACT_TOLERANCE = 1e-6
+
+
+def _circle_entry_distances(offsets, directions, radius):
+    """distance until points leaving offsets (relative to circle centers)
+    in directions enter the circles, and where the ray leaves again
+    (nan if the ray misses)"""
+    b = np.sum(offsets * directions, axis=-1)
+    c = np.sum(offsets ** 2, axis=-1) - radius ** 2
+    discriminant = b ** 2 - c
+    with np.errstate(invalid='ignore'):
+        root = np.sqrt(np.where(discriminant >= 0, discriminant, np.nan))
+    return -b - root, -b + root
+
+
+def robot_impacts(starts, directions, robot_positions, robot_radius,
+                  dribbler_radius, ball_radius):
+    """Ball paths against robots (..., N, 3), each a circle with its front
+    cut flat at dribbler_radius from the center (facing w).
+    Returns (..., N) distances, (..., N, 2) normals."""
+    starts = np.asarray(starts, dtype=float)[..., np.newaxis, :]
+    directions = np.asarray(directions, dtype=float)[..., np.newaxis, :]
+    robot_positions = np.asarray(robot_positions, dtype=float)
+    offsets = starts - robot_positions[..., :2]
+    w = robot_positions[..., 2]
+    headings = np.stack([np.cos(w), np.sin(w)], axis=-1)
+
+    # ball center touches the circle grown by the ball radius...
+    circle_in, circle_out = _circle_entry_distances(
+        offsets, directions, robot_radius + ball_radius
+    )
+    # ...but only behind the flat front (also grown by the ball radius)
+    flat_distance = dribbler_radius + ball_radius
+    front_offsets = np.sum(offsets * headings, axis=-1)
+    front_speeds = np.sum(directions * headings, axis=-1)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        flat_cross = (flat_distance - front_offsets) / front_speeds
+    # (moving parallel to the flat: always behind it or never)
+    is_behind = front_offsets <= flat_distance
+    parallel_in = np.where(is_behind, -np.inf, np.inf)
+    flat_in = np.where(front_speeds < 0, flat_cross,
+                       np.where(front_speeds > 0, -np.inf, parallel_in))
+    flat_out = np.where(front_speeds > 0, flat_cross,
+                        np.where(front_speeds < 0, np.inf, -parallel_in))
+
+    # (nan where the circle is missed, which makes every comparison False)
+    entry = np.maximum(circle_in, flat_in)
+    exit = np.minimum(circle_out, flat_out)
+    hits_flat = flat_in > circle_in
+    normals = np.where(
+        hits_flat[..., np.newaxis], headings,
+        (offsets + directions * circle_in[..., np.newaxis]) /
+        (robot_radius + ball_radius)
+    )
+    approach = np.sum(directions * normals, axis=-1)
+    is_hit = (entry <= exit) & (entry >= -CONTACT_TOLERANCE) & \
+        (approach < -MIN_APPROACH)
+    distances = np.where(is_hit, np.maximum(entry, 0), np.inf)
+    return distances, normals
+
+
+def segment_impacts(starts, directions, segments, ball_radius):
+    """Ball paths against wall segments (M, 2, 2) of (end1, end2).
+    Returns (..., M) distances, (..., M, 2) normals."""
+    starts = np.asarray(starts, dtype=float)[..., np.newaxis, :]
+    directions = np.asarray(directions, dtype=float)[..., np.newaxis, :]
+    segments = np.asarray(segments, dtype=float)
+    ends1, ends2 = segments[:, 0], segments[:, 1]
+    lengths = np.linalg.norm(ends2 - ends1, axis=-1)
+    tangents = (ends2 - ends1) / lengths[:, np.newaxis]
+    sides = np.stack([-tangents[:, 1], tangents[:, 0]], axis=-1)
+    offsets = starts - ends1
+
+    # flat sides of the segment (grown by the ball radius), whichever side
+    # the ball is on
+    side_offsets = np.sum(offsets * sides, axis=-1)
+    side_signs = np.where(side_offsets >= 0, 1., -1.)
+    side_speeds = np.sum(directions * sides, axis=-1) * side_signs
+    with np.errstate(divide='ignore', invalid='ignore'):
+        side_in = (np.abs(side_offsets) - ball_radius) / -side_speeds
+        along = np.sum((offsets + directions * side_in[..., np.newaxis]) *
+                       tangents, axis=-1)
+    is_side_hit = (side_speeds < -MIN_APPROACH) & \
+        (side_in >= -CONTACT_TOLERANCE) & (along >= 0) & (along <= lengths)
+    side_in = np.where(is_side_hit, np.maximum(side_in, 0), np.inf)
+    side_normals = sides * side_signs[..., np.newaxis]
+
+    # rounded ends
+    distances, normals = side_in, side_normals
+    for ends in (ends1, ends2):
+        end_offsets = starts - ends
+        end_in, _ = _circle_entry_distances(end_offsets, directions,
+                                            ball_radius)
+        end_normals = (end_offsets + directions * end_in[..., np.newaxis]) / \
+            ball_radius
+        approach = np.sum(directions * end_normals, axis=-1)
+        is_end_hit = (end_in >= -CONTACT_TOLERANCE) & \
+            (approach < -MIN_APPROACH)
+        end_in = np.where(is_end_hit, np.maximum(end_in, 0), np.inf)
+        is_closer = end_in < distances
+        distances = np.where(is_closer, end_in, distances)
+        normals = np.where(is_closer[..., np.newaxis], end_normals, normals)
+    return distances, normals
+
+
+def ball_overlaps(ball_positions, robot_positions, robot_radius,
+                  dribbler_radius, ball_radius):
+    """How far to move balls (..., 2) to stop them overlapping each robot
+    (..., N, 3), like Analysis.robot_ball_overlap for many robots at once.
+    Returns (..., N, 2) overlaps, and (..., N) whether the ball is in front
+    of the robot's flat front."""
+    ball_positions = np.asarray(ball_positions, dtype=float)
+    robot_positions = np.asarray(robot_positions, dtype=float)
+    delta = ball_positions[..., np.newaxis, :] - robot_positions[..., :2]
+    distance = np.linalg.norm(delta, axis=-1)
+    w = robot_positions[..., 2]
+    headings = np.stack([np.cos(w), np.sin(w)], axis=-1)
+    dw = np.arctan2(delta[..., 1], delta[..., 0]) - w
+    is_front = np.cos(dw) * robot_radius > dribbler_radius
+    # flat front: overlap straight out of the front
+    front_overlap = np.maximum(
+        dribbler_radius + ball_radius - distance * np.cos(dw), 0
+    )
+    # elsewhere: overlap of circles
+    radius_sum = robot_radius + ball_radius
+    circle_scale = np.zeros_like(distance)
+    is_touching = (distance > 0) & (distance <= radius_sum)
+    circle_scale[is_touching] = radius_sum / distance[is_touching] - 1
+    overlaps = np.where(is_front[..., np.newaxis],
+                        headings * front_overlap[..., np.newaxis],
+                        delta * circle_scale[..., np.newaxis])
+    return overlaps, is_front
+
+
+def bounce(velocities, normals, restitution):
+    """velocity after hitting a surface: the part along the surface is kept,
+    the part into it is reversed and scaled by restitution (0 = the ball
+    just slides along the surface)"""
+    into = np.sum(velocities * normals, axis=-1)
+    into = np.minimum(into, 0)[..., np.newaxis]
+    return velocities - (1 + restitution) * into * normals
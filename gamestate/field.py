@@ -17,6 +17,9 @@ class Field(object):
     GOAL_WIDTH = 1000 * FIELD_SCALE
     DEFENSE_AREA_X_LENGTH = 1000 * FIELD_SCALE
     DEFENSE_AREA_Y_LENGTH = 2000 * FIELD_SCALE
+    # walls around the field, this far outside the field lines
+    WALL_MARGIN = 300 * FIELD_SCALE
+    GOAL_DEPTH = 180 * FIELD_SCALE
 
     # returns bottom left corner of defense area
     def defense_area_corner(self, team):
@@ -64,6 +67,22 @@ class Field(object):
             return (np.array([self.FIELD_MAX_X, self.GOAL_WIDTH/2]),
                     np.array([self.FIELD_MAX_X, -self.GOAL_WIDTH/2]))
 
+    # returns M x 2 x 2 array of the (end1, end2) of every wall segment
+    # (field walls + the sides and back of each goal)
+    def wall_segments(self):
+        max_x = self.FIELD_MAX_X + self.WALL_MARGIN
+        max_y = self.FIELD_MAX_Y + self.WALL_MARGIN
+        corners = [(-max_x, -max_y), (max_x, -max_y),
+                   (max_x, max_y), (-max_x, max_y)]
+        segments = [(corners[i], corners[(i + 1) % 4]) for i in range(4)]
+        goal_y = self.GOAL_WIDTH / 2
+        for goal_x in (self.FIELD_MIN_X, self.FIELD_MAX_X):
+            back_x = goal_x + np.sign(goal_x) * self.GOAL_DEPTH
+            segments.append(((goal_x, goal_y), (back_x, goal_y)))
+            segments.append(((goal_x, -goal_y), (back_x, -goal_y)))
+            segments.append(((back_x, -goal_y), (back_x, goal_y)))
+        return np.array(segments, dtype=float)
+
     def get_attack_goal(self, team):
         if team == 'yellow':
             return self.get_defense_goal('blue')
@@ -1,7 +1,6 @@
 import time
 import threading
 import numpy as np
-from collections import deque
 # import RobotCommands from the comms folder
 # (expected to run from root directory, use try/except if run from here)
 from comms import RobotCommands
@@ -11,9 +10,15 @@ from comms import RobotCommands
 try:
     from field import Field
     from analysis import Analysis
+    from history import PositionHistory
+    from snapshot import WorldSnapshot
+    from clock import WallClock
 except (SystemError, ImportError):
     from .field import Field
     from .analysis import Analysis
+    from .history import PositionHistory
+    from .snapshot import WorldSnapshot
+    from .clock import WallClock
 
 # RAW DATA PROCESSING CONSTANTS
 BALL_POS_HISTORY_LENGTH = 100
@@ -23,6 +28,8 @@ ROBOT_POS_HISTORY_LENGTH = 20
 ROBOT_LOST_TIME = .2
 # time after which lost robot is deleted from the gamestate
 ROBOT_REMOVE_TIME = 5
+# robot velocity (without a filtered estimate) is measured over this long
+ROBOT_VELOCITY_INTERVAL = .05
 
 
 class GameState(Field, Analysis):
@@ -31,10 +38,13 @@ class GameState(Field, Analysis):
        Since using python, data types are specified in the comments below.
        Fundamental physics and game rules functions are available from gamestate.
     """
-    def __init__(self):
+    def __init__(self, clock=None):
         # NOTE: Fields starting with _underscore are "private" so
         # should be accessed through getter and setter methods
 
+        # source of the current time for all game data (see clock module)
+        self.clock = WallClock() if clock is None else clock
+
         # Thread keeps track of game status/events
         self._is_playing = False
         self._game_thread = None
@@ -42,12 +52,17 @@ class GameState(Field, Analysis):
         self._last_step_time = None
 
         # RAW POSITION DATA (updated by vision data or simulator)
-        # [most recent data is stored at the front of the queue]
-        # queue of (time, pos) where positions are in the form np.array([x, y])
-        self._ball_position = deque([], BALL_POS_HISTORY_LENGTH)
+        # [most recent data is stored at the END of the history]
+        # history of (time, pos) where positions are in the form np.array([x, y])
+        self._ball_position = PositionHistory(BALL_POS_HISTORY_LENGTH, 2)
         # robot positions are np.array([x, y, w]) where w = rotation
-        self._blue_robot_positions = dict()  # Robot ID: queue of (time, pos)
-        self._yellow_robot_positions = dict()  # Robot ID: queue of (time, pos)
+        self._blue_robot_positions = dict()  # Robot ID: history of (time, pos)
+        self._yellow_robot_positions = dict()  # Robot ID: history of (time, pos)
+        # FILTERED VELOCITIES (from vision filters, if they are running)
+        # stored with the time of the position they go with, so they are
+        # only used while that position is the latest one
+        self._ball_velocity = None  # (time, np.array([vx, vy]))
+        self._robot_velocities = dict()  # (team, ID): (time, [vx, vy, vw])
 
         # Commands data (desired robot actions)
         self._blue_robot_commands = dict()  # Robot ID: commands object
@@ -71,6 +86,11 @@ class GameState(Field, Analysis):
         # Refbox - the latest message delivered from the refbox
         self.latest_refbox_message = None
 
+        # signalled whenever new vision data has been put into gamestate,
+        # so loops can run as soon as there is something new to act on
+        self._vision_update = threading.Condition()
+        self._vision_update_count = 0
+
     def start_game(self, loop_sleep):
         self._game_loop_sleep = loop_sleep
         self._is_playing = True
@@ -91,52 +111,74 @@ class GameState(Field, Analysis):
         while self._is_playing:
             delta_time = 0
             if self._last_step_time is not None:
-                delta_time = time.time() - self._last_step_time
+                delta_time = self.clock.time() - self._last_step_time
                 if delta_time > self._game_loop_sleep * 3:
                     print("Game loop large delay: " + str(delta_time))
-            self._last_step_time = time.time()
+            self._last_step_time = self.clock.time()
 
             self.game_clock += delta_time
 
             # yield to other threads
-            time.sleep(self._game_loop_sleep)
+            self.clock.sleep(self._game_loop_sleep)
 
     # GAME STATUS/EVENT FUNCTIONS
     def wait_until_game_begins(self):
         while self.game_clock is None:
             time.sleep(.01)
 
+    # tell anyone waiting that a new vision frame is in
+    def notify_vision_update(self):
+        with self._vision_update:
+            self._vision_update_count += 1
+            self._vision_update.notify_all()
+
+    # block until the next vision frame, returns False if it timed out
+    def wait_for_vision_update(self, timeout=None):
+        with self._vision_update:
+            count = self._vision_update_count
+            return self._vision_update.wait_for(
+                lambda: self._vision_update_count != count, timeout
+            )
+
     # RAW DATA GET/SET FUNCTIONS
     # returns position ball was last seen at, or (0, 0) if unseen
     def get_ball_position(self):
         if len(self._ball_position) == 0:
             # print("getting ball position but ball never seen?!?")
             return np.array([0, 0])
-        timestamp, pos = self._ball_position[0]
-        return pos
+        return self._ball_position.latest()
 
     def clear_ball_position(self):
-        self._ball_position = deque([], BALL_POS_HISTORY_LENGTH)
+        self._ball_position.clear()
 
-    def update_ball_position(self, pos, timestamp=None):
+    def update_ball_position(self, pos, timestamp=None, velocity=None):
         if timestamp is None:
-            timestamp = time.time()
+            timestamp = self.clock.time()
         assert(len(pos) == 2 and type(pos) == np.ndarray)
-        pos = pos.copy().astype(float)
-        self._ball_position.appendleft((timestamp, pos))
+        # (history copies the values into its own float array)
+        self._ball_position.append(timestamp, pos)
+        if velocity is not None:
+            self._ball_velocity = (timestamp, np.array(velocity, dtype=float))
+
+    # filtered velocity if vision provides one, otherwise from position data
+    def get_ball_velocity(self):
+        if self._ball_velocity is not None:
+            timestamp, velocity = self._ball_velocity
+            if timestamp == self.get_ball_last_update_time():
+                return velocity.copy()
+        return Analysis.get_ball_velocity(self)
 
     def get_ball_last_update_time(self):
         if len(self._ball_position) == 0:
             # print("getting ball update time but ball never seen?!?")
             return None
-        timestamp, pos = self._ball_position[0]
-        return timestamp
+        return self._ball_position.latest_time()
 
     def is_ball_lost(self):
         last_update_time = self.get_ball_last_update_time()
         if last_update_time is None:
             return True
-        return time.time() - last_update_time > BALL_LOST_TIME
+        return self.clock.time() - last_update_time > BALL_LOST_TIME
 
     def get_team_positions(self, team):
         if team == 'blue':
@@ -164,8 +206,7 @@ class GameState(Field, Analysis):
             # print("team: {}, id: {}".format(team, robot_id))
             # traceback.print_stack()
             return np.array([0, 0, 0])
-        timestamp, pos = robot_positions[robot_id][0]
-        return pos
+        return robot_positions[robot_id].latest()
 
     def get_robot_direction(self, team, robot_id):
         x, y, w = self.get_robot_position(team, robot_id)
@@ -183,29 +224,58 @@ class GameState(Field, Analysis):
                     all_robot_positions.append((key, robot_pos))
         return all_robot_positions
 
-    def update_robot_position(self, team, robot_id, pos):
+    def update_robot_position(self, team, robot_id, pos, timestamp=None,
+                              velocity=None):
         assert(len(pos) == 3 and type(pos) == np.ndarray)
-        pos = pos.copy().astype(float)
+        if timestamp is None:
+            timestamp = self.clock.time()
         robot_positions = self.get_team_positions(team)
         if robot_id not in robot_positions:
             # assert(len(robot_positions) <= 6)
-            robot_positions[robot_id] = deque([], ROBOT_POS_HISTORY_LENGTH)
-        robot_positions[robot_id].appendleft((time.time(), pos))
+            robot_positions[robot_id] = \
+                PositionHistory(ROBOT_POS_HISTORY_LENGTH, 3)
+        robot_positions[robot_id].append(timestamp, pos)
+        if velocity is not None:
+            self._robot_velocities[(team, robot_id)] = \
+                (timestamp, np.array(velocity, dtype=float))
+
+    # returns np.array([vx, vy, vw]) - filtered velocity if vision provides
+    # one, otherwise estimated from the last few positions
+    def get_robot_velocity(self, team, robot_id):
+        history = self.get_team_positions(team).get(robot_id)
+        if history is None or len(history) < 2:
+            return np.array([0., 0., 0.])
+        if (team, robot_id) in self._robot_velocities:
+            timestamp, velocity = self._robot_velocities[(team, robot_id)]
+            if timestamp == history.latest_time():
+                return velocity.copy()
+        times, positions = history.since(ROBOT_VELOCITY_INTERVAL)
+        if len(times) < 2:
+            times, positions = history.last(2)
+        delta_time = times[-1] - times[0]
+        if delta_time <= 0:
+            return np.array([0., 0., 0.])
+        delta_pos = positions[-1] - positions[0]
+        # (turning the short way around)
+        delta_pos[2] = np.arctan2(np.sin(delta_pos[2]), np.cos(delta_pos[2]))
+        return delta_pos / delta_time
 
     def remove_robot(self, team, robot_id):
         team_positions = self.get_team_positions(team)
         del team_positions[robot_id]
+        self._robot_velocities.pop((team, robot_id), None)
         team_commands = self.get_team_commands(team)
-        del team_commands[robot_id]
+        # (commands are only created once something asks for them)
+        team_commands.pop(robot_id, None)
 
     def get_robot_last_update_time(self, team, robot_id):
         robot_positions = self.get_team_positions(team)
         if robot_id not in robot_positions:
             # print("getting update time of robot never seen?!?")
             return None
-        timestamp, pos = robot_positions[robot_id][0]
+        timestamp = robot_positions[robot_id].latest_time()
         # remove lost robots after a while
-        if time.time() - timestamp > ROBOT_REMOVE_TIME:
+        if self.clock.time() - timestamp > ROBOT_REMOVE_TIME:
             self.remove_robot(team, robot_id)
         return timestamp
 
@@ -214,7 +284,38 @@ class GameState(Field, Analysis):
         last_update_time = self.get_robot_last_update_time(team, robot_id)
         if last_update_time is None:
             return True
-        return time.time() - last_update_time > ROBOT_LOST_TIME
+        return self.clock.time() - last_update_time > ROBOT_LOST_TIME
+
+    def snapshot(self):
+        """Returns a read-only copy of the current world (see WorldSnapshot)"""
+        now = self.clock.time()
+        robot_keys = []
+        for team in ['blue', 'yellow']:
+            # (copy the items since vision may add robots at any time)
+            for robot_id, history in list(self.get_team_positions(team).items()):
+                # remove lost robots after a while (as in is_robot_lost)
+                if now - history.latest_time() > ROBOT_REMOVE_TIME:
+                    self.remove_robot(team, robot_id)
+                    continue
+                robot_keys.append(((team, robot_id), history))
+        robot_positions = np.zeros((len(robot_keys), 3))
+        robot_velocities = np.zeros((len(robot_keys), 3))
+        is_lost = np.zeros(len(robot_keys), dtype=bool)
+        for i, (key, history) in enumerate(robot_keys):
+            robot_positions[i] = history.latest()
+            robot_velocities[i] = self.get_robot_velocity(*key)
+            is_lost[i] = now - history.latest_time() > ROBOT_LOST_TIME
+        return WorldSnapshot(
+            now,
+            [key for key, _ in robot_keys],
+            robot_positions,
+            robot_velocities,
+            is_lost,
+            self._ball_position.copy(),
+            self.get_ball_velocity(),
+            self.is_ball_lost(),
+            self.is_blue_defense_side_left,
+        )
 
     def get_team_commands(self, team):
         if team == 'blue':
@@ -233,6 +334,9 @@ class GameState(Field, Analysis):
         # in the future this could vary between teams/robots?
         return RobotCommands.ROBOT_MAX_SPEED
 
+    def robot_max_acceleration(self, team, robot_id):
+        return RobotCommands.ROBOT_MAX_ACCELERATION
+
     # returns a list of ((team, robot_id), commands) for iteration
     def get_all_robot_commands(self):
         all_robot_commands = []
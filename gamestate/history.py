@@ -0,0 +1,77 @@
+import numpy as np
+
+
+class PositionHistory(object):
+    """Fixed size history of timestamped positions, backed by numpy arrays.
+       Every sample is written twice (at i and i + capacity), so the most
+       recent n samples are always one contiguous slice. That way appending
+       never allocates and window queries return views instead of copies.
+       Windows are ordered oldest -> newest (most recent data is LAST).
+    """
+    def __init__(self, capacity, dimensions):
+        self._capacity = capacity
+        self._dimensions = dimensions
+        self._times = np.zeros(2 * capacity)
+        self._positions = np.zeros((2 * capacity, dimensions))
+        # index (mod capacity) that the next sample will be written to
+        self._next = 0
+        self._size = 0
+
+    def __len__(self):
+        return self._size
+
+    def append(self, timestamp, pos):
+        i = self._next
+        j = i + self._capacity
+        self._times[i] = self._times[j] = timestamp
+        self._positions[i] = self._positions[j] = pos
+        self._next = (i + 1) % self._capacity
+        self._size = min(self._size + 1, self._capacity)
+
+    def clear(self):
+        self._next = 0
+        self._size = 0
+
+    def copy(self):
+        history = PositionHistory(self._capacity, self._dimensions)
+        history._times[:] = self._times
+        history._positions[:] = self._positions
+        history._next = self._next
+        history._size = self._size
+        return history
+
+    # (exclusive) end of the contiguous slice holding the newest samples
+    def _end(self):
+        return self._next + self._capacity
+
+    def latest(self):
+        """returns (a copy of) the most recent position"""
+        assert(self._size > 0)
+        return self._positions[self._end() - 1].copy()
+
+    def latest_time(self):
+        assert(self._size > 0)
+        return self._times[self._end() - 1]
+
+    def last(self, n):
+        """returns read-only (times, positions) views of the n newest samples"""
+        n = min(n, self._size)
+        end = self._end()
+        times = self._times[end - n:end]
+        positions = self._positions[end - n:end]
+        times.flags.writeable = False
+        positions.flags.writeable = False
+        return times, positions
+
+    def all(self):
+        return self.last(self._size)
+
+    def since(self, duration):
+        """returns views of samples at most duration seconds older than the
+           newest one (assumes timestamps were appended in increasing order)
+        """
+        times, positions = self.all()
+        if self._size == 0:
+            return times, positions
+        start = np.searchsorted(times, times[-1] - duration, side='left')
+        return times[start:], positions[start:]
@@ -0,0 +1,159 @@
+import numpy as np
+
+try:
+    from field import Field
+    from analysis import Analysis
+    from spatial_index import RobotGrid
+except (SystemError, ImportError):
+    from .field import Field
+    from .analysis import Analysis
+    from .spatial_index import RobotGrid
+
+# robot grid cells fit the robot diameter plus the largest usual buffer,
+# so position checks only ever look at neighboring cells
+GRID_CELL_SIZE = Analysis.ROBOT_RADIUS * 2 + 150
+
+
+class WorldSnapshot(Field, Analysis):
+    """Read-only copy of the world at a single moment, taken from gamestate.
+       Loops that read the world many times per tick (strategy, visualizer)
+       should take one snapshot per tick, so every read in that tick agrees
+       and no time is spent rebuilding lists from the live dicts.
+       Supports the same read functions as gamestate (and all of the shared
+       field + analysis functions), but none of the setters.
+    """
+    def __init__(self, timestamp, robot_keys, robot_positions,
+                 robot_velocities, is_lost, ball_history, ball_velocity,
+                 is_ball_lost,
+                 is_blue_defense_side_left):
+        self.timestamp = timestamp
+        self.is_blue_defense_side_left = is_blue_defense_side_left
+        # robots are stored in parallel arrays, one row per robot
+        self.robot_keys = tuple(robot_keys)  # (team, robot_id) of each row
+        self.robot_ids = np.array([robot_id for _, robot_id in robot_keys],
+                                  dtype=int)
+        self.is_blue = np.array([team == 'blue' for team, _ in robot_keys],
+                                dtype=bool)
+        self.robot_positions = robot_positions  # N x 3 array of (x, y, w)
+        self.robot_velocities = robot_velocities  # N x 3 array of (vx, vy, vw)
+        self.is_lost = is_lost
+        # ball (history is kept so dribbling checks still work)
+        self._ball_position = ball_history
+        self.ball_lost = is_ball_lost
+        if len(ball_history) == 0:
+            self.ball_position = np.array([0., 0.])
+            self.ball_last_update_time = None
+        else:
+            self.ball_position = ball_history.latest()
+            self.ball_last_update_time = ball_history.latest_time()
+        self.ball_velocity = np.array(ball_velocity, dtype=float)
+        for array in (self.robot_ids, self.is_blue, self.robot_positions,
+                      self.robot_velocities, self.is_lost, self.ball_position, self.ball_velocity):
+            array.flags.writeable = False
+        # ball trajectory model (built on first use)
+        self._ball_trajectory = None
+        # (team, robot_id) : row
+        self._index = {key: i for i, key in enumerate(self.robot_keys)}
+        # spatial index over robot positions (built on first use)
+        self._robot_grid = None
+        # (team, robot_id) : positions of all other robots (built on first use)
+        self._robot_obstacles = dict()
+
+    def __len__(self):
+        return len(self.robot_keys)
+
+    def robot_index(self, team, robot_id):
+        """row of the given robot in the robot arrays, or None if unseen"""
+        return self._index.get((team, robot_id))
+
+    def robot_grid(self):
+        if self._robot_grid is None:
+            self._robot_grid = RobotGrid(self.robot_positions, GRID_CELL_SIZE)
+        return self._robot_grid
+
+    def team_mask(self, team):
+        assert(team in ['blue', 'yellow'])
+        return self.is_blue if team == 'blue' else ~self.is_blue
+
+    # SAME READ FUNCTIONS AS GAMESTATE
+    def get_ball_position(self):
+        return self.ball_position.copy()
+
+    def get_ball_velocity(self):
+        return self.ball_velocity.copy()
+
+    def get_ball_trajectory(self):
+        if self._ball_trajectory is None:
+            self._ball_trajectory = Analysis.get_ball_trajectory(self)
+        return self._ball_trajectory
+
+    def get_ball_last_update_time(self):
+        return self.ball_last_update_time
+
+    def is_ball_lost(self):
+        return self.ball_lost
+
+    def get_robot_ids(self, team):
+        return tuple(int(i) for i in self.robot_ids[self.team_mask(team)])
+
+    def is_goalie(self, team, robot_id):
+        return False
+
+    def get_robot_position(self, team, robot_id):
+        i = self.robot_index(team, robot_id)
+        if i is None:
+            # same as gamestate - avoid crashing for robots never seen
+            return np.array([0, 0, 0])
+        return self.robot_positions[i].copy()
+
+    def get_robot_velocity(self, team, robot_id):
+        i = self.robot_index(team, robot_id)
+        if i is None:
+            return np.array([0., 0., 0.])
+        return self.robot_velocities[i].copy()
+
+    def get_robot_direction(self, team, robot_id):
+        x, y, w = self.get_robot_position(team, robot_id)
+        direction = np.array([np.cos(w), np.sin(w)])
+        return direction / np.linalg.norm(direction)
+
+    # returns a list of ((team, robot_id), position) for iteration
+    def get_all_robot_positions(self):
+        return [(key, self.robot_positions[i].copy())
+                for i, key in enumerate(self.robot_keys)]
+
+    def is_robot_lost(self, team, robot_id):
+        i = self.robot_index(team, robot_id)
+        if i is None:
+            return True
+        return bool(self.is_lost[i])
+
+    # SPATIAL QUERIES (same as analysis functions, but using the grid)
+    # return whether robot can be in a location without colliding another robot
+    def is_position_open(self, pos, team, robot_id, buffer_dist=0):
+        radius = self.ROBOT_RADIUS * 2 + buffer_dist
+        exclude = self.robot_index(team, robot_id)
+        return self.robot_grid().is_free(pos, radius, exclude)
+
+    def are_positions_open(self, points, team, robot_id, buffer_dist=0):
+        radius = self.ROBOT_RADIUS * 2 + buffer_dist
+        exclude = self.robot_index(team, robot_id)
+        return self.robot_grid().are_free(points, radius, exclude)
+
+    def robot_obstacles(self, team, robot_id):
+        """N x 2 array of x, y of every robot except the given one"""
+        key = (team, robot_id)
+        if key not in self._robot_obstacles:
+            xy = self.robot_positions[:, :2]
+            i = self.robot_index(team, robot_id)
+            if i is not None:
+                xy = np.delete(xy, i, axis=0)
+            self._robot_obstacles[key] = xy
+        return self._robot_obstacles[key]
+
+    # return robot team and id occupying a current position, if any
+    def robot_at_position(self, pos):
+        rows = self.robot_grid().within(pos, self.ROBOT_RADIUS)
+        if not rows:
+            return None
+        return self.robot_keys[min(rows)]
@@ -0,0 +1,62 @@
+import numpy as np
+
+
+class RobotGrid(object):
+    """Uniform grid over robot positions, for fast "which robots are near
+       this point" queries. Built once per snapshot. Cells are at least as
+       wide as the usual query radius, so a query only looks at the 3 x 3
+       block of cells around it instead of every robot on the field.
+    """
+    def __init__(self, positions, cell_size):
+        self._xy = np.asarray(positions, dtype=float).reshape(-1, 3)[:, :2]
+        self._cell_size = cell_size
+        # (cell x, cell y) : list of robot rows in that cell
+        self._cells = dict()
+        cells = np.floor(self._xy / cell_size).astype(int)
+        for i, (cell_x, cell_y) in enumerate(cells.tolist()):
+            self._cells.setdefault((cell_x, cell_y), []).append(i)
+
+    def __len__(self):
+        return len(self._xy)
+
+    def _cell(self, pos):
+        return (int(np.floor(pos[0] / self._cell_size)),
+                int(np.floor(pos[1] / self._cell_size)))
+
+    def candidates(self, pos, radius):
+        """rows of all robots that could be within radius of pos"""
+        cell_x, cell_y = self._cell(pos)
+        reach = int(np.ceil(radius / self._cell_size))
+        rows = []
+        for dx in range(-reach, reach + 1):
+            for dy in range(-reach, reach + 1):
+                rows.extend(self._cells.get((cell_x + dx, cell_y + dy), ()))
+        return rows
+
+    def within(self, pos, radius, exclude=None):
+        """rows of robots whose center is closer than radius to pos"""
+        pos = np.asarray(pos[:2], dtype=float)
+        rows = [i for i in self.candidates(pos, radius) if i != exclude]
+        if not rows:
+            return []
+        delta = self._xy[rows] - pos
+        distances_squared = (delta * delta).sum(axis=1)
+        return [row for row, is_close in
+                zip(rows, distances_squared < radius ** 2) if is_close]
+
+    def is_free(self, pos, radius, exclude=None):
+        """whether no robot center (except row exclude) is within radius"""
+        return not self.within(pos, radius, exclude)
+
+    def are_free(self, points, radius, exclude=None):
+        """batched is_free: returns a bool for each row of points"""
+        points = np.asarray(points, dtype=float).reshape(-1, 2)
+        if len(self._xy) == 0:
+            return np.ones(len(points), dtype=bool)
+        # with at most a couple dozen robots, one dense distance check
+        # over every (point, robot) pair beats bucketing the points
+        delta = points[:, np.newaxis, :] - self._xy[np.newaxis, :, :]
+        is_close = (delta * delta).sum(axis=2) < radius ** 2
+        if exclude is not None:
+            is_close[:, exclude] = False
+        return ~is_close.any(axis=1)
@@ -6,13 +6,16 @@ import sys
 import signal
 import traceback
 
-from gamestate import GameState
+from gamestate import GameState, VirtualClock
 from vision import SSLVisionDataProvider
 from refbox import RefboxDataProvider
 from strategy import Strategy
 from visualization import Visualizer
-from comms import Comms
+from comms import Comms, RobotDynamics
 from simulator import Simulator
+from network import NetworkLoop
+from matchlog import MatchRecorder
+from matchlog.replay import LogReplayProvider
 
 # whether or not we are running with real field and robots
 IS_SIMULATION = True
@@ -23,10 +26,32 @@ HOME_TEAM = 'blue'
 AWAY_TEAM = 'yellow' if HOME_TEAM == 'blue' else 'blue'
 # which simulator initial setup to use (if simulating)
 SIMULATION_SETUP = 'full_teams'
+# run the simulation on a virtual clock as fast as possible (if simulating)
+# (not repeatable, see simulator.headless for that)
+SIMULATION_STEPPED = False
+# fixed length of each simulated physics step (s), and how many smaller
+# steps the ball takes in each one (for contacts with moving robots)
+SIMULATION_PHYSICS_STEP = .01
+SIMULATION_BALL_SUBSTEPS = 10
+# simulate robot acceleration limits + command latency (see RobotDynamics),
+# instead of robots instantly following commands
+SIMULATE_ROBOT_DYNAMICS = True
 # which strategies each team is running (see strategy module)
 HOME_STRATEGY = 'goalie_test'
 AWAY_STRATEGY = None
 
+# push each vision frame into gamestate as soon as it arrives, and run
+# strategy right after (instead of polling every loop sleep)
+VISION_EVENT_DRIVEN = True
+# receive vision + refbox packets on one asyncio loop (instead of threads)
+USE_NETWORK_LOOP = True
+# file to record all vision + refbox packets to (None to not record)
+MATCH_LOG_PATH = None
+# match log to play back instead of live vision + refbox (None for live)
+# (speed is times faster than real time, None for as fast as possible)
+REPLAY_LOG_PATH = None
+REPLAY_SPEED = 1
+
 # loop wait times for each thread - how much to sleep between loops
 VISION_LOOP_SLEEP = .02
 COMMS_SEND_LOOP_SLEEP = .1
@@ -40,12 +65,27 @@ if __name__ == '__main__':
     VERBOSE = False
 
     # initialize gamestate + all other modules
-    gamestate = GameState()
-    vision = SSLVisionDataProvider(gamestate)
-    refbox = RefboxDataProvider(gamestate)
+    is_replay = REPLAY_LOG_PATH is not None and not IS_SIMULATION
+    is_stepped = SIMULATION_STEPPED and IS_SIMULATION
+    # (replays run on the recorded times, and stepped simulations on their
+    # own steps, instead of the real time)
+    use_virtual_clock = is_replay or is_stepped
+    gamestate = GameState(VirtualClock() if use_virtual_clock else None)
+    network = NetworkLoop()
+    recorder = None
+    if MATCH_LOG_PATH is not None and not IS_SIMULATION and not is_replay:
+        recorder = MatchRecorder(MATCH_LOG_PATH)
+        recorder.start_recording()
+    vision = SSLVisionDataProvider(gamestate, recorder=recorder)
+    refbox = RefboxDataProvider(gamestate, recorder=recorder)
+    replay = None
+    if is_replay:
+        replay = LogReplayProvider(gamestate, REPLAY_LOG_PATH, REPLAY_SPEED)
     home_comms = Comms(gamestate, HOME_TEAM)
     away_comms = Comms(gamestate, AWAY_TEAM, True)
-    simulator = Simulator(gamestate)
+    simulator = Simulator(gamestate, SIMULATION_PHYSICS_STEP,
+                          SIMULATION_BALL_SUBSTEPS,
+                          RobotDynamics() if SIMULATE_ROBOT_DYNAMICS else None)
     home_strategy = Strategy(gamestate, HOME_TEAM)
     away_strategy = Strategy(gamestate, AWAY_TEAM)
 
@@ -53,10 +93,18 @@ if __name__ == '__main__':
     print('Spinning up Threads...')
     if IS_SIMULATION:
         # spin up simulator to replace actual vision data + comms
-        simulator.start_simulating(SIMULATION_SETUP, SIMULATION_LOOP_SLEEP)
+        simulator.start_simulating(SIMULATION_SETUP, SIMULATION_LOOP_SLEEP,
+                                   is_stepped)
+    elif is_replay:
+        # play back recorded vision + refbox data
+        replay.start_updating()
     else:
         # spin up ssl-vision data polling to update gamestate
-        vision.start_updating(VISION_LOOP_SLEEP)
+        if USE_NETWORK_LOOP:
+            network.start()
+        network_loop = network if USE_NETWORK_LOOP else None
+        vision.start_updating(VISION_LOOP_SLEEP, VISION_EVENT_DRIVEN,
+                              network_loop)
         if not VISION_ONLY:
             # spin up comms to send commands to robots
             home_comms.start_sending(COMMS_SEND_LOOP_SLEEP)
@@ -64,13 +112,18 @@ if __name__ == '__main__':
             if CONTROL_BOTH_TEAMS:
                 away_comms.start_sending(COMMS_SEND_LOOP_SLEEP)
                 # away_comms.start_sending(COMMS_RECEIVE_LOOP_SLEEP)
-        refbox.start_updating()
+        refbox.start_updating(network_loop)
     # spin up strategy threads to control the robots
-    home_strategy.start_controlling(HOME_STRATEGY, CONTROL_LOOP_SLEEP)
+    wait_for_vision = VISION_EVENT_DRIVEN and not IS_SIMULATION
+    home_strategy.start_controlling(HOME_STRATEGY, CONTROL_LOOP_SLEEP,
+                                    wait_for_vision)
     if CONTROL_BOTH_TEAMS:
-        away_strategy.start_controlling(AWAY_STRATEGY, CONTROL_LOOP_SLEEP)
+        away_strategy.start_controlling(AWAY_STRATEGY, CONTROL_LOOP_SLEEP,
+                                        wait_for_vision)
     # initialize visualizer to show robots on screen
-    visualizer = Visualizer(gamestate, home_strategy, away_strategy)
+    # (drawing simulated robots in between physics steps)
+    visualizer = Visualizer(gamestate, home_strategy, away_strategy,
+                            simulator if IS_SIMULATION else None)
     # start the game  - now everything should be going
     gamestate.start_game(GAME_LOOP_SLEEP)
 
@@ -87,6 +140,11 @@ if __name__ == '__main__':
         # clean up all threads
         vision.stop_updating()
         refbox.stop_updating()
+        if replay is not None:
+            replay.stop_updating()
+        network.stop()
+        if recorder is not None:
+            recorder.stop_recording()
         home_comms.stop_sending_and_receiving()
         away_comms.stop_sending_and_receiving()
         simulator.stop_simulating()
@@ -100,5 +158,11 @@ if __name__ == '__main__':
     print('Running! Ctrl-c repeatedly to quit (C-c-k on eshell?!)')
 
     # (visualizer runs on main thread to work on all platforms)
-    visualizer.visualization_loop(VISUALIZATION_LOOP_SLEEP)
+    try:
+        visualizer.visualization_loop(VISUALIZATION_LOOP_SLEEP)
+    finally:
+        # the recorder's writer thread isn't a daemon (so the log is always
+        # finished), stop it however the visualizer exits
+        if recorder is not None:
+            recorder.stop_recording()
     traceback.print_stack()
@@ -0,0 +1,5 @@
+from .log_format import VISION, REFBOX
+from .recorder import MatchRecorder
+from .reader import MatchLogReader
+# (LogReplayProvider is in matchlog.replay, not imported here since it
+# uses the data providers, which import this package)
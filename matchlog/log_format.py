@@ -0,0 +1,33 @@
+'''Binary match log layout, shared by the recorder and reader
+
+    header: MAGIC, version
+    chunks: CHUNK_MAGIC, number of records, payload size, then records:
+        timestamp (receive time), source, data size, raw packet bytes
+    index (written when recording stops, for seeking):
+        INDEX_MAGIC, number of chunks, then for each chunk:
+        file offset, first + last timestamp, number of records
+    trailer: file offset of the index, END_MAGIC
+
+Everything is little endian. A log cut off mid match (no index) can still
+be read by walking the chunks from the start.
+'''
+import struct
+
+MAGIC = b'SSLMLOG\x00'
+VERSION = 1
+HEADER = struct.Struct('<8sI')
+
+CHUNK_MAGIC = b'CHNK'
+CHUNK_HEADER = struct.Struct('<4sII')
+RECORD_HEADER = struct.Struct('<dBI')
+
+INDEX_MAGIC = b'INDX'
+INDEX_HEADER = struct.Struct('<4sI')
+INDEX_ENTRY = struct.Struct('<QddI')
+
+END_MAGIC = b'END!'
+TRAILER = struct.Struct('<Q4s')
+
+# sources of recorded packets
+VISION = 0
+REFBOX = 1
@@ -0,0 +1,113 @@
+'''Reads packets back out of a binary match log'''
+try:
+    import log_format as fmt
+except (SystemError, ImportError):
+    from . import log_format as fmt
+
+
+class MatchLogReader(object):
+    """Reads (timestamp, source, raw packet bytes) records from a match log,
+       in the order they were recorded. Uses the index to jump straight to
+       a start time, or walks the chunks if the log has no index (e.g. the
+       recording was cut off).
+    """
+    def __init__(self, path):
+        self._file = open(path, 'rb')
+        magic, version = fmt.HEADER.unpack(self._file.read(fmt.HEADER.size))
+        if magic != fmt.MAGIC:
+            raise ValueError('{} is not a match log'.format(path))
+        if version != fmt.VERSION:
+            raise ValueError('unsupported match log version {}'.format(version))
+        # (file offset, first timestamp, last timestamp, num records)
+        self._index = self._read_index()
+        if self._index is None:
+            self._index = self._scan_chunks()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def close(self):
+        self._file.close()
+
+    def __len__(self):
+        return sum(num_records for _, _, _, num_records in self._index)
+
+    def start_time(self):
+        return self._index[0][1] if self._index else None
+
+    def end_time(self):
+        return self._index[-1][2] if self._index else None
+
+    def _read_index(self):
+        self._file.seek(0, 2)
+        file_size = self._file.tell()
+        if file_size < fmt.HEADER.size + fmt.TRAILER.size:
+            return None
+        self._file.seek(file_size - fmt.TRAILER.size)
+        index_offset, end_magic = fmt.TRAILER.unpack(
+            self._file.read(fmt.TRAILER.size))
+        if end_magic != fmt.END_MAGIC:
+            return None
+        self._file.seek(index_offset)
+        index_magic, num_chunks = fmt.INDEX_HEADER.unpack(
+            self._file.read(fmt.INDEX_HEADER.size))
+        if index_magic != fmt.INDEX_MAGIC:
+            return None
+        data = self._file.read(fmt.INDEX_ENTRY.size * num_chunks)
+        return [fmt.INDEX_ENTRY.unpack_from(data, i * fmt.INDEX_ENTRY.size)
+                for i in range(num_chunks)]
+
+    def _scan_chunks(self):
+        index = []
+        offset = fmt.HEADER.size
+        while True:
+            self._file.seek(offset)
+            header = self._file.read(fmt.CHUNK_HEADER.size)
+            if len(header) < fmt.CHUNK_HEADER.size:
+                break
+            magic, num_records, payload_size = fmt.CHUNK_HEADER.unpack(header)
+            if magic != fmt.CHUNK_MAGIC:
+                break
+            payload = self._file.read(payload_size)
+            if len(payload) < payload_size:
+                # (last chunk was only partly written)
+                break
+            records = self._parse_chunk(payload)
+            index.append((offset, records[0][0], records[-1][0], num_records))
+            offset += fmt.CHUNK_HEADER.size + payload_size
+        return index
+
+    @staticmethod
+    def _parse_chunk(payload):
+        records = []
+        position = 0
+        while position < len(payload):
+            timestamp, source, size = fmt.RECORD_HEADER.unpack_from(payload, position)
+            position += fmt.RECORD_HEADER.size
+            records.append((timestamp, source, payload[position:position + size]))
+            position += size
+        return records
+
+    def records(self, start_time=None, sources=None):
+        """yields (timestamp, source, packet bytes) from start_time on,
+           only for the given sources (default all)"""
+        for offset, _, last_time, _ in self._index:
+            # skip whole chunks that end before the start time
+            if start_time is not None and last_time < start_time:
+                continue
+            self._file.seek(offset)
+            _, _, payload_size = fmt.CHUNK_HEADER.unpack(
+                self._file.read(fmt.CHUNK_HEADER.size))
+            for record in self._parse_chunk(self._file.read(payload_size)):
+                timestamp, source, _ = record
+                if start_time is not None and timestamp < start_time:
+                    continue
+                if sources is not None and source not in sources:
+                    continue
+                yield record
+
+    def __iter__(self):
+        return self.records()
@@ -0,0 +1,97 @@
+'''Records raw vision + refbox packets to a binary match log'''
+import queue
+import threading
+import time
+
+try:
+    import log_format as fmt
+except (SystemError, ImportError):
+    from . import log_format as fmt
+
+
+class MatchRecorder(object):
+    """Appends packets to a match log (see log_format) from any thread.
+       record() only puts the packet on a queue, a writer thread does the
+       serializing + disk writes, so receive loops are never held up.
+       Packets are written in chunks, each flushed once it is full or old
+       enough, so a crash loses at most about one chunk.
+    """
+    CHUNK_MAX_RECORDS = 256
+    CHUNK_MAX_TIME = 1  # seconds
+
+    def __init__(self, path):
+        self._path = path
+        self._queue = queue.Queue()
+        self._writer_thread = None
+        self._is_recording = False
+        # (file offset, first timestamp, last timestamp, num records)
+        self._index = []
+
+    def is_recording(self):
+        return self._is_recording
+
+    def start_recording(self):
+        self._is_recording = True
+        self._index = []
+        self._writer_thread = threading.Thread(target=self.write_loop)
+        # (not a daemon, so the log is finished even when exiting)
+        self._writer_thread.start()
+
+    def stop_recording(self):
+        if self._is_recording:
+            self._is_recording = False
+            # (None tells the writer to finish up)
+            self._queue.put(None)
+            self._writer_thread.join()
+            self._writer_thread = None
+
+    def record(self, source, packet, timestamp):
+        """Queue a packet (raw bytes, as received) to be written, with the
+        time it was received"""
+        if not self._is_recording:
+            return
+        self._queue.put((timestamp, source, packet))
+
+    def write_loop(self):
+        with open(self._path, 'wb') as log_file:
+            log_file.write(fmt.HEADER.pack(fmt.MAGIC, fmt.VERSION))
+            records = []
+            chunk_start_time = None
+            is_done = False
+            while not is_done:
+                try:
+                    item = self._queue.get(timeout=self.CHUNK_MAX_TIME)
+                except queue.Empty:
+                    item = ()
+                if item is None:
+                    is_done = True
+                elif item:
+                    if not records:
+                        chunk_start_time = time.time()
+                    records.append(item)
+                if records and (is_done or
+                                len(records) >= self.CHUNK_MAX_RECORDS or
+                                time.time() - chunk_start_time > self.CHUNK_MAX_TIME):
+                    self._write_chunk(log_file, records)
+                    records = []
+            self._write_index(log_file)
+
+    def _write_chunk(self, log_file, records):
+        parts = []
+        for timestamp, source, packet in records:
+            parts.append(fmt.RECORD_HEADER.pack(timestamp, source, len(packet)))
+            parts.append(packet)
+        payload = b''.join(parts)
+        self._index.append((log_file.tell(), records[0][0], records[-1][0],
+                            len(records)))
+        log_file.write(fmt.CHUNK_HEADER.pack(fmt.CHUNK_MAGIC, len(records),
+                                             len(payload)))
+        log_file.write(payload)
+        log_file.flush()
+
+    def _write_index(self, log_file):
+        index_offset = log_file.tell()
+        log_file.write(fmt.INDEX_HEADER.pack(fmt.INDEX_MAGIC, len(self._index)))
+        for entry in self._index:
+            log_file.write(fmt.INDEX_ENTRY.pack(*entry))
+        log_file.write(fmt.TRAILER.pack(index_offset, fmt.END_MAGIC))
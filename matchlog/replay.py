@@ -0,0 +1,88 @@
+'''Plays a recorded match log back into gamestate, as if it were live'''
+import threading
+import time
+
+import sslclient
+from vision import SSLVisionDataProvider
+from refbox import RefboxDataProvider, SSL_Referee
+
+try:
+    import log_format as fmt
+    from reader import MatchLogReader
+except (SystemError, ImportError):
+    from . import log_format as fmt
+    from .reader import MatchLogReader
+
+
+class LogReplayProvider(object):
+    """Drop-in replacement for the vision + refbox data providers, reading
+       packets from a match log instead of the network.
+       Gamestate must run on a VirtualClock: before each packet is handled
+       the clock is set to when that packet was received, so everything
+       (filters, lost robot checks, etc.) sees the same times as live.
+       speed is how many times faster than real time to play (1 = real
+       time), or None to go as fast as possible. Packets are always handled
+       one at a time in recorded order, so the data reaching gamestate is
+       the same every run.
+    """
+    def __init__(self, gamestate, path, speed=1, start_time=None):
+        assert(hasattr(gamestate.clock, 'set_time'))
+        self._gamestate = gamestate
+        self._path = path
+        self._speed = speed
+        self._start_time = start_time
+        self._is_running = False
+        self._replay_thread = None
+        self._is_done = threading.Event()
+        # the live providers do the actual processing of each packet
+        self._vision = SSLVisionDataProvider(gamestate, is_event_driven=True)
+        self._refbox = RefboxDataProvider(gamestate)
+
+    def start_updating(self, loop_sleep=None):
+        """Starts replaying the log (loop_sleep is unused, packets are
+        handled whenever they were received in the recording)"""
+        self._is_running = True
+        self._is_done.clear()
+        self._replay_thread = threading.Thread(target=self.replay_loop)
+        # set to daemon mode so it will be easily killed
+        self._replay_thread.daemon = True
+        self._replay_thread.start()
+
+    def stop_updating(self):
+        if self._is_running:
+            self._is_running = False
+            self._replay_thread.join()
+            self._replay_thread = None
+
+    def is_done(self):
+        return self._is_done.is_set()
+
+    def wait_until_done(self, timeout=None):
+        return self._is_done.wait(timeout)
+
+    def replay_loop(self):
+        decoders = {
+            fmt.VISION: (sslclient.messages_robocup_ssl_wrapper_pb2.SSL_WrapperPacket.FromString,
+                         self._vision.handle_packet),
+            fmt.REFBOX: (SSL_Referee.FromString, self._refbox.handle_packet),
+        }
+        clock = self._gamestate.clock
+        with MatchLogReader(self._path) as reader:
+            first_timestamp = None
+            replay_start_time = time.time()
+            for timestamp, source, packet in reader.records(self._start_time):
+                if not self._is_running:
+                    break
+                if first_timestamp is None:
+                    first_timestamp = timestamp
+                # wait until it is time (in real time) for this packet
+                if self._speed is not None:
+                    delay = replay_start_time - time.time() + \
+                        (timestamp - first_timestamp) / self._speed
+                    if delay > 0:
+                        time.sleep(delay)
+                clock.set_time(timestamp)
+                if source in decoders:
+                    decode, handle_packet = decoders[source]
+                    handle_packet(decode(packet))
+        self._is_done.set()
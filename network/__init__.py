@@ -0,0 +1 @@
+from .udp import NetworkLoop, udp_socket
@@ -0,0 +1,125 @@
+'''Asyncio UDP receivers (ssl-vision, refbox), all on one event loop'''
+import asyncio
+import socket
+import struct
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from ipaddress import ip_address
+
+
+def udp_socket(host, port, interface='0.0.0.0'):
+    """Non-blocking UDP socket listening on host:port. Multicast groups
+       (like ssl-vision's 224.5.23.2) are joined, any other host is bound
+       directly - e.g. 127.0.0.1 to listen to a local stand-in sender."""
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM, socket.IPPROTO_UDP)
+    # (lets other programs on this computer listen to the same feed)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    if ip_address(host).is_multicast:
+        sock.bind(('', port))
+        membership = struct.pack('=4s4s', socket.inet_aton(host),
+                                 socket.inet_aton(interface))
+        sock.setsockopt(socket.IPPROTO_IP, socket.IP_ADD_MEMBERSHIP, membership)
+    else:
+        sock.bind((host, port))
+    sock.setblocking(False)
+    return sock
+
+
+class DecodingProtocol(asyncio.DatagramProtocol):
+    """Hands each datagram to the decoder thread, then passes the decoded
+       message to callback (back on the event loop thread).
+       on_receive (optional) gets the raw bytes + receive time first."""
+    def __init__(self, loop, executor, decode, callback, on_receive=None):
+        self._loop = loop
+        self._executor = executor
+        self._decode = decode
+        self._callback = callback
+        self._on_receive = on_receive
+
+    def datagram_received(self, data, addr):
+        if self._on_receive is not None:
+            self._on_receive(data, time.time())
+        future = self._loop.run_in_executor(self._executor, self._decode, data)
+        future.add_done_callback(self._deliver)
+
+    def _deliver(self, future):
+        if future.cancelled():
+            return
+        try:
+            message = future.result()
+        except Exception as e:
+            print("Dropping UDP packet that failed to decode: {}".format(e))
+            return
+        try:
+            self._callback(message)
+        except Exception as e:
+            print("Error handling UDP packet: {}".format(e))
+
+    def error_received(self, exc):
+        print("UDP receive error: {}".format(exc))
+
+
+class NetworkLoop(object):
+    """One thread running an asyncio event loop that listens to every UDP
+       feed, instead of a blocking receive thread (+ polling thread) per
+       feed. Protobuf decoding happens on a separate worker thread, so the
+       loop is always free to pick up the next packet.
+    """
+    def __init__(self):
+        self._loop = None
+        self._thread = None
+        self._executor = None
+        self._transports = []
+
+    def is_running(self):
+        return self._thread is not None
+
+    def start(self):
+        if self.is_running():
+            return
+        self._loop = asyncio.new_event_loop()
+        # (a single decoder keeps packets in the order they arrived)
+        self._executor = ThreadPoolExecutor(max_workers=1)
+        self._thread = threading.Thread(target=self._run)
+        # set to daemon mode so it will be easily killed
+        self._thread.daemon = True
+        self._thread.start()
+
+    def _run(self):
+        asyncio.set_event_loop(self._loop)
+        self._loop.run_forever()
+
+    def add_receiver(self, host, port, decode, callback, on_receive=None):
+        """Listen to host:port, calling callback(decode(data)) for every
+           packet, and on_receive(data, receive time) before decoding it if
+           given (e.g. to record raw packets). Callbacks run on the network
+           thread, so keep them short. Returns once the socket is open."""
+        assert(self.is_running())
+        future = asyncio.run_coroutine_threadsafe(
+            self._open_endpoint(host, port, decode, callback, on_receive),
+            self._loop
+        )
+        future.result()
+
+    async def _open_endpoint(self, host, port, decode, callback, on_receive):
+        transport, _ = await self._loop.create_datagram_endpoint(
+            lambda: DecodingProtocol(self._loop, self._executor, decode,
+                                     callback, on_receive),
+            sock=udp_socket(host, port)
+        )
+        self._transports.append(transport)
+
+    def stop(self):
+        if not self.is_running():
+            return
+        for transport in self._transports:
+            self._loop.call_soon_threadsafe(transport.close)
+        self._transports = []
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+        self._thread = None
+        self._executor.shutdown(wait=False)
+        self._executor = None
+        self._loop.close()
+        self._loop = None
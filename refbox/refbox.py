@@ -3,9 +3,11 @@ from struct import pack
 import binascii
 from ipaddress import ip_address
 import threading
+import time
 
 # from referee_pb2 import SSL_Referee_Game_Event
 from .referee_pb2 import SSL_Referee
+from matchlog import REFBOX
 
 class RefboxClient:
     
@@ -26,9 +28,14 @@ class RefboxClient:
         self.sock.setsockopt(socket.IPPROTO_IP, socket.IP_ADD_MEMBERSHIP, pack("=4sl", socket.inet_aton(self.ip), socket.INADDR_ANY))
         self.sock.bind((self.ip, self.port))
 
+    def receive_raw(self):
+        """Receive package, returns (raw bytes, time it was received)."""
+        data, _ = self.sock.recvfrom(1024)
+        return data, time.time()
+
     def receive(self):
         """Receive package and decode."""
-        data, _ = self.sock.recvfrom(1024)
+        data, _ = self.receive_raw()
         decoded_data = SSL_Referee.FromString(data)
         return decoded_data
 
@@ -37,20 +44,27 @@ class RefboxClient:
             self.sock.close()
 
 class RefboxDataProvider:
-    def __init__(self, gamestate, ip = '224.5.23.1', port=10003):
+    def __init__(self, gamestate, ip = '224.5.23.1', port=10003, recorder=None):
         self._is_running = False
+        # (optional) MatchRecorder to save every received packet to
+        self._recorder = recorder
         self._client = None
         self._receive_data_thread = None
-        self._update_gamestate_thread = None
         self._gamestate = gamestate
         self._ip = ip
         self._port = port
         self._latest_packet = None
 
-    def start_updating(self):
+    def start_updating(self, network=None):
+        """Starts listening to the refbox, putting each message in gamestate
+        (on a NetworkLoop if given one, otherwise on a thread of our own)"""
         if self._is_running:
             raise Exception('RefboxDataProvider is always running')
         self._is_running = True
+        if network is not None:
+            network.add_receiver(self._ip, self._port, SSL_Referee.FromString,
+                                 self.handle_packet, self.record_packet)
+            return
         # Connect to client
         self._client = RefboxClient(self._ip, self._port)
         self._client.connect()
@@ -60,12 +74,6 @@ class RefboxDataProvider:
         )
         self._receive_data_thread.daemon = True
         self._receive_data_thread.start()
-        # Update gamestate thread
-        self._update_gamestate_thread = threading.Thread(
-            target=self.gamestate_update_loop
-        )
-        self._update_gamestate_thread.daemon = True
-        self._update_gamestate_thread.start()
 
     def stop_updating(self):
         if self._client:
@@ -73,22 +81,24 @@ class RefboxDataProvider:
 
         if self._is_running:
             self._is_running = False
-            self._update_gamestate_thread.join()
-            self._update_gamestate_thread = None
-            self._receive_data_thread.join()
-            self._receive_data_thread = None
+            if self._receive_data_thread is not None:
+                self._receive_data_thread.join()
+                self._receive_data_thread = None
 
         self._latest_packet = None
-        
 
     def receive_data_loop(self):
+        # (receive blocks until a packet comes, so this never spins)
         while self._is_running:
-            self._latest_packet = self._client.receive()
-
-    def gamestate_update_loop(self):
-        # wait until game begins (while other threads are initializing)
-        self._gamestate.wait_until_game_begins()
-        while self._is_running:
-            self._gamestate.latest_refbox_message = self._latest_packet
-
-
+            data, receive_time = self._client.receive_raw()
+            self.record_packet(data, receive_time)
+            self.handle_packet(SSL_Referee.FromString(data))
+
+    def record_packet(self, data, receive_time):
+        """save a raw packet to the recorder (if there is one)"""
+        if self._recorder is not None:
+            self._recorder.record(REFBOX, data, receive_time)
+
+    def handle_packet(self, packet):
+        self._latest_packet = packet
+        self._gamestate.latest_refbox_message = packet
@@ -0,0 +1,307 @@
+'''Physics for many independent simulated worlds at once, as numpy arrays
+   (for scoring plays or tuning parameters over many rollouts)'''
+import numpy as np
+from gamestate import GameState
+from gamestate.gamestate import BALL_POS_HISTORY_LENGTH
+from gamestate.collisions import robot_impacts, segment_impacts, \
+    ball_overlaps, bounce
+from comms import RobotCommands
+try:
+    from simulator import Simulator
+except (SystemError, ImportError):
+    from .simulator import Simulator
+
+
+class BatchSimulator(object):
+    """The same physics as Simulator.step, for K worlds of up to N robots
+       each, stepped together with whole-array operations instead of one
+       robot at a time through gamestate. State is kept in public arrays:
+         robot_positions (K, N, 3) field (x, y, w)
+         robot_speeds (K, N, 3) commanded (x, y, w) from robot perspective
+         is_present, is_dribbling, is_charging, is_kicking (K, N) bools
+         charge_levels (K, N)
+         ball_positions, ball_velocities (K, 2)
+       Robot n is robot_keys[n] (team, robot_id) in every world.
+    """
+    ROBOT_RADIUS = GameState.ROBOT_RADIUS
+    ROBOT_DRIBBLER_RADIUS = GameState.ROBOT_DRIBBLER_RADIUS
+    BALL_RADIUS = GameState.BALL_RADIUS
+    BALL_DECCELERATION = GameState.BALL_DECCELERATION
+    BALL_WALL_RESTITUTION = GameState.BALL_WALL_RESTITUTION
+    MAX_BALL_BOUNCES = Simulator.MAX_BALL_BOUNCES
+    # same dribbling model as Simulator
+    DRIBBLE_CAPTURE_VELOCITY = 20
+    DRIBBLE_ZONE_RADIUS = 60
+    DRIBBLE_MAX_DIST = GameState.ROBOT_RADIUS + 32
+    # the ball must have been in the dribbler for every frame this recent
+    # (see GameState.ball_in_dribbler, which never uses its oldest frame)
+    DRIBBLE_HISTORY_TIME = 1
+    BALL_HISTORY_LENGTH = BALL_POS_HISTORY_LENGTH - 1
+
+    def __init__(self, num_worlds, robot_keys):
+        self.robot_keys = list(robot_keys)
+        K, N = num_worlds, len(self.robot_keys)
+        self.robot_positions = np.zeros((K, N, 3))
+        self.robot_speeds = np.zeros((K, N, 3))
+        self.is_present = np.ones((K, N), dtype=bool)
+        self.is_dribbling = np.zeros((K, N), dtype=bool)
+        self.is_charging = np.zeros((K, N), dtype=bool)
+        self.is_kicking = np.zeros((K, N), dtype=bool)
+        self.charge_levels = np.zeros((K, N))
+        self.ball_positions = np.zeros((K, 2))
+        self.ball_velocities = np.zeros((K, 2))
+        self.time = 0
+        # (for the field and overlap calculations shared with Simulator)
+        self._gamestate = GameState()
+        self._walls = self._gamestate.wall_segments()
+        # recent ball positions of every world, in a ring buffer shared by
+        # all worlds (each step adds one frame to all of them)
+        self._ball_history = np.zeros((K, self.BALL_HISTORY_LENGTH, 2))
+        self._ball_history_times = np.full(self.BALL_HISTORY_LENGTH, -np.inf)
+        self._ball_history_index = 0
+        # time each world's ball history was last restarted from (like
+        # Simulator.put_fake_ball, for bounces, captures and kicks)
+        self._ball_reset_times = np.zeros(K)
+        self._record_balls(self.time, np.ones(K, dtype=bool))
+
+    @classmethod
+    def from_gamestate(cls, gamestate, num_worlds):
+        """K copies of the world as it is in gamestate now, with every robot
+        following its current commands"""
+        world = gamestate.snapshot()
+        simulator = cls(num_worlds, world.robot_keys)
+        simulator.robot_positions[:] = world.robot_positions
+        for n, (team, robot_id) in enumerate(world.robot_keys):
+            # (robots without commands stay put, like in Simulator)
+            commands = gamestate.get_team_commands(team).get(robot_id)
+            if commands is None:
+                continue
+            simulator.robot_speeds[:, n] = commands.get_speeds()
+            simulator.is_dribbling[:, n] = commands.is_dribbling
+            simulator.is_charging[:, n] = commands.is_charging
+            simulator.is_kicking[:, n] = commands.is_kicking
+            simulator.charge_levels[:, n] = commands.charge_level
+        simulator.ball_positions[:] = world.get_ball_position()
+        simulator.ball_velocities[:] = world.get_ball_velocity()
+        # (ball history starts over from here)
+        simulator._replace_balls(np.arange(num_worlds), simulator.time)
+        return simulator
+
+    def step(self, delta_time):
+        """move every world forward by delta_time seconds"""
+        timestamp = self.time + delta_time
+        self._resolve_robot_overlaps()
+        is_bounced = self._move_balls(delta_time)
+        is_pushed = self._resolve_ball_collisions()
+        self._record_balls(timestamp, is_bounced | is_pushed)
+        # move robots according to commands
+        self.robot_positions = np.where(
+            self.is_present[:, :, np.newaxis],
+            RobotCommands.predict_poses(self.robot_positions,
+                                        self.robot_speeds, delta_time),
+            self.robot_positions
+        )
+        # charge capacitors according to commands
+        self.charge_levels = np.where(
+            self.is_charging,
+            np.minimum(self.charge_levels +
+                       delta_time * RobotCommands.CHARGE_RATE,
+                       RobotCommands.MAX_CHARGE_LEVEL),
+            self.charge_levels
+        )
+        self._dribble(delta_time, timestamp)
+        self._kick(timestamp)
+        self.time = timestamp
+
+    def _record_balls(self, timestamp, is_reset):
+        # add the current ball positions as the newest frame, restarting the
+        # history of is_reset worlds from it
+        i = self._ball_history_index
+        self._ball_history[:, i] = self.ball_positions
+        self._ball_history_times[i] = timestamp
+        self._ball_history_index = (i + 1) % self.BALL_HISTORY_LENGTH
+        self._ball_reset_times[is_reset] = timestamp
+
+    def _replace_balls(self, worlds, timestamp):
+        # overwrite the newest frame of some worlds after moving their balls,
+        # restarting their history from it
+        i = (self._ball_history_index - 1) % self.BALL_HISTORY_LENGTH
+        self._ball_history[worlds, i] = self.ball_positions[worlds]
+        self._ball_reset_times[worlds] = timestamp
+
+    def _move_balls(self, delta_time):
+        # roll with constant deceleration, finding exactly when each ball
+        # first touches a robot or wall on the way (see Simulator.move_ball)
+        K = len(self.ball_positions)
+        restitutions = np.concatenate([
+            np.zeros(len(self.robot_keys)),
+            np.full(len(self._walls), self.BALL_WALL_RESTITUTION)
+        ])
+        time_left = np.full(K, float(delta_time))
+        worlds = np.arange(K)
+        has_bounced = np.zeros(K, dtype=bool)
+        for _ in range(self.MAX_BALL_BOUNCES):
+            speeds = np.linalg.norm(self.ball_velocities, axis=1)
+            is_moving = speeds > 0
+            directions = np.zeros_like(self.ball_velocities)
+            directions[is_moving] = self.ball_velocities[is_moving] / \
+                speeds[is_moving, np.newaxis]
+            move_times = np.minimum(time_left,
+                                    speeds / self.BALL_DECCELERATION)
+            travel = speeds * move_times - \
+                .5 * self.BALL_DECCELERATION * move_times ** 2
+
+            robot_distances, robot_normals = robot_impacts(
+                self.ball_positions, directions, self.robot_positions,
+                self.ROBOT_RADIUS, self.ROBOT_DRIBBLER_RADIUS,
+                self.BALL_RADIUS
+            )
+            robot_distances[~self.is_present] = np.inf
+            wall_distances, wall_normals = segment_impacts(
+                self.ball_positions, directions, self._walls, self.BALL_RADIUS
+            )
+            distances = np.concatenate([robot_distances, wall_distances],
+                                       axis=1)
+            normals = np.concatenate([robot_normals, wall_normals], axis=1)
+            hits = np.argmin(distances, axis=1)
+            hit_distances = distances[worlds, hits]
+            is_hit = is_moving & (hit_distances <= travel)
+
+            # (time from distance = speed * t - deceleration * t^2 / 2)
+            discriminants = np.maximum(
+                speeds ** 2 - 2 * self.BALL_DECCELERATION *
+                np.where(is_hit, hit_distances, 0), 0
+            )
+            hit_times = (speeds - np.sqrt(discriminants)) / \
+                self.BALL_DECCELERATION
+            move_times = np.where(is_hit, hit_times, move_times)
+            self.ball_positions += directions * \
+                np.where(is_hit, hit_distances, travel)[:, np.newaxis]
+            new_speeds = speeds - self.BALL_DECCELERATION * move_times
+            self.ball_velocities = directions * new_speeds[:, np.newaxis]
+            self.ball_velocities[is_hit] = bounce(
+                self.ball_velocities[is_hit], normals[is_hit, hits[is_hit]],
+                restitutions[hits[is_hit]][:, np.newaxis]
+            )
+            time_left = np.where(is_hit, time_left - move_times, 0)
+            has_bounced |= is_hit
+            if not is_hit.any():
+                break
+        return has_bounced
+
+    def _resolve_robot_overlaps(self):
+        # push each overlapping pair apart equally (see resolve_robot_overlaps)
+        overlaps = self._gamestate.pairwise_overlaps(self.robot_positions,
+                                                     self.ROBOT_RADIUS * 2)
+        is_pair = self.is_present[:, :, np.newaxis] & \
+            self.is_present[:, np.newaxis, :]
+        overlaps[~is_pair] = 0
+        self.robot_positions[:, :, :2] -= overlaps.sum(axis=2) / 2
+
+    def _ball_overlaps(self):
+        """(K, N, 2) overlap of each robot with its world's ball, and
+        (K, N) whether the ball is on the robot's flat front"""
+        overlaps, is_front = ball_overlaps(
+            self.ball_positions, self.robot_positions, self.ROBOT_RADIUS,
+            self.ROBOT_DRIBBLER_RADIUS, self.BALL_RADIUS
+        )
+        overlaps[~self.is_present] = 0
+        return overlaps, is_front
+
+    def _resolve_ball_collisions(self):
+        # push balls out of any robots that moved into them
+        overlaps, is_front = self._ball_overlaps()
+        is_colliding = overlaps.any(axis=2)
+        is_pushed = is_colliding.any(axis=1)
+        worlds = np.flatnonzero(is_pushed)
+        if len(worlds) == 0:
+            return is_pushed
+        # (one robot per world, like the ball ends up after Simulator.step)
+        robots = np.argmax(is_colliding[worlds], axis=1)
+        robot_pos = self.robot_positions[worlds, robots]
+        collision_pos = self.ball_positions[worlds] + overlaps[worlds, robots]
+        # keep velocity in direction tangent to bot at collision
+        radius_vector = collision_pos - robot_pos[:, :2]
+        w = robot_pos[:, 2]
+        front_vector = np.stack([np.cos(w), np.sin(w)], axis=1) * \
+            (self.ROBOT_DRIBBLER_RADIUS + self.BALL_RADIUS)
+        radius_vector = np.where(is_front[worlds, robots][:, np.newaxis],
+                                 front_vector, radius_vector)
+        tangent = np.stack([radius_vector[:, 1], -radius_vector[:, 0]], axis=1)
+        tangent /= np.linalg.norm(tangent, axis=1)[:, np.newaxis]
+        velocity = self.ball_velocities[worlds]
+        self.ball_velocities[worlds] = \
+            np.sum(velocity * tangent, axis=1)[:, np.newaxis] * tangent
+        self.ball_positions[worlds] = collision_pos
+        return is_pushed
+
+    def _dribbler_positions(self):
+        w = self.robot_positions[:, :, 2]
+        heading = np.stack([np.cos(w), np.sin(w)], axis=2)
+        return self.robot_positions[:, :, :2] + \
+            heading * (self.ROBOT_DRIBBLER_RADIUS + self.BALL_RADIUS)
+
+    def _ball_in_dribblers(self, dribbler_positions, candidates, timestamp):
+        """(K, N) whether each of the candidate robots has had its world's
+        ball in its dribbler for every recent frame (ball_in_dribbler)"""
+        worlds, robots = np.nonzero(candidates & self.is_present)
+        # (M, H, 2) ball history of each candidate's world
+        balls = self._ball_history[worlds]
+        is_recent = (self._ball_history_times > timestamp -
+                     self.DRIBBLE_HISTORY_TIME) & \
+            (self._ball_history_times >=
+             self._ball_reset_times[worlds, np.newaxis])
+        in_zone = np.linalg.norm(
+            balls - dribbler_positions[worlds, robots, np.newaxis], axis=2
+        ) < self.DRIBBLE_ZONE_RADIUS
+        close_enough = np.linalg.norm(
+            balls - self.robot_positions[worlds, robots, np.newaxis, :2],
+            axis=2
+        ) < self.DRIBBLE_MAX_DIST
+        is_in_dribbler = np.zeros_like(candidates)
+        is_in_dribbler[worlds, robots] = \
+            (in_zone & close_enough | ~is_recent).all(axis=1)
+        return is_in_dribbler
+
+    def _dribble(self, delta_time, timestamp):
+        # simulate dribbling as gravity zone (only capturing slow balls)
+        dribbler_positions = self._dribbler_positions()
+        is_slow = np.linalg.norm(self.ball_velocities, axis=1) < \
+            self.DRIBBLE_CAPTURE_VELOCITY
+        is_capturing = self._ball_in_dribblers(
+            dribbler_positions, self.is_dribbling & is_slow[:, np.newaxis],
+            timestamp
+        )
+        worlds = np.flatnonzero(is_capturing.any(axis=1))
+        if len(worlds) == 0:
+            return
+        robots = np.argmax(is_capturing[worlds], axis=1)
+        ball_pos = self.ball_positions[worlds]
+        robot_xy = self.robot_positions[worlds, robots, :2]
+        pullback_velocity = (robot_xy - ball_pos) * 2
+        centering_velocity = (dribbler_positions[worlds, robots] - ball_pos) * 1
+        self.ball_positions[worlds] += \
+            (pullback_velocity + centering_velocity) * delta_time
+        overlaps, _ = self._ball_overlaps()
+        self.ball_positions[worlds] -= overlaps[worlds, robots]
+        self.ball_velocities[worlds] = 0
+        self._replace_balls(worlds, timestamp)
+
+    def _kick(self, timestamp):
+        can_kick = self._ball_in_dribblers(self._dribbler_positions(),
+                                           self.is_kicking, timestamp)
+        worlds = np.flatnonzero(can_kick.any(axis=1))
+        if len(worlds) > 0:
+            robots = np.argmax(can_kick[worlds], axis=1)
+            w = self.robot_positions[worlds, robots, 2]
+            kick_speeds = RobotCommands.MAX_KICK_SPEED * \
+                self.charge_levels[worlds, robots] / \
+                RobotCommands.MAX_CHARGE_LEVEL
+            velocity = np.stack([np.cos(w), np.sin(w)], axis=1) * \
+                kick_speeds[:, np.newaxis]
+            # (the ball rolls away on the next step, like in Simulator)
+            self.ball_velocities[worlds] = velocity
+            self._replace_balls(worlds, timestamp)
+        # kicks discharge the capacitor whether or not they hit the ball
+        self.charge_levels[self.is_kicking] = 0
+        self.is_kicking[:] = False
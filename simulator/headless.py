@@ -0,0 +1,98 @@
+'''Runs a simulated scenario + strategy in lockstep, without any threads,
+   sleeps or visualization, as fast as the cpu allows'''
+import time
+import numpy as np
+from gamestate import GameState, VirtualClock
+from strategy import Strategy
+try:
+    from simulator import Simulator
+except (SystemError, ImportError):
+    from .simulator import Simulator
+
+
+def run(setup, strategy_mode, duration, dt=.05, team='blue',
+        away_strategy_mode=None, seed=None, on_step=None, dynamics=None):
+    """Simulate the initial setup for duration seconds (of game time),
+    alternating one strategy tick with one dt physics step. Strategy
+    planning isn't cut short by real time, so with a seed every run of the
+    same scenario turns out exactly the same.
+    on_step(gamestate) is called after every step, to collect more metrics.
+    dynamics (RobotDynamics) makes robots accelerate realistically instead
+    of instantly following commands.
+    Returns a dict of metrics about how the scenario went.
+    """
+    if seed is not None:
+        np.random.seed(seed)
+    gamestate = GameState(VirtualClock())
+    simulator = Simulator(gamestate, dynamics=dynamics)
+    strategies = [Strategy(gamestate, team)]
+    strategies[0].set_mode(strategy_mode, dt)
+    if away_strategy_mode is not None:
+        away_team = 'yellow' if team == 'blue' else 'blue'
+        strategies.append(Strategy(gamestate, away_team))
+        strategies[1].set_mode(away_strategy_mode, dt)
+
+    simulator.setup_scenario(setup)
+    gamestate.game_clock = 0
+
+    metrics = {
+        'steps': 0,
+        'game_time': 0,
+        'goals': {'blue': 0, 'yellow': 0},
+        'possession_time': {'blue': 0, 'yellow': 0},
+        'robot_distance': dict(),  # (team, robot_id) : mm travelled
+        'ball_distance': 0,
+    }
+    scoring_team = None  # team whose goal the ball is in
+    start_wall_time = time.time()
+    num_steps = int(round(duration / dt))
+    for _ in range(num_steps):
+        for strategy in strategies:
+            strategy.tick(is_planning_time_limited=False)
+        before = gamestate.snapshot()
+        gamestate.clock.advance(dt)
+        gamestate.game_clock += dt
+        simulator.step(dt)
+        after = gamestate.snapshot()
+        metrics['steps'] += 1
+        metrics['game_time'] += dt
+
+        # how far everything moved this step
+        for i, key in enumerate(after.robot_keys):
+            if key in before.robot_keys:
+                previous = before.get_robot_position(*key)
+                moved = np.linalg.norm(after.robot_positions[i][:2] -
+                                       previous[:2])
+                metrics['robot_distance'][key] = \
+                    metrics['robot_distance'].get(key, 0) + moved
+        if on_step is not None:
+            on_step(gamestate)
+
+        ball_pos = after.get_ball_position()
+        previous_ball_pos = before.get_ball_position()
+        metrics['ball_distance'] += np.linalg.norm(ball_pos -
+                                                   previous_ball_pos)
+
+        # who has the ball
+        for (robot_team, robot_id) in after.robot_keys:
+            if gamestate.ball_in_dribbler_single_frame(robot_team, robot_id,
+                                                       ball_pos):
+                metrics['possession_time'][robot_team] += dt
+                break
+
+        # goals count once, when the ball first goes into the goal
+        in_goal_team = None
+        for goal_team in ['blue', 'yellow']:
+            post1, post2 = gamestate.get_defense_goal(goal_team)
+            past_goal_line = abs(ball_pos[0]) >= abs(post1[0]) and \
+                np.sign(ball_pos[0]) == np.sign(post1[0])
+            if past_goal_line and abs(ball_pos[1]) <= abs(post1[1]):
+                in_goal_team = goal_team
+        if in_goal_team is not None and in_goal_team != scoring_team:
+            scorer = 'yellow' if in_goal_team == 'blue' else 'blue'
+            metrics['goals'][scorer] += 1
+        scoring_team = in_goal_team
+
+    metrics['final_ball_position'] = gamestate.get_ball_position()
+    metrics['wall_time'] = time.time() - start_wall_time
+    return metrics
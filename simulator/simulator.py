@@ -3,19 +3,60 @@ import time
 import numpy as np
 from collections import deque
 from typing import Tuple
+from comms import RobotCommands, CommandDelay
+from gamestate.ball_trajectory import BallTrajectory
+from gamestate.collisions import robot_impacts, segment_impacts, \
+    ball_overlaps, bounce
 
 
 class Simulator(object):
     """Simulator class spins to update gamestate instead of vision and comms.
        Applies rudimentary physics and commands, to allow offline prototyping.
     """
+    # physics always moves forward in steps of this long (seconds),
+    # however long the simulation loop actually took
+    PHYSICS_STEP = .01
+    # the ball moves in this many smaller steps within each physics step
+    # (so contacts with moving robots are found more precisely)
+    BALL_SUBSTEPS = 10
+    # most collisions the ball can have in one substep (anything after it
+    # stops there until the next one, e.g. if stuck in a corner)
+    MAX_BALL_BOUNCES = 4
+    # longest delay to catch up on after the loop falls behind (seconds)
+    # (any more is dropped, instead of falling further behind catching up)
+    MAX_CATCH_UP_TIME = .25
+
     # TODO: when we get multiple comms, connect to all available robots
-    def __init__(self, gamestate):
+    def __init__(self, gamestate, physics_step=None, ball_substeps=None,
+                 dynamics=None):
         self._gamestate = gamestate
         self._is_simulating = False
         self._thread = None
         self._simulation_loop_sleep = None
         self._last_step_time = None
+        # whether to step a virtual clock instead of following real time
+        self._is_stepped = False
+        self._physics_step = self.PHYSICS_STEP if physics_step is None \
+            else physics_step
+        self._ball_substeps = self.BALL_SUBSTEPS if ball_substeps is None \
+            else ball_substeps
+        # time the clock has moved on that physics hasn't caught up with yet
+        self._accumulator = 0
+        # (time, robot poses, ball position) after each recent physics step,
+        # for drawing in between them (see render_positions)
+        self._render_states = deque(
+            maxlen=int(self.MAX_CATCH_UP_TIME / self._physics_step) + 2
+        )
+        # how far behind the clock to draw, to always have steps either side
+        # (see _update_render_delay)
+        self._render_delay = None
+        # how robots follow commands (see RobotDynamics), None for ideal
+        # robots that are instantly at their commanded speeds
+        self._dynamics = dynamics
+        if dynamics is not None:
+            self._command_delay = CommandDelay(dynamics.LATENCY)
+        # (team, robot_id) : (velocity, acceleration) from robot perspective
+        self._robot_motions = dict()
 
         self._initial_setup = None
 
@@ -23,7 +64,7 @@ class Simulator(object):
         "initialize a robot with given id + team at (x, y, w) position"
         self._gamestate.update_robot_position(team, robot_id, position)
 
-    def put_fake_ball(self, position, velocity=None):
+    def put_fake_ball(self, position, velocity=None, timestamp=None):
         "initialize ball position data to reflect desired position + velocity"
         if velocity is None:
             velocity = np.array([0, 0])  
@@ -31,16 +72,27 @@ class Simulator(object):
         # use small dt to minimize deceleration correction
         dt = .05
         prev_pos = position - velocity * dt
-        self._gamestate.update_ball_position(prev_pos, time.time() - dt)
-        self._gamestate.update_ball_position(position, time.time())
+        now = self._gamestate.clock.time() if timestamp is None else timestamp
+        self._gamestate.update_ball_position(prev_pos, now - dt)
+        self._gamestate.update_ball_position(position, now)
         # print(f"{self._gamestate._ball_position}")
         # print(f"v: {self._gamestate.get_ball_velocity()}")
 
-    def start_simulating(self, inital_setup, loop_sleep):
+    def start_simulating(self, inital_setup, loop_sleep, is_stepped=False):
         """Spin up simulator thread to update gamestate as though robots 
-        are following commands + physics"""
+        are following commands + physics
+        If stepped, every loop moves the gamestate's (virtual) clock forward
+        by loop_sleep instead of waiting for it to pass, so the simulation
+        runs as fast as the cpu allows. This doesn't wait for strategy, so
+        how much game time passes between ticks depends on thread
+        scheduling - use simulator.headless.run for reproducible runs."""
+        if is_stepped:
+            assert hasattr(self._gamestate.clock, 'advance'), \
+                "stepped simulation needs a VirtualClock"
         self._initial_setup = inital_setup
         self._simulation_loop_sleep = loop_sleep
+        self._render_delay = loop_sleep + self._physics_step
+        self._is_stepped = is_stepped
         self._is_simulating = True
         self._thread = threading.Thread(target=self.simulation_loop)
         # set to daemon mode so it will be easily killed
@@ -54,8 +106,43 @@ class Simulator(object):
         print("\nSimulator running with initial setup: {}".format(
             self._initial_setup
         ))
-        # initialize the chosen scenario
-        if self._initial_setup == 'full_teams':
+        self.setup_scenario(self._initial_setup)
+
+        # run the simulation loop
+        self._accumulator = 0
+        while self._is_simulating:
+            now = gs.clock.time()
+            delta_time = 0
+            if self._last_step_time is not None:
+                delta_time = now - self._last_step_time
+                if delta_time > self._simulation_loop_sleep * 3:
+                    print("Simulation loop large delay: " + str(delta_time))
+            self._last_step_time = now
+
+            # run as many fixed physics steps as fit in the time that passed
+            # (each stamped with the time it simulates up to)
+            self._accumulator += min(delta_time, self.MAX_CATCH_UP_TIME)
+            previous_time = self._render_states[-1][0] \
+                if self._render_states else None
+            while self._accumulator >= self._physics_step:
+                self._accumulator -= self._physics_step
+                self.step(self._physics_step, now - self._accumulator)
+            if previous_time is not None:
+                self._update_render_delay(previous_time)
+
+            if self._is_stepped:
+                # move time on ourselves (waking anything sleeping on it),
+                # and only briefly yield to other threads
+                gs.clock.advance(self._simulation_loop_sleep)
+                time.sleep(0)
+            else:
+                # yield to other threads
+                gs.clock.sleep(self._simulation_loop_sleep)
+
+    def setup_scenario(self, initial_setup):
+        "put robots + ball in place for the chosen initial setup"
+        gs = self._gamestate
+        if initial_setup == 'full_teams':
             for i in range(1, 7):
                 left_pos = np.array([-3000, 200 * (i - 3.5), 0])
                 right_pos = np.array([3000, 200 * (i - 3.5), 3.14])
@@ -68,10 +155,10 @@ class Simulator(object):
                 self.put_fake_robot('blue', i, blue_pos)
                 self.put_fake_robot('yellow', i, yellow_pos)
             self.put_fake_ball(np.array([0, 0]))
-        elif self._initial_setup == "moving_ball":
+        elif initial_setup == "moving_ball":
             self.put_fake_robot('blue', 1, np.array([-3000, 0, 0]))
             self.put_fake_ball(np.array([-2000, 1200]), np.array([0, -1200]))
-        elif self._initial_setup == "entry_video":
+        elif initial_setup == "entry_video":
             SCALE = 1  # if mini field
             self.put_fake_ball(np.array([2000, 900]) * SCALE, np.array([0, 0]))
             self.put_fake_robot('blue', 0, np.array([1000, 900, 0]) * SCALE)
@@ -84,119 +171,252 @@ class Simulator(object):
         else:
             print('(initial_setup not recognized, empty field)')
 
-        # run the simulation loop
-        while self._is_simulating:
-            delta_time = 0
-            if self._last_step_time is not None:
-                delta_time = time.time() - self._last_step_time
-                if delta_time > self._simulation_loop_sleep * 3:
-                    print("Simulation loop large delay: " + str(delta_time))
-            self._last_step_time = time.time()
-            # allow user to move the ball via UI
-            if gs.user_selected_ball:
-                new_pos = gs.user_click_position
-                if new_pos is not None:
-                    v = gs.user_drag_vector
-                    v = np.array([0, 0]) if v is None else v
-                    self.put_fake_ball(new_pos[:2], v)
-                    gs.user_click_position = None
-                    gs.user_drag_vector = None
-
-            # move ball according to prediction
-            ball_pos = gs.get_ball_position()
-            if ball_pos is not None:
-                new_ball_pos = gs.predict_ball_pos(delta_time)
-                # print("dt: {}, new_pos: {}".format(delta_time, new_ball_pos))
-                # print(time.time())
-                # print("v: {}".format(gs.get_ball_velocity()))
-                # print(gs.predict_ball_pos(0))
-
-                # print(gs.get_ball_velocity())
-                gs.update_ball_position(new_ball_pos)
-
-            for (team, robot_id), pos in \
-                    gs.get_all_robot_positions():
-                # refresh positions of all robots
-                pos = gs.get_robot_position(team, robot_id)
-                gs.update_robot_position(team, robot_id, pos)
-
-                # handle collisions with other robots
-                for (team2, robot_id2), pos2 in \
-                        gs.get_all_robot_positions():
-                    if (team2, robot_id2) != (team, robot_id) and \
-                       gs.robot_overlap(pos, pos2).any():
-                        overlap = gs.robot_overlap(pos, pos2)
-                        overlap = np.append(overlap, 0)
-                        gs.update_robot_position(
-                            team, robot_id, pos - overlap / 2)
-                        gs.update_robot_position(
-                            team2, robot_id2, pos2 + overlap / 2)
-                # collision with ball
+    def step(self, delta_time, timestamp=None):
+        """move everything forward by delta_time seconds (following
+        robot commands + physics), stamping the new positions with timestamp
+        (the current time by default)"""
+        gs = self._gamestate
+        if timestamp is None:
+            timestamp = gs.clock.time()
+        # allow user to move the ball via UI
+        if gs.user_selected_ball:
+            new_pos = gs.user_click_position
+            if new_pos is not None:
+                v = gs.user_drag_vector
+                v = np.array([0, 0]) if v is None else v
+                self.put_fake_ball(new_pos[:2], v, timestamp)
+                gs.user_click_position = None
+                gs.user_drag_vector = None
+
+        # handle collisions between all robots at once
+        world = gs.snapshot()
+        displacements = gs.resolve_robot_overlaps(world.robot_positions)
+        start_positions = world.robot_positions.copy()
+        start_positions[:, :2] += displacements
+        # speeds robots are commanded at (robots without commands stay put)
+        speeds = np.zeros_like(start_positions)
+        for i, (team, robot_id) in enumerate(world.robot_keys):
+            robot_commands = gs.get_team_commands(team).get(robot_id)
+            if robot_commands is not None:
+                speeds[i] = robot_commands.get_speeds()
+
+        # how fast robots actually go following those commands
+        speeds, end_positions = self.drive_robots(
+            world.robot_keys, start_positions, speeds, delta_time, timestamp
+        )
+
+        # move ball along its path, bouncing off anything in the way
+        self.move_ball(delta_time, start_positions, speeds, timestamp)
+
+        # move robots according to commands
+        for i, (team, robot_id) in enumerate(world.robot_keys):
+            gs.update_robot_position(team, robot_id, end_positions[i],
+                                     timestamp)
+
+        for (team, robot_id), robot_commands in \
+                gs.get_all_robot_commands():
+            # charge capacitors according to commands
+            if robot_commands.is_charging:
+                robot_commands.simulate_charge(delta_time)
+            # simulate dribbling as gravity zone
+            if robot_commands.is_dribbling:
                 ball_pos = gs.get_ball_position()
-                ball_overlap = gs.robot_ball_overlap(pos)
-                if ball_overlap.any():
-                    # print(ball_overlap)
-                    # find where ball collided with robot
-                    collision_pos = ball_pos + ball_overlap
-                    ball_v = gs.get_ball_velocity()
-                    if ball_v.any():
-                        collision_pos = ball_pos
-                        ball_direction = ball_v / np.linalg.norm(ball_v)
-                        step = 1
-                        # trace back one step at a time to collision point
-                        while gs.robot_ball_overlap(pos, collision_pos).any():
-                            collision_pos -= ball_direction * step
-                    # keep velocity in direction tangent to bot at collision
-                    radius_vector = collision_pos - pos[:2]
-                    if gs.is_robot_front_sector(pos, collision_pos):
-                        # we are in the front sector, use flat angle
-                        radius_vector = gs.dribbler_pos(team, robot_id) - pos[:2]
-                    tangent_vector = np.array([radius_vector[1], -radius_vector[0]])
-                    assert(tangent_vector.any())
-                    tangent_vector /= np.linalg.norm(tangent_vector)
-                    new_v = np.dot(ball_v, tangent_vector) * tangent_vector
-                    self.put_fake_ball(collision_pos, new_v)
-
-            for (team, robot_id), robot_commands in \
-                    gs.get_all_robot_commands():
-                # move robots according to commands
-                pos = gs.get_robot_position(team, robot_id)
-                new_pos = robot_commands.predict_pos(pos, delta_time)
-                gs.update_robot_position(
-                    team, robot_id, new_pos
-                )
-                # charge capacitors according to commands
-                if robot_commands.is_charging:
-                    robot_commands.simulate_charge(delta_time)
-                # simulate dribbling as gravity zone
-                if robot_commands.is_dribbling:
+                dribbler_center = gs.dribbler_pos(team, robot_id)
+                robot_pos = gs.get_robot_position(team, robot_id)
+                # simplistic model of capturing ball only if slow enough
+                ball_v = gs.get_ball_velocity()
+                DRIBBLE_CAPTURE_VELOCITY = 20
+                if gs.ball_in_dribbler(team, robot_id) and \
+                   np.linalg.norm(ball_v) < DRIBBLE_CAPTURE_VELOCITY:
+                    pullback_velocity = (robot_pos[:2] - ball_pos) * 2
+                    centering_velocity = (dribbler_center - ball_pos) * 1
+                    total_velocity = pullback_velocity + centering_velocity
+                    new_pos = ball_pos + total_velocity * delta_time
+                    new_pos -= gs.robot_ball_overlap(robot_pos, new_pos)
+                    self.put_fake_ball(new_pos, timestamp=timestamp)
+            # kick according to commands
+            if robot_commands.is_kicking:
+                if gs.ball_in_dribbler(team, robot_id):
                     ball_pos = gs.get_ball_position()
-                    dribbler_center = gs.dribbler_pos(team, robot_id)
-                    robot_pos = gs.get_robot_position(team, robot_id)
-                    # simplistic model of capturing ball only if slow enough
-                    ball_v = gs.get_ball_velocity()
-                    DRIBBLE_CAPTURE_VELOCITY = 20
-                    if gs.ball_in_dribbler(team, robot_id) and \
-                       np.linalg.norm(ball_v) < DRIBBLE_CAPTURE_VELOCITY:
-                        pullback_velocity = (robot_pos[:2] - ball_pos) * 2
-                        centering_velocity = (dribbler_center - ball_pos) * 1
-                        total_velocity = pullback_velocity + centering_velocity
-                        new_pos = ball_pos + total_velocity * delta_time
-                        new_pos -= gs.robot_ball_overlap(robot_pos, new_pos)
-                        self.put_fake_ball(new_pos)
-                # kick according to commands
-                if robot_commands.is_kicking:
-                    if gs.ball_in_dribbler(team, robot_id):
-                        ball_pos = gs.get_ball_position()
-                        new_velocity = robot_commands.kick_velocity() * \
-                            gs.get_robot_direction(team, robot_id)
-                        new_pos = ball_pos + new_velocity * delta_time
-                        self.put_fake_ball(new_pos, new_velocity)
-                    robot_commands.charge_level = 0
-                    robot_commands.is_kicking = False
-
-            # yield to other threads
-            time.sleep(self._simulation_loop_sleep)
+                    new_velocity = robot_commands.kick_velocity() * \
+                        gs.get_robot_direction(team, robot_id)
+                    # (the ball rolls away on the next step, so it can't
+                    # skip through anything in front of the kicker)
+                    self.put_fake_ball(ball_pos, new_velocity, timestamp)
+                robot_commands.charge_level = 0
+                robot_commands.is_kicking = False
+
+        # keep recent steps for drawing in between them
+        robots = {key: end_positions[i]
+                  for i, key in enumerate(world.robot_keys)}
+        self._render_states.append((timestamp, robots,
+                                    gs.get_ball_position()))
+
+    def drive_robots(self, robot_keys, start_positions, speeds, delta_time,
+                     timestamp):
+        """(average speeds robots move at over the delta_time seconds up to
+        timestamp, positions they end up at) when commanded at speeds"""
+        if self._dynamics is None:
+            return speeds, RobotCommands.predict_poses(start_positions,
+                                                       speeds, delta_time)
+        # robots only get commands sent some time ago
+        start_time = timestamp - delta_time
+        self._command_delay.send(start_time, zip(robot_keys, speeds))
+        arrived = self._command_delay.arrived(start_time)
+        stopped = np.zeros(3)
+        commands = np.array([arrived.get(key, stopped)
+                             for key in robot_keys]).reshape(-1, 3)
+        motions = [self._robot_motions.get(key, (stopped, stopped))
+                   for key in robot_keys]
+        velocities = np.array([v for v, _ in motions]).reshape(-1, 3)
+        accelerations = np.array([a for _, a in motions]).reshape(-1, 3)
+        end_positions, new_velocities, new_accelerations = \
+            self._dynamics.step(start_positions, velocities, accelerations,
+                                commands, delta_time)
+        for i, key in enumerate(robot_keys):
+            self._robot_motions[key] = (new_velocities[i],
+                                        new_accelerations[i])
+        return (velocities + new_velocities) / 2, end_positions
+
+    def move_ball(self, delta_time, robot_positions, robot_speeds, timestamp):
+        """Roll the ball delta_time seconds along its path, while robots
+        (N x 3 robot_positions) move at robot_speeds. Within each substep
+        the exact time the ball first touches any robot or wall is found,
+        and it bounces off and rolls on from there. Robots that drive into
+        the ball push it out of the way."""
+        gs = self._gamestate
+        trajectory = gs.get_ball_trajectory()
+        walls = gs.wall_segments()
+        # (a still ball can only be pushed, so doesn't need substeps)
+        substeps = self._ball_substeps if trajectory.is_moving() else 1
+        substep_time = delta_time / substeps
+        has_bounced = False
+        for i in range(substeps):
+            # robots where they are at the end of this substep
+            positions = RobotCommands.predict_poses(
+                robot_positions, robot_speeds, substep_time * (i + 1)
+            )
+            trajectory, is_bounced = self._roll_ball(trajectory, substep_time,
+                                                     positions, walls)
+            trajectory, is_pushed = self._push_ball_out(trajectory, positions)
+            has_bounced = has_bounced or is_bounced or is_pushed
+        if has_bounced:
+            self.put_fake_ball(trajectory.position, trajectory.velocity,
+                               timestamp)
+        else:
+            gs.update_ball_position(trajectory.position, timestamp)
+
+    def _roll_ball(self, trajectory, delta_time, robot_positions, walls):
+        """(trajectory from where the ball is after delta_time, whether it
+        bounced off anything on the way)"""
+        gs = self._gamestate
+        restitutions = np.concatenate([
+            np.zeros(len(robot_positions)),
+            np.full(len(walls), gs.BALL_WALL_RESTITUTION)
+        ])
+        time_left = delta_time
+        has_bounced = False
+        for _ in range(self.MAX_BALL_BOUNCES):
+            if not trajectory.is_moving():
+                break
+            robot_distances, robot_normals = robot_impacts(
+                trajectory.position, trajectory.direction, robot_positions,
+                gs.ROBOT_RADIUS, gs.ROBOT_DRIBBLER_RADIUS, gs.BALL_RADIUS
+            )
+            wall_distances, wall_normals = segment_impacts(
+                trajectory.position, trajectory.direction, walls,
+                gs.BALL_RADIUS
+            )
+            distances = np.concatenate([robot_distances, wall_distances])
+            normals = np.concatenate([robot_normals, wall_normals])
+            i = np.argmin(distances)
+            hit_time = trajectory.time_at_distance(distances[i])
+            if hit_time is None or hit_time > time_left:
+                break
+            velocity = bounce(trajectory.velocities_at(hit_time),
+                              normals[i], restitutions[i])
+            trajectory = BallTrajectory(trajectory.positions_at(hit_time),
+                                        velocity, gs.BALL_DECCELERATION)
+            time_left -= hit_time
+            has_bounced = True
+        else:
+            # (too many bounces, stay at the last one)
+            time_left = 0
+        if time_left > 0 and trajectory.is_moving():
+            trajectory = BallTrajectory(trajectory.position_at(time_left),
+                                        trajectory.velocities_at(time_left),
+                                        gs.BALL_DECCELERATION)
+        return trajectory, has_bounced
+
+    def _push_ball_out(self, trajectory, robot_positions):
+        """(trajectory moved out of any robots the ball overlaps, keeping
+        only its velocity tangent to the robot, whether it was moved)"""
+        gs = self._gamestate
+        overlaps, is_front = ball_overlaps(
+            trajectory.position, robot_positions, gs.ROBOT_RADIUS,
+            gs.ROBOT_DRIBBLER_RADIUS, gs.BALL_RADIUS
+        )
+        is_overlapping = overlaps.any(axis=1)
+        if not is_overlapping.any():
+            return trajectory, False
+        i = np.argmax(is_overlapping)
+        pos = robot_positions[i]
+        collision_pos = trajectory.position + overlaps[i]
+        # keep velocity in direction tangent to bot at collision
+        radius_vector = collision_pos - pos[:2]
+        if is_front[i]:
+            # we are in the front sector, use flat angle
+            radius_vector = np.array([np.cos(pos[2]), np.sin(pos[2])])
+        tangent_vector = np.array([radius_vector[1], -radius_vector[0]])
+        tangent_vector /= np.linalg.norm(tangent_vector)
+        new_v = np.dot(trajectory.velocity, tangent_vector) * tangent_vector
+        return BallTrajectory(collision_pos, new_v,
+                              gs.BALL_DECCELERATION), True
+
+    def _update_render_delay(self, previous_time):
+        # how long the steps before this loop's were the latest ones to draw
+        # (the loop sleep + running the steps), jumping straight up to it but
+        # only slowly coming back down, so jitter doesn't make motion jerky
+        lag = self._gamestate.clock.time() - previous_time + \
+            self._physics_step
+        if lag > self._render_delay:
+            self._render_delay = lag
+        else:
+            self._render_delay += (lag - self._render_delay) * .05
+
+    def render_positions(self):
+        """({(team, robot_id): (x, y, w)}, ball position) as of a little
+        while ago (about one simulation loop + physics step), interpolated
+        between the physics steps either side of then by the current time.
+        Physics only catches up once per simulation loop, so this trails it
+        enough to always have a step on both sides, and motion looks smooth
+        however often it is drawn. None until two steps ran."""
+        states = list(self._render_states)
+        if len(states) < 2:
+            return None
+        delay = self._physics_step if self._render_delay is None \
+            else self._render_delay
+        render_time = self._gamestate.clock.time() - delay
+        times = [state[0] for state in states]
+        i = min(max(np.searchsorted(times, render_time), 1), len(states) - 1)
+        (previous_time, previous_robots, previous_ball), \
+            (latest_time, latest_robots, latest_ball) = states[i - 1], states[i]
+        alpha = 1.
+        if latest_time > previous_time:
+            alpha = (render_time - previous_time) / (latest_time - previous_time)
+            alpha = min(max(alpha, 0), 1)
+        robots = dict()
+        for key, pos in latest_robots.items():
+            prev_pos = previous_robots.get(key, pos)
+            # (turn the short way around)
+            dw = (pos[2] - prev_pos[2] + np.pi) % (2 * np.pi) - np.pi
+            robots[key] = np.append(prev_pos[:2] + (pos[:2] - prev_pos[:2]) * alpha,
+                                    prev_pos[2] + dw * alpha)
+        ball_pos = previous_ball + (latest_ball - previous_ball) * alpha
+        return robots, ball_pos
+
+    def is_simulating(self):
+        return self._is_simulating
 
     def stop_simulating(self):
         if self._is_simulating:
@@ -1,5 +1,4 @@
 import numpy as np
-import time
 from typing import Iterable, Optional, List, Tuple
 
 
@@ -8,9 +7,9 @@ from typing import Iterable, Optional, List, Tuple
 class Actions:
     def pivot_with_ball(self, robot_id, face_pos: Tuple[float, float]) -> bool:
         """Move robot around ball without losing possession"""
-        ball_pos = self._gs.get_ball_position()
+        ball_pos = self._world.get_ball_position()
         kick_pos = self.best_kick_pos(ball_pos, face_pos)
-        robot_pos = self._gs.get_robot_position(self._team, robot_id)
+        robot_pos = self._world.get_robot_position(self._team, robot_id)
         # pivot gradually towards kicking position
         dw = self.wrap_pi(kick_pos[2] - robot_pos[2])
         turn_increment = dw / 3
@@ -21,7 +20,7 @@ class Actions:
         self.set_waypoints(robot_id, [waypoint])
         remaining_error = abs(self.wrap_pi(robot_pos[2] - kick_pos[2]))
         if remaining_error < min_turn_increment and \
-           self._gs.ball_in_dribbler(self._team, robot_id):
+           self._world.ball_in_dribbler(self._team, robot_id):
             return True
         else:
             return False
@@ -50,11 +49,14 @@ class Actions:
         return self.is_done_moving(robot_id)
 
     # find a legal path for robot to go to position, returns whether arrived
-    def path_find(self, robot_id: int, goal_pos: Tuple[float, float, float]) -> bool:
-        if not self._gs.is_position_open(goal_pos, self._team, robot_id):
+    # (planner + time_budget default to the strategy's, see set_planner)
+    def path_find(self, robot_id: int, goal_pos: Tuple[float, float, float],
+                  planner: Optional[str] = None,
+                  time_budget: Optional[float] = None) -> bool:
+        if not self._world.is_position_open(goal_pos, self._team, robot_id):
             print("cannot path find to blocked goal")
             return False
-        start_pos = self._gs.get_robot_position(self._team, robot_id)
+        start_pos = self._world.get_robot_position(self._team, robot_id)
         # always check if we can just go straight
         if not self.is_path_blocked(start_pos, goal_pos, robot_id, buffer_dist=150):
             self.move_straight(robot_id, np.array(goal_pos))
@@ -67,11 +69,11 @@ class Actions:
             # np.array_equal(goal_pos[:2], current_goal[:2])
         commands = self._gs.get_robot_commands(self._team, robot_id)
         current_waypoints = [start_pos] + commands.waypoints
-        current_path_collides = False
-        for i in range(len(current_waypoints) - 1):
-            wp, next_wp = current_waypoints[i], current_waypoints[i+1]
-            if self.is_path_blocked(wp, next_wp, robot_id):
-                current_path_collides = True
+        # check every segment of the current path at once
+        is_blocked = self.are_paths_blocked(
+            current_waypoints[:-1], current_waypoints[1:], robot_id
+        )
+        current_path_collides = is_blocked.any()
         # avoid rerunning too often so we don't crash the system
         # RRT_MIN_INTERVAL = .1
         # recently_called = robot_id in self._last_RRT_times and \
@@ -79,10 +81,35 @@ class Actions:
         # only rerun for same goal if long time has elapsed or path collides
         MIN_REFRESH_INTERVAL = 3  # mainly in case something very strange has happened
         need_refresh = robot_id not in self._last_RRT_times or \
-            time.time() - self._last_RRT_times[robot_id] > MIN_REFRESH_INTERVAL
+            self._gs.clock.time() - self._last_RRT_times[robot_id] > MIN_REFRESH_INTERVAL
         if (current_path_collides or not is_same_goal or need_refresh):
-            self._last_RRT_times[robot_id] = time.time()
-            is_success = self.RRT_path_find(start_pos, goal_pos, robot_id)
+            if planner is None:
+                planner = self._planner
+            time_budget = self.planning_time_left(time_budget)
+            if time_budget is not None and time_budget <= 0:
+                # out of planning time this loop, keep the current path
+                # and try again next time
+                return False
+            # warm start from the current path (if it's going to this goal)
+            seed_path = commands.waypoints if is_same_goal else None
+            if self._planner_service is not None and \
+               self._planner_service.is_running():
+                # plan together with all other robots at the end of the loop
+                self._last_RRT_times[robot_id] = self._gs.clock.time()
+                self._planning_requests[robot_id] = \
+                    (start_pos, goal_pos, seed_path)
+                return False
+            # if only part of the path to the same goal is blocked,
+            # just replan around the blocked part
+            if is_same_goal and not need_refresh and \
+               self.repair_path(robot_id, current_waypoints, is_blocked,
+                                planner, self._planner_lim, time_budget):
+                return self.is_done_moving(robot_id)
+            self._last_RRT_times[robot_id] = self._gs.clock.time()
+            is_success = self.RRT_path_find(
+                start_pos, goal_pos, robot_id, self._planner_lim, planner,
+                self.planning_time_left(time_budget), seed_path
+            )
             if not is_success:
                 return False
         return self.is_done_moving(robot_id)
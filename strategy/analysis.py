@@ -1,25 +1,97 @@
 import numpy as np
 import time
-from typing import Optional, Tuple, Iterable
+from typing import Optional, Tuple
+from comms.trajectory import arrival_times
+
+try:
+    from rrt import RRTPlanner
+    from nav_grid import GRID_PLANNERS
+except (SystemError, ImportError):
+    from .rrt import RRTPlanner
+    from .nav_grid import GRID_PLANNERS
+
+# how long to wait for the planner service outside of the control loop
+PLANNER_SERVICE_DEADLINE = .05
 
 # Analysis functions for strategy
 class Analysis:
     def get_future_ball_array(self):
         """Samples incrementally to return array of future predicted ball positions"""
-        ball_pos = self._gs.get_ball_position()
-        # this definition of new_ball_pos guarentees that they are not the same intitally
-        new_ball_pos = ball_pos - np.array([1, 1])
-        now = time.time()
-        t = 0
+        trajectory = self._world.get_ball_trajectory()
+        now = self._gs.clock.time()
         delta_t = .1
-        future_ball_array = []
-        while ((ball_pos != new_ball_pos).any() or t == 0) and self._gs.is_in_play(new_ball_pos):
-            # here we make the previously generated point the reference
-            ball_pos = new_ball_pos
-            new_ball_pos = self._gs.predict_ball_pos(t)
-            future_ball_array.append((t + now, new_ball_pos))
-            t += delta_t
-        return future_ball_array
+        # sample until the ball stops (the last sample is where it stops)
+        num_samples = int(trajectory.stop_time // delta_t) + 2
+        times = np.arange(num_samples) * delta_t
+        positions = trajectory.positions_at(times)
+        if trajectory.stop_time == 0:
+            times, positions = times[:1], positions[:1]
+        # stop after the first position that leaves the field
+        gs = self._gs
+        in_play = (gs.FIELD_MIN_X <= positions[:, 0]) & \
+            (positions[:, 0] <= gs.FIELD_MAX_X) & \
+            (gs.FIELD_MIN_Y <= positions[:, 1]) & \
+            (positions[:, 1] <= gs.FIELD_MAX_Y)
+        if not in_play.all():
+            end = np.argmin(in_play) + 1
+            times, positions = times[:end], positions[:end]
+        return [(t + now, pos) for t, pos in zip(times, positions)]
+
+    def intercept_windows(self, robot_ids=None, team=None):
+        """earliest + latest times each robot can get to the moving ball
+        before it stops or leaves the field, solved for all robots at once
+
+        @return robot_ids, earliest_times, latest_times:
+            times are seconds from now, NaN if the robot can't intercept
+        """
+        if team is None:
+            team = self._team
+        if robot_ids is None:
+            robot_ids = self._world.get_robot_ids(team)
+        robot_ids = list(robot_ids)
+        trajectory = self._world.get_ball_trajectory()
+        gs = self._gs
+        positions = np.array([self._world.get_robot_position(team, robot_id)
+                              for robot_id in robot_ids]).reshape(-1, 3)
+        max_speeds = np.array([gs.robot_max_speed(team, robot_id)
+                               for robot_id in robot_ids])
+        exit_time = trajectory.exit_time(gs.FIELD_MIN_X, gs.FIELD_MAX_X,
+                                         gs.FIELD_MIN_Y, gs.FIELD_MAX_Y)
+        earliest, latest = trajectory.intercept_windows(
+            positions, max_speeds, exit_time)
+        return robot_ids, earliest, latest
+
+    def predict_robot_positions(self, delta_time, robot_ids=None):
+        """where our robots will be in delta_time seconds following their
+        current commands, starting from their current velocities (accounting
+        for acceleration limits + command latency, see RobotDynamics)
+
+        @return robot_ids, positions: N x 3 field (x, y, w)
+        """
+        if robot_ids is None:
+            robot_ids = self._world.get_robot_ids(self._team)
+        robot_ids = list(robot_ids)
+        positions = np.array([self._world.get_robot_position(self._team, i)
+                              for i in robot_ids]).reshape(-1, 3)
+        velocities = np.array([self._world.get_robot_velocity(self._team, i)
+                               for i in robot_ids]).reshape(-1, 3)
+        # (robots without commands aren't being told to move)
+        commands = np.zeros((len(robot_ids), 3))
+        team_commands = self._gs.get_team_commands(self._team)
+        for n, robot_id in enumerate(robot_ids):
+            robot_commands = team_commands.get(robot_id)
+            if robot_commands is not None:
+                commands[n] = robot_commands.get_speeds()
+        velocities = self._dynamics.to_robot_perspective(positions, velocities)
+        return robot_ids, self._dynamics.predict(positions, velocities,
+                                                 commands, delta_time)
+
+    def best_interceptor(self, robot_ids=None, team=None) -> Optional[int]:
+        """robot that can get to the ball soonest (None if none can)"""
+        robot_ids, earliest, _ = self.intercept_windows(robot_ids, team)
+        if not robot_ids or np.isnan(earliest).all():
+            return None
+        return robot_ids[int(np.nanargmin(earliest))]
 
     def intercept_range(self, robot_id: int
         ) -> Tuple[Tuple[float, float], Tuple[float, float]]:
@@ -29,58 +101,43 @@ class Analysis:
             returns the positions between which robots can intercept the ball.
             returns None if interception is not possible
         """
-        # print(f"start time: {datetime.now()}")
-        # variable at the time when the ball first gets within range.
-        robot_pos = self._gs.get_robot_position(self._team, robot_id)
-        delta_t = .1
-        time = 0
-        out_of_range = True
-        while(out_of_range):
-            interception_pos = self._gs.predict_ball_pos(time)
-            separation_distance = np.linalg.norm(robot_pos[:2] - interception_pos)
-            max_speed = self._gs.robot_max_speed(self._team, robot_id)
-            if separation_distance <= time * max_speed:
-                first_intercept_point = interception_pos
-                if not self._gs.is_in_play(first_intercept_point):
-                    return None
-                out_of_range = False
-            else:
-                time += delta_t
-        while(not out_of_range):
-            # Starting at the time when the ball first got within range.
-            interception_pos = self._gs.predict_ball_pos(time)
-            separation_distance = np.linalg.norm(robot_pos[:2] - interception_pos)
-            max_speed = self._gs.robot_max_speed(self._team, robot_id)
-            last_intercept_point = self._gs.predict_ball_pos(time - delta_t)
-            # Use opposite criteria to find the end of the window
-            cant_reach = (separation_distance > time * max_speed)
-            stopped_moving = (last_intercept_point == interception_pos).all()
-            in_play = self._gs.is_in_play(interception_pos)
-            if cant_reach or stopped_moving or not in_play:
-                # we need to subtract delta_t because we found the last
-                #print(f"end time: {datetime.now()}")
-                return first_intercept_point, last_intercept_point
-            else:
-                time += delta_t
+        _, earliest, latest = self.intercept_windows([robot_id])
+        if np.isnan(earliest[0]):
+            return None
+        trajectory = self._world.get_ball_trajectory()
+        first_intercept_point = trajectory.position_at(earliest[0])
+        if not self._gs.is_in_play(first_intercept_point):
+            return None
+        return first_intercept_point, trajectory.position_at(latest[0])
 
     def safest_intercept_point(self, robot_id: int) -> Tuple[float, float]:
         """determine the point in the ball's trajectory that the robot can reach
         soonest relative to the ball (even if it's too late)"""
         future_ball_array = self.get_future_ball_array()
-        robot_pos = self._gs.get_robot_position(self._team, robot_id)
-        max_speed = self._gs.robot_max_speed(self._team, robot_id)
-        def buffer_time(data):
-            timestamp, ball_pos = data
-            ball_travel_time = timestamp - time.time()
-            distance_robot_needs_to_travel = np.linalg.norm(ball_pos - robot_pos[:2])
-            robot_travel_time = distance_robot_needs_to_travel / max_speed
-            return ball_travel_time - robot_travel_time
-        if len(future_ball_array) > 0:
-            buffer_time, safest_pos = max(future_ball_array, key=buffer_time)
-        else:
+        robot_pos = self._world.get_robot_position(self._team, robot_id)
+        if len(future_ball_array) == 0:
             # if the ball is not visible, return current position
-            safest_pos = robot_pos
-        return safest_pos
+            return robot_pos
+        timestamps = np.array([t for t, _ in future_ball_array])
+        ball_positions = np.array([pos for _, pos in future_ball_array])
+        # how much sooner the robot gets to each point than the ball
+        ball_travel_times = timestamps - self._gs.clock.time()
+        robot_travel_times = self.robot_arrival_times(robot_id, ball_positions)
+        buffer_times = ball_travel_times - robot_travel_times
+        return ball_positions[np.argmax(buffer_times)]
+
+    def robot_arrival_times(self, robot_id: int, targets) -> np.ndarray:
+        """seconds for our robot to get to (and stop at) each of N x 2
+        targets, from its current velocity (see comms.trajectory)"""
+        gs = self._gs
+        robot_pos = self._world.get_robot_position(self._team, robot_id)
+        velocity = self._world.get_robot_velocity(self._team, robot_id)[:2]
+        deltas = np.asarray(targets, dtype=float)[:, :2] - robot_pos[:2]
+        distances = np.linalg.norm(deltas, axis=1)
+        directions = deltas / np.maximum(distances, 1e-9)[:, np.newaxis]
+        return arrival_times(distances, directions @ velocity,
+                             gs.robot_max_speed(self._team, robot_id),
+                             gs.robot_max_acceleration(self._team, robot_id))
 
     def best_kick_pos(self, from_pos: Tuple[float, float], to_pos: Tuple[float, float]) -> Tuple[float, float, float]:
         """determine the best robot position to kick in desired direction"""
@@ -95,7 +152,7 @@ class Analysis:
         if team is None:
             team = self._team
         if ball_pos is None:
-            ball_pos = self._gs.get_ball_position()
+            ball_pos = self._world.get_ball_position()
         if not self._gs.is_in_play(ball_pos):
             return np.array([])
         goal_top, goal_bottom = self._gs.get_defense_goal(team)
@@ -118,124 +175,106 @@ class Analysis:
         return block_pos
 
     def is_path_blocked(self, s_pos, g_pos, robot_id, buffer_dist=0):
-        "incrementally check a linear path for obstacles"
-        s_pos = np.array(s_pos)[:2]
-        g_pos = np.array(g_pos)[:2]
-
-        if (g_pos == s_pos).all():
-            return False
-        # Check endpoint first to avoid worrying about step size in the loop
-        if not self._gs.is_position_open(g_pos, self._team, robot_id):
-            return True
-        path = g_pos - s_pos
-        norm_path = path / np.linalg.norm(path)
-        STEP_SIZE = self._gs.ROBOT_RADIUS
-
-        # step along the path and check if any points are blocked
-        steps = int(np.floor(np.linalg.norm(path) / STEP_SIZE))
-        for i in range(1, steps + 1):
-            intermediate_pos = s_pos + norm_path * STEP_SIZE * i
-            np.append(intermediate_pos, 0)
-            if not self._gs.is_position_open(intermediate_pos, self._team, robot_id, buffer_dist):
-                return True
-        return False
-
-    # generate RRT waypoints
-    def RRT_path_find(self, start_pos, goal_pos, robot_id, lim=1000):
-        goal_pos = np.array(goal_pos)
-        start_pos = np.array(start_pos)
-        graph = {tuple(start_pos): []}
-        prev = {tuple(start_pos): None}
-        cnt = 0
-        success = False
-        for _ in range(lim):
-            # use gamestate.random_position()
-            new_pos = np.array(
-                [np.random.randint(self._gs.FIELD_MIN_X, self._gs.FIELD_MAX_X),
-                 np.random.randint(self._gs.FIELD_MIN_Y, self._gs.FIELD_MAX_Y),
-                 0.0])
-            if np.random.random() < 0.05:
-                new_pos = goal_pos
-
-            if not self._gs.is_position_open(new_pos, self._team, robot_id, buffer_dist=100) \
-               or tuple(new_pos) in graph:
-                continue
+        "check a linear path for obstacles (other robots)"
+        rrt = RRTPlanner(self._world, self._team, robot_id)
+        return rrt.is_path_blocked(s_pos, g_pos, buffer_dist)
 
-            nearest_pos = self.get_nearest_pos(graph, tuple(new_pos))
-            extend_pos = self.extend(nearest_pos, new_pos, robot_id=robot_id)
-            if extend_pos is None:
-                continue
+    def are_paths_blocked(self, s_positions, g_positions, robot_id, buffer_dist=0):
+        "batched is_path_blocked, for many segments at once"
+        s_positions = [p[:2] for p in s_positions]
+        g_positions = [p[:2] for p in g_positions]
+        rrt = RRTPlanner(self._world, self._team, robot_id)
+        return rrt.are_paths_blocked(s_positions, g_positions, buffer_dist)
 
-            graph[tuple(extend_pos)] = [nearest_pos]
-            graph[nearest_pos].append(tuple(extend_pos))
-            prev[tuple(extend_pos)] = nearest_pos
+    def plan_path(self, start_pos, goal_pos, robot_id, planner='rrt',
+                  lim=1000, time_budget=None, seed_path=None):
+        """Plan a path around the other robots without commanding anything.
+        Returns a PlanResult (waypoints, path length, planning time, etc.) so
+        different planners ('rrt', 'rrt_star', 'informed_rrt_star', or the
+        grid based 'a_star' and 'theta_star') can be compared on the same
+        snapshot."""
+        if planner in GRID_PLANNERS:
+            # (deterministic, so there is nothing to warm start or iterate)
+            return self._nav_grid.plan(self._world, self._team, robot_id,
+                                       start_pos, goal_pos, planner,
+                                       time_budget)
+        rrt = RRTPlanner(self._world, self._team, robot_id)
+        return rrt.plan(start_pos, goal_pos, planner, lim, time_budget, seed_path)
 
-            if np.linalg.norm(extend_pos[:2] - goal_pos[:2]) < self._gs.ROBOT_RADIUS:
-                success = True
-                break
+    def planning_time_left(self, time_budget=None):
+        """Seconds the next planning call may use: the given budget (or the
+        strategy's), capped by what is left of this control loop's shared
+        planning time. None means no limit."""
+        if time_budget is None:
+            time_budget = self._planner_time_budget
+        if self._planning_deadline is not None:
+            remaining = self._planning_deadline - time.perf_counter()
+            if time_budget is None or remaining < time_budget:
+                time_budget = remaining
+        return time_budget
 
-            cnt += 1
+    # generate RRT waypoints
+    def RRT_path_find(self, start_pos, goal_pos, robot_id, lim=1000,
+                      planner='rrt', time_budget=None, seed_path=None):
+        result = self.plan_path(start_pos, goal_pos, robot_id, planner,
+                                lim, time_budget, seed_path)
+        self._last_plan_results[robot_id] = result
+        if result.success:
+            self.set_waypoints(robot_id, result.waypoints)
+        return result.success
 
-        if not success:
-            return success
+    def run_planning_requests(self):
+        """Plan all paths queued by path_find this loop in parallel, on the
+        planner service. Robots whose planning misses the deadline just
+        move straight to their goal for now, robots whose planning failed
+        keep their current path (like path_find)."""
+        if not self._planning_requests:
+            return
+        requests = self._planning_requests
+        self._planning_requests = {}
+        deadline = self.planning_time_left()
+        if deadline is None:
+            deadline = PLANNER_SERVICE_DEADLINE
+        results = self._planner_service.plan_all(
+            self._world, self._team, requests, deadline,
+            self._planner, self._planner_lim
+        )
+        for robot_id, result in results.items():
+            if result is None:
+                # (ran out of time, not known to be blocked)
+                start_pos, goal_pos, _ = requests[robot_id]
+                self.move_straight(robot_id, np.array(goal_pos))
+                continue
+            self._last_plan_results[robot_id] = result
+            if result.success:
+                self.set_waypoints(robot_id, result.waypoints)
 
-        pos = self.get_nearest_pos(graph, goal_pos)  # get nearest position to goal in graph
-        path = []
-        while not (pos[:2] == start_pos[:2]).all():
-            path.append(pos)
-            pos = prev[pos]
-        path.reverse()
+    def repair_path(self, robot_id, waypoints, is_blocked, planner='rrt',
+                    lim=1000, time_budget=None):
+        """Replan only the blocked segments of a path, keeping the rest.
+        waypoints starts with the robot's position, is_blocked says which
+        segments (waypoints[i] -> waypoints[i + 1]) collide.
+        Returns whether every blocked segment could be replaced."""
+        start_time = time.perf_counter()
+        repaired = []
+        for i, waypoint in enumerate(waypoints[1:]):
+            if is_blocked[i]:
+                time_left = None
+                if time_budget is not None:
+                    time_left = time_budget - (time.perf_counter() - start_time)
+                    if time_left <= 0:
+                        return False
+                result = self.plan_path(waypoints[i], waypoint, robot_id,
+                                        planner, lim, time_left)
+                self._last_plan_results[robot_id] = result
+                if not result.success:
+                    return False
+                # (the planned path ends with the waypoint itself)
+                repaired.extend(result.waypoints[:-1])
+            repaired.append(waypoint)
+        self.set_waypoints(robot_id, repaired)
+        return True
 
-        # Smooth path to reduce zig zagging
-        i = 0
-        while i < len(path) - 2:
-            if not self.is_path_blocked(path[i], path[i+2], robot_id):
-                del path[i+1]
-                continue
-            i += 1
-
-        # Cut out the "dead-weight" waypoints
-        for i, pos in enumerate(path):
-            if not self.is_path_blocked(pos, goal_pos, robot_id):
-                path = path[:i+1]
-                break
-
-        self.set_waypoints(robot_id, path + [goal_pos])
-        return success
-
-    # RRT helper
-    def get_nearest_pos(self, graph, new_pos):
-        rtn = None
-        min_dist = float('inf')
-        for pos in graph:
-            dist = np.sqrt((new_pos[0] - pos[0]) ** 2 + (new_pos[1] - pos[1]) ** 2)
-            if dist < min_dist:
-                min_dist = dist
-                rtn = pos
-        return rtn
-
-    # RRT helper
-    def extend(self, s_pos, g_pos, robot_id=None):
-        s_pos = np.array(s_pos)[:2]
-        g_pos = np.array(g_pos)[:2]
-
-        if (g_pos == s_pos).all():
-            return False
-
-        path = g_pos - s_pos
-        norm_path = path / np.linalg.norm(path)
-        STEP_SIZE = self._gs.ROBOT_RADIUS
-
-        # step along the path and check if any points are blocked
-        poses = [None]
-        steps = int(np.floor(np.linalg.norm(path) / STEP_SIZE))
-        for i in range(1, steps + 1):
-            intermediate_pos = s_pos + norm_path * STEP_SIZE * i
-            np.append(intermediate_pos, 0)
-            if not self._gs.is_position_open(intermediate_pos, self._team, robot_id, buffer_dist=100):
-                break
-            if np.linalg.norm(intermediate_pos - s_pos) > 4 * STEP_SIZE:
-                break
-            poses.append(intermediate_pos)
-
-        return poses[-1]
+    def get_last_plan_result(self, robot_id):
+        """PlanResult from the latest time path finding ran for a robot"""
+        return self._last_plan_results.get(robot_id)
@@ -0,0 +1,229 @@
+"""Grid based path planning (A* + any-angle Theta*) for path finding"""
+
+import time
+import math
+import heapq
+import numpy as np
+
+try:
+    from rrt import PlanResult
+except (SystemError, ImportError):
+    from .rrt import PlanResult
+
+# planners supported by NavigationGrid.plan
+GRID_PLANNERS = ('a_star', 'theta_star')
+
+# (dx, dy) of the 8 neighbors of a cell
+NEIGHBORS = ((1, 0), (-1, 0), (0, 1), (0, -1),
+             (1, 1), (1, -1), (-1, 1), (-1, -1))
+
+
+class NavigationGrid(object):
+    """Cost map over the field for deterministic grid search.
+       The static part (field bounds, defense areas, goals) is built once
+       from the field constants, then each planning call overlays the other
+       robots from a snapshot. Cell weights multiply the distance travelled
+       through them, so expensive areas (defense areas, outside the field)
+       are only crossed when there is no reasonable way around.
+    """
+    RESOLUTION = 100  # cell width (mm)
+    # weights of traversing each kind of area (free space is 1)
+    BOUNDARY_COST = 5
+    DEFENSE_AREA_COST = 20
+    # extra space kept from other robots (mm), same as RRT's tree buffer
+    OBSTACLE_BUFFER = 100
+
+    def __init__(self, field):
+        self._robot_radius = field.ROBOT_RADIUS
+        res = self.RESOLUTION
+        # the grid also covers the area between the field lines and the walls
+        margin = field.WALL_MARGIN
+        self._min_x = field.FIELD_MIN_X - margin
+        self._min_y = field.FIELD_MIN_Y - margin
+        self._nx = int(np.ceil((field.FIELD_X_LENGTH + 2 * margin) / res))
+        self._ny = int(np.ceil((field.FIELD_Y_LENGTH + 2 * margin) / res))
+        # x, y of every cell center
+        self._xs = self._min_x + res * (np.arange(self._nx) + .5)
+        self._ys = self._min_y + res * (np.arange(self._ny) + .5)
+        x, y = np.meshgrid(self._xs, self._ys, indexing='ij')
+
+        costs = np.ones((self._nx, self._ny))
+        # robot centers can't get closer than a radius to the walls
+        costs[~((abs(x) <= field.FIELD_MAX_X) & (abs(y) <= field.FIELD_MAX_Y))] = \
+            self.BOUNDARY_COST
+        costs[(abs(x) > field.FIELD_MAX_X + margin - self._robot_radius) |
+              (abs(y) > field.FIELD_MAX_Y + margin - self._robot_radius)] = np.inf
+        for team in ('blue', 'yellow'):
+            min_x, min_y = field.defense_area_corner(team)
+            is_inside = (x >= min_x) & (x <= min_x + field.DEFENSE_AREA_X_LENGTH) & \
+                (y >= min_y) & (y <= min_y + field.DEFENSE_AREA_Y_LENGTH)
+            costs[is_inside] = self.DEFENSE_AREA_COST
+            # goal walls (posts + back), padded by a robot radius
+            goal_top, goal_bottom = field.get_defense_goal(team)
+            goal_x = goal_top[0]
+            back_x = goal_x + np.sign(goal_x) * field.GOAL_DEPTH
+            pad = self._robot_radius
+            is_goal_area = (abs(x) >= abs(goal_x) - pad) & \
+                (abs(x) <= abs(back_x) + pad) & \
+                (abs(y) <= goal_top[1] + pad) & (np.sign(x) == np.sign(goal_x))
+            is_mouth = (abs(x) < abs(back_x) - pad) & \
+                (abs(y) < goal_top[1] - pad)
+            costs[is_goal_area & ~is_mouth] = np.inf
+        self._static_costs = costs
+        self._static_costs.flags.writeable = False
+
+    @property
+    def static_costs(self):
+        return self._static_costs
+
+    def cell(self, pos):
+        """(x, y) index of the cell containing pos (clipped to the grid)"""
+        ix = int((pos[0] - self._min_x) // self.RESOLUTION)
+        iy = int((pos[1] - self._min_y) // self.RESOLUTION)
+        return (min(max(ix, 0), self._nx - 1), min(max(iy, 0), self._ny - 1))
+
+    def cell_center(self, cell):
+        return np.array([self._xs[cell[0]], self._ys[cell[1]]])
+
+    def costs(self, world, team, robot_id):
+        """static cost map with every robot except the given one overlaid"""
+        costs = self._static_costs.copy()
+        radius = self._robot_radius * 2 + self.OBSTACLE_BUFFER
+        reach = int(np.ceil(radius / self.RESOLUTION))
+        for obstacle in world.robot_obstacles(team, robot_id):
+            cx, cy = self.cell(obstacle)
+            x0, x1 = max(cx - reach, 0), min(cx + reach + 1, self._nx)
+            y0, y1 = max(cy - reach, 0), min(cy + reach + 1, self._ny)
+            dx = self._xs[x0:x1, np.newaxis] - obstacle[0]
+            dy = self._ys[np.newaxis, y0:y1] - obstacle[1]
+            block = costs[x0:x1, y0:y1]
+            block[dx * dx + dy * dy < radius ** 2] = np.inf
+        return costs
+
+    def plan(self, world, team, robot_id, start_pos, goal_pos,
+             planner='a_star', time_budget=None):
+        """Search the grid from start to goal and return a PlanResult.
+           'a_star' follows cell centers (8-connected), 'theta_star' (lazy
+           Theta*) connects any cells in line of sight, for shorter paths
+           with fewer waypoints. Same inputs always give the same path.
+        """
+        assert(planner in GRID_PLANNERS)
+        start_time = time.perf_counter()
+        goal_pos = np.array(goal_pos)
+        goal_xy = np.asarray(goal_pos[:2], dtype=float)
+        start_xy = np.asarray(start_pos[:2], dtype=float)
+        costs = self.costs(world, team, robot_id)
+        start, goal = self.cell(start_xy), self.cell(goal_xy)
+        # a robot can always leave the cell it is in
+        if not np.isfinite(costs[start]):
+            costs[start] = self.BOUNDARY_COST
+        path, expansions, num_nodes = self._search(
+            costs, start, goal, planner == 'theta_star',
+            None if time_budget is None else start_time + time_budget
+        )
+        if path is None:
+            return PlanResult(planner, False, [], np.inf,
+                              time.perf_counter() - start_time,
+                              expansions, num_nodes)
+        if planner == 'a_star':
+            path = self._remove_collinear(path)
+        # (leave out the start cell, and end exactly on the goal)
+        waypoints = [self.cell_center(c) for c in path[1:-1]] + [goal_pos]
+        points = np.array([start_xy] + [w[:2] for w in waypoints[:-1]] + [goal_xy])
+        length = np.linalg.norm(np.diff(points, axis=0), axis=1).sum()
+        return PlanResult(planner, True, waypoints, length,
+                          time.perf_counter() - start_time,
+                          expansions, num_nodes)
+
+    def _search(self, costs, start, goal, is_any_angle, deadline):
+        """A* (or lazy Theta*) over cells, returns (path, expansions, nodes)
+           where path is a list of cells from start to goal, or None"""
+        weights = costs.tolist()
+        if math.isinf(weights[goal[0]][goal[1]]):
+            return None, 0, 0
+        nx, ny = self._nx, self._ny
+
+        def heuristic(cell):
+            return math.hypot(cell[0] - goal[0], cell[1] - goal[1])
+
+        def edge_cost(a, b):
+            # weights are >= 1, so distance stays an admissible heuristic
+            return math.hypot(a[0] - b[0], a[1] - b[1]) * \
+                max(weights[a[0]][a[1]], weights[b[0]][b[1]])
+
+        g = {start: 0}
+        parents = {start: start}
+        closed = set()
+        # (f, tie breaker, cell) - ties go to the oldest entry, so the
+        # search order (and path) never depends on anything random
+        counter = 0
+        heap = [(heuristic(start), counter, start)]
+        expansions = 0
+        while heap:
+            if deadline is not None and time.perf_counter() > deadline:
+                return None, expansions, len(g)
+            _, _, cell = heapq.heappop(heap)
+            if cell in closed:
+                continue
+            if is_any_angle and cell != start and \
+               not self._line_of_sight(weights, parents[cell], cell):
+                # lazy Theta*: parent assumed visible was not, fall back to
+                # the best already expanded neighbor
+                best, best_g = None, math.inf
+                for dx, dy in NEIGHBORS:
+                    n = (cell[0] + dx, cell[1] + dy)
+                    if n in closed and g[n] + edge_cost(n, cell) < best_g:
+                        best, best_g = n, g[n] + edge_cost(n, cell)
+                parents[cell], g[cell] = best, best_g
+            closed.add(cell)
+            expansions += 1
+            if cell == goal:
+                path = [cell]
+                while path[-1] != start:
+                    path.append(parents[path[-1]])
+                return path[::-1], expansions, len(g)
+            for dx, dy in NEIGHBORS:
+                n = (cell[0] + dx, cell[1] + dy)
+                if not (0 <= n[0] < nx and 0 <= n[1] < ny) or n in closed:
+                    continue
+                if math.isinf(weights[n[0]][n[1]]):
+                    continue
+                parent = cell
+                if is_any_angle:
+                    # (assume the grandparent is visible, checked on expansion)
+                    parent = parents[cell]
+                new_g = g[parent] + edge_cost(parent, n)
+                if new_g < g.get(n, math.inf):
+                    g[n] = new_g
+                    parents[n] = parent
+                    counter += 1
+                    heapq.heappush(heap, (new_g + heuristic(n), counter, n))
+        return None, expansions, len(g)
+
+    @staticmethod
+    def _line_of_sight(weights, a, b):
+        """whether the straight line a -> b only crosses cells that cost no
+           more than its endpoints (so edge_cost(a, b) is its true cost)"""
+        limit = max(weights[a[0]][a[1]], weights[b[0]][b[1]])
+        dx, dy = b[0] - a[0], b[1] - a[1]
+        # sample twice per cell crossed
+        n = 2 * max(abs(dx), abs(dy))
+        for k in range(1, n):
+            x = int(round(a[0] + dx * k / n))
+            y = int(round(a[1] + dy * k / n))
+            if weights[x][y] > limit:
+                return False
+        return True
+
+    @staticmethod
+    def _remove_collinear(path):
+        """keep only the cells where the path changes direction"""
+        if len(path) < 3:
+            return path
+        kept = [path[0]]
+        for prev, cell, next_cell in zip(path, path[1:], path[2:]):
+            if (cell[0] - prev[0], cell[1] - prev[1]) != \
+               (next_cell[0] - cell[0], next_cell[1] - cell[1]):
+                kept.append(cell)
+        kept.append(path[-1])
+        return kept
@@ -0,0 +1,144 @@
+"""Optional service for planning paths of many robots in parallel"""
+
+import os
+import time
+import pickle
+import concurrent.futures
+import numpy as np
+
+try:
+    from rrt import RRTPlanner
+    from nav_grid import NavigationGrid, GRID_PLANNERS
+except (SystemError, ImportError):
+    from .rrt import RRTPlanner
+    from .nav_grid import NavigationGrid, GRID_PLANNERS
+
+# each worker builds the static navigation grid once, on first use
+_nav_grid = None
+
+
+def _plan_in_worker(world_data, team, requests, planner, lim, end_time):
+    """runs in a worker process - plans paths for some of the robots on the
+    (pickled) snapshot, one after another, stopping by end_time (wall clock,
+    so it means the same in every process).
+    Returns a dict of robot_id : PlanResult (leaving out failed planners)
+    """
+    world = pickle.loads(world_data)
+    # forked workers would otherwise all draw the same random samples
+    np.random.seed()
+    results = dict()
+    for robot_id, (start_pos, goal_pos, seed_path) in requests:
+        # requests queued behind others get whatever time is left
+        time_budget = max(end_time - time.time(), 0)
+        try:
+            results[robot_id] = _plan(world, team, robot_id, start_pos,
+                                      goal_pos, planner, lim, time_budget,
+                                      seed_path)
+        except Exception as e:
+            print("Planner worker failed for robot {}: {}".format(robot_id, e))
+    return results
+
+
+def _warm_up(hold_time):
+    """runs in a worker process - does nothing, but holds the worker for a
+    moment so the pool starts a new process for the next one"""
+    time.sleep(hold_time)
+
+
+def _plan(world, team, robot_id, start_pos, goal_pos, planner, lim,
+          time_budget, seed_path):
+    if planner in GRID_PLANNERS:
+        global _nav_grid
+        if _nav_grid is None:
+            _nav_grid = NavigationGrid(world)
+        return _nav_grid.plan(world, team, robot_id, start_pos, goal_pos,
+                              planner, time_budget)
+    rrt = RRTPlanner(world, team, robot_id)
+    return rrt.plan(start_pos, goal_pos, planner, lim, time_budget, seed_path)
+
+
+class PlannerService(object):
+    """Plans paths for all robots at once on a pool of worker processes,
+       so planning time per control loop is the slowest worker instead of
+       the sum over robots (RRT is pure Python, so threads would not help
+       because of the GIL). The snapshot (obstacle arrays) is pickled once
+       per plan_all, and each worker gets it along with its share of the
+       requests. Results come back as PlanResults.
+    """
+    # time reserved for sending results back from the workers (seconds)
+    TRANSFER_MARGIN = .01
+    # how long each worker is held while starting the pool (seconds)
+    WARM_UP_HOLD_TIME = .05
+
+    def __init__(self, num_workers=None):
+        # (the same default as ProcessPoolExecutor)
+        self._num_workers = num_workers or os.cpu_count() or 1
+        self._executor = None
+        # futures that haven't finished yet (cancelled on stop)
+        self._futures = set()
+
+    def start(self):
+        """Starts the worker processes, returning once they are all up
+        (the pool would otherwise start them on first use, so the first
+        plan_all would miss its deadline for every robot)"""
+        if self._executor is None:
+            self._executor = concurrent.futures.ProcessPoolExecutor(
+                max_workers=self._num_workers
+            )
+            concurrent.futures.wait([
+                self._executor.submit(_warm_up, self.WARM_UP_HOLD_TIME)
+                for _ in range(self._num_workers)
+            ])
+
+    def stop(self):
+        if self._executor is not None:
+            # (shutdown only cancels pending futures itself on python 3.9+)
+            for future in self._futures:
+                future.cancel()
+            self._futures = set()
+            self._executor.shutdown(wait=False)
+            self._executor = None
+
+    def is_running(self):
+        return self._executor is not None
+
+    def plan_all(self, world, team, requests, deadline, planner='rrt',
+                 lim=1000):
+        """Plan every request in parallel, waiting at most deadline seconds.
+        requests is a dict of robot_id : (start_pos, goal_pos, seed_path).
+        Returns a dict of robot_id : PlanResult, or None for robots whose
+        worker missed the deadline (those should fall back to something
+        cheap, like moving straight). Robots whose planner raised an error
+        are left out."""
+        assert(self._executor is not None)
+        start_time = time.perf_counter()
+        # workers stop planning early enough to send results back in time
+        end_time = time.time() + deadline - self.TRANSFER_MARGIN
+        world_data = pickle.dumps(world, pickle.HIGHEST_PROTOCOL)
+        # deal the requests out between the workers
+        items = list(requests.items())
+        futures = {}
+        for i in range(min(self._num_workers, len(items))):
+            batch = items[i::self._num_workers]
+            future = self._executor.submit(
+                _plan_in_worker, world_data, team, batch, planner, lim,
+                end_time
+            )
+            futures[future] = [robot_id for robot_id, _ in batch]
+        # (forgetting finished ones, including any that missed a deadline)
+        self._futures = {f for f in self._futures if not f.done()}
+        self._futures.update(futures)
+        time_left = max(deadline - (time.perf_counter() - start_time), 0)
+        done, not_done = concurrent.futures.wait(futures, timeout=time_left)
+        results = dict()
+        for future in done:
+            try:
+                results.update(future.result())
+            except Exception as e:
+                print("Planner worker failed for robots {}: {}".format(
+                    futures[future], e))
+        for future in not_done:
+            future.cancel()
+            for robot_id in futures[future]:
+                results[robot_id] = None
+        return results
@@ -5,7 +5,7 @@ class Roles:
     """High level strategic roles and analysis"""
     # get behind ball without touching it, to avoid pushing it in
     def get_behind_ball(self):
-        ball_pos = self._gs.get_ball_position()
+        ball_pos = self._world.get_ball_position()
         # TODO, and move to routines!
 
     def goalie(self, robot_id, is_opposite_goal=False):
@@ -14,7 +14,7 @@ class Roles:
         # for demo purposes, allow playing as opposite goalie
         if is_opposite_goal:
             team = 'yellow' if team == 'blue' else 'blue'
-        shot_location = self._gs.is_shot_coming(team)
+        shot_location = self._world.is_shot_coming(team)
         if shot_location is not None:
             # robot goes to ball using to nearest interception point
             # Note that that if the robot CAN intercept the ball, this function
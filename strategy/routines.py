@@ -30,4 +30,4 @@ class Routines:
         # start charging up
         self.charge_up_to(robot_id, charge_during)
         # use more specific condition to check if we're done
-        return self._gs.ball_in_dribbler(self._team, robot_id)
+        return self._world.ball_in_dribbler(self._team, robot_id)
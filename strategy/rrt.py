@@ -0,0 +1,443 @@
+"""Data structures + planners for RRT path planning"""
+
+import time
+import numpy as np
+
+# planners supported by RRTPlanner.plan
+PLANNERS = ('rrt', 'rrt_star', 'informed_rrt_star')
+
+
+class RRTTree(object):
+    """RRT nodes stored in contiguous numpy arrays (position, parent, cost),
+       with a grid bucket index so nearest neighbor lookups only look at the
+       cells around the query instead of every node in the tree.
+    """
+    # below this many nodes a single vectorized scan beats the grid search
+    LINEAR_SCAN_SIZE = 64
+
+    def __init__(self, root, cell_size, capacity=256):
+        self._cell_size = cell_size
+        self._positions = np.zeros((capacity, 2))
+        self._parents = np.full(capacity, -1, dtype=int)
+        self._costs = np.zeros(capacity)  # path length from the root
+        self._children = []  # node : list of child nodes
+        self._size = 0
+        # (cell x, cell y) : list of nodes in that cell
+        self._cells = dict()
+        # range of occupied cells, so searches know when to stop
+        self._min_cell = None
+        self._max_cell = None
+        self.add(root)
+
+    def __len__(self):
+        return self._size
+
+    @property
+    def positions(self):
+        return self._positions[:self._size]
+
+    @property
+    def costs(self):
+        return self._costs[:self._size]
+
+    def position(self, node):
+        return self._positions[node]
+
+    def parent(self, node):
+        return self._parents[node]
+
+    def cost(self, node):
+        return self._costs[node]
+
+    def _cell(self, pos):
+        return (int(np.floor(pos[0] / self._cell_size)),
+                int(np.floor(pos[1] / self._cell_size)))
+
+    def add(self, pos, parent=-1):
+        """add a node (as a child of parent), returns its index"""
+        if self._size == len(self._positions):
+            # grow all arrays by doubling, so adding stays O(1) amortized
+            capacity = 2 * len(self._positions)
+            self._positions = np.resize(self._positions, (capacity, 2))
+            self._parents = np.resize(self._parents, capacity)
+            self._costs = np.resize(self._costs, capacity)
+        node = self._size
+        self._positions[node] = pos[:2]
+        self._parents[node] = parent
+        self._costs[node] = 0
+        if parent >= 0:
+            self._costs[node] = self._costs[parent] + \
+                np.linalg.norm(self._positions[node] - self._positions[parent])
+            self._children[parent].append(node)
+        self._children.append([])
+        self._size += 1
+        cell = self._cell(pos)
+        self._cells.setdefault(cell, []).append(node)
+        if self._min_cell is None:
+            self._min_cell = self._max_cell = cell
+        else:
+            self._min_cell = (min(self._min_cell[0], cell[0]),
+                              min(self._min_cell[1], cell[1]))
+            self._max_cell = (max(self._max_cell[0], cell[0]),
+                              max(self._max_cell[1], cell[1]))
+        return node
+
+    def nearest(self, pos):
+        """index of the node closest to pos"""
+        pos = np.asarray(pos[:2], dtype=float)
+        if self._size <= self.LINEAR_SCAN_SIZE:
+            delta = self.positions - pos
+            return int(np.argmin((delta * delta).sum(axis=1)))
+        cell_x, cell_y = self._cell(pos)
+        # farthest ring of cells that can contain any nodes
+        max_ring = max(abs(cell_x - self._min_cell[0]),
+                       abs(cell_x - self._max_cell[0]),
+                       abs(cell_y - self._min_cell[1]),
+                       abs(cell_y - self._max_cell[1]))
+        best_node, best_distance = None, float('inf')
+        for ring in range(max_ring + 1):
+            nodes = []
+            for cell in self._ring_cells(cell_x, cell_y, ring):
+                nodes.extend(self._cells.get(cell, ()))
+            if nodes:
+                delta = self._positions[nodes] - pos
+                distances = np.sqrt((delta * delta).sum(axis=1))
+                i = int(np.argmin(distances))
+                if distances[i] < best_distance:
+                    best_node, best_distance = nodes[i], distances[i]
+            # anything in the next ring is at least this far away
+            if best_distance <= ring * self._cell_size:
+                break
+        return best_node
+
+    def near(self, pos, radius):
+        """indices of all nodes within radius of pos"""
+        pos = np.asarray(pos[:2], dtype=float)
+        cell_x, cell_y = self._cell(pos)
+        reach = int(np.ceil(radius / self._cell_size))
+        nodes = []
+        for dx in range(-reach, reach + 1):
+            for dy in range(-reach, reach + 1):
+                nodes.extend(self._cells.get((cell_x + dx, cell_y + dy), ()))
+        if not nodes:
+            return []
+        delta = self._positions[nodes] - pos
+        is_near = (delta * delta).sum(axis=1) <= radius ** 2
+        return [node for node, near in zip(nodes, is_near) if near]
+
+    def set_parent(self, node, parent):
+        """rewire node to a new parent, updating costs of its whole subtree"""
+        old_parent = self._parents[node]
+        if old_parent >= 0:
+            self._children[old_parent].remove(node)
+        self._parents[node] = parent
+        self._children[parent].append(node)
+        stack = [node]
+        while stack:
+            n = stack.pop()
+            p = self._parents[n]
+            self._costs[n] = self._costs[p] + \
+                np.linalg.norm(self._positions[n] - self._positions[p])
+            stack.extend(self._children[n])
+
+    def path_to(self, node):
+        """list of node positions from the root to the given node"""
+        path = []
+        while node >= 0:
+            path.append(self._positions[node].copy())
+            node = self._parents[node]
+        path.reverse()
+        return path
+
+    @staticmethod
+    def _ring_cells(cell_x, cell_y, ring):
+        if ring == 0:
+            yield (cell_x, cell_y)
+            return
+        for d in range(-ring, ring + 1):
+            yield (cell_x + d, cell_y - ring)
+            yield (cell_x + d, cell_y + ring)
+        for d in range(-ring + 1, ring):
+            yield (cell_x - ring, cell_y + d)
+            yield (cell_x + ring, cell_y + d)
+
+
+class PlanResult(object):
+    """Outcome of a path planning call, for comparing planners"""
+    def __init__(self, planner, success, waypoints, length, planning_time,
+                 iterations, num_nodes):
+        self.planner = planner
+        self.success = success
+        # waypoints (x, y) to follow after the start, ending at the goal
+        self.waypoints = waypoints
+        self.length = length  # total path length (mm), inf if no path
+        self.planning_time = planning_time  # seconds
+        self.iterations = iterations
+        self.num_nodes = num_nodes
+
+    def __str__(self):
+        return "{}: success: {}, length: {:.0f}, time: {:.4f}s, " \
+            "iterations: {}, nodes: {}".format(
+                self.planner, self.success, self.length, self.planning_time,
+                self.iterations, self.num_nodes)
+
+
+class RRTPlanner(object):
+    """Plans a path for one robot around all other robots in a snapshot.
+       Only reads from the snapshot, so it can run anywhere (even in another
+       process) as long as the snapshot comes along.
+    """
+    # RRT nodes are bucketed in cells about as wide as one extend step
+    CELL_SIZE = 500
+    # chance of sampling the goal directly instead of a random position
+    GOAL_SAMPLE_RATE = .05
+    # extra space kept from other robots while growing the tree (mm)
+    TREE_BUFFER = 100
+    # RRT* rewiring radius shrinks as the tree grows:
+    # min(REWIRE_GAMMA * sqrt(log(n) / n), MAX_REWIRE_RADIUS)
+    REWIRE_GAMMA = 10000
+    MAX_REWIRE_RADIUS = 1000
+
+    def __init__(self, world, team, robot_id):
+        self._world = world
+        self._team = team
+        self._robot_id = robot_id
+        self._obstacles = world.robot_obstacles(team, robot_id)
+        self._step_size = world.ROBOT_RADIUS
+        # only grow the tree a few steps at a time
+        self._max_extend_distance = 4 * self._step_size
+
+    def _free_lengths(self, starts, ends, buffer_dist):
+        radius = self._world.ROBOT_RADIUS * 2 + buffer_dist
+        return self._world.segment_free_lengths(starts, ends, self._obstacles, radius)
+
+    def is_path_blocked(self, s_pos, g_pos, buffer_dist=0):
+        s_pos = np.asarray(s_pos[:2], dtype=float)
+        g_pos = np.asarray(g_pos[:2], dtype=float)
+        free_length = self._free_lengths(s_pos, g_pos, buffer_dist)[0]
+        return free_length < np.linalg.norm(g_pos - s_pos)
+
+    def are_paths_blocked(self, s_positions, g_positions, buffer_dist=0):
+        s_positions = np.asarray(s_positions, dtype=float).reshape(-1, 2)
+        g_positions = np.asarray(g_positions, dtype=float).reshape(-1, 2)
+        free_lengths = self._free_lengths(s_positions, g_positions, buffer_dist)
+        return free_lengths < np.linalg.norm(g_positions - s_positions, axis=1)
+
+    def extend(self, s_pos, g_pos):
+        """farthest point towards g_pos (within a few steps) that is free"""
+        s_pos = np.asarray(s_pos[:2], dtype=float)
+        g_pos = np.asarray(g_pos[:2], dtype=float)
+        if (g_pos == s_pos).all():
+            return None
+        path = g_pos - s_pos
+        distance = np.linalg.norm(path)
+        if distance > self._max_extend_distance:
+            g_pos = s_pos + path / distance * self._max_extend_distance
+            distance = self._max_extend_distance
+        # go as far as possible towards the goal before hitting anything
+        free_length = self._free_lengths(s_pos, g_pos, self.TREE_BUFFER)[0]
+        if free_length < self._step_size:
+            return None
+        return s_pos + (g_pos - s_pos) / distance * free_length
+
+    def sample(self, start_pos, goal_pos, best_cost=np.inf):
+        """random (x, y) position to grow towards; once a path is known
+           (informed mode), only samples where a shorter path could go"""
+        world = self._world
+        if np.random.random() < self.GOAL_SAMPLE_RATE:
+            return goal_pos.copy()
+        if np.isfinite(best_cost):
+            return self._sample_ellipse(start_pos, goal_pos, best_cost)
+        return np.array([
+            np.random.uniform(world.FIELD_MIN_X, world.FIELD_MAX_X),
+            np.random.uniform(world.FIELD_MIN_Y, world.FIELD_MAX_Y),
+        ])
+
+    def _sample_ellipse(self, start_pos, goal_pos, best_cost):
+        # ellipse with start + goal at the foci, where every point on the
+        # boundary has start -> point -> goal length equal to best_cost
+        min_cost = np.linalg.norm(goal_pos - start_pos)
+        center = (start_pos + goal_pos) / 2
+        major = best_cost / 2
+        minor = np.sqrt(max(best_cost ** 2 - min_cost ** 2, 0)) / 2
+        dx, dy = goal_pos - start_pos
+        angle = np.arctan2(dy, dx)
+        # uniform point in unit disc
+        r = np.sqrt(np.random.random())
+        theta = np.random.uniform(0, 2 * np.pi)
+        x, y = r * np.cos(theta) * major, r * np.sin(theta) * minor
+        return center + np.array([
+            x * np.cos(angle) - y * np.sin(angle),
+            x * np.sin(angle) + y * np.cos(angle),
+        ])
+
+    def _rewire_radius(self, num_nodes):
+        if num_nodes < 2:
+            return self.MAX_REWIRE_RADIUS
+        radius = self.REWIRE_GAMMA * np.sqrt(np.log(num_nodes) / num_nodes)
+        return min(radius, self.MAX_REWIRE_RADIUS)
+
+    def plan(self, start_pos, goal_pos, planner='rrt', lim=1000,
+             time_budget=None, seed_path=None):
+        """Grow a tree from start to goal and return a smoothed PlanResult.
+           'rrt' returns the first path found. 'rrt_star' keeps going for all
+           lim iterations (or until time_budget seconds are used up),
+           choosing the cheapest parents and rewiring the tree to shorten
+           paths. 'informed_rrt_star' also restricts sampling to where a
+           shorter path is possible once one is found.
+           seed_path (e.g. the robot's current waypoints) warm starts the
+           tree: its collision free beginning is added before sampling, so
+           a still valid path is returned right away (and improved on).
+        """
+        assert(planner in PLANNERS)
+        start_time = time.perf_counter()
+        goal_pos = np.array(goal_pos)
+        start_pos = np.array(start_pos)
+        # (goal angle may be None, so only use x, y for the search)
+        goal_xy = np.asarray(goal_pos[:2], dtype=float)
+        start_xy = np.asarray(start_pos[:2], dtype=float)
+        is_star = planner != 'rrt'
+        is_informed = planner == 'informed_rrt_star'
+        tree = RRTTree(start_xy, self.CELL_SIZE)
+        goal_radius = self._world.ROBOT_RADIUS
+        goal_node = None
+        if seed_path is not None:
+            goal_node = self._add_seed_path(tree, seed_path, goal_xy)
+        best_cost = np.inf
+        if goal_node is not None:
+            best_cost = tree.cost(goal_node) + \
+                np.linalg.norm(tree.position(goal_node) - goal_xy)
+            if not is_star:
+                lim = 0
+        iterations = 0
+        while iterations < lim:
+            if time_budget is not None and \
+               time.perf_counter() - start_time > time_budget:
+                break
+            iterations += 1
+            new_pos = self.sample(
+                start_xy, goal_xy, best_cost if is_informed else np.inf
+            )
+            if not self._world.is_position_open(
+                    new_pos, self._team, self._robot_id,
+                    buffer_dist=self.TREE_BUFFER):
+                continue
+
+            nearest = tree.nearest(new_pos)
+            nearest_pos = tree.position(nearest)
+            # skip positions that are already in the tree
+            if (nearest_pos == new_pos).all():
+                continue
+            extend_pos = self.extend(nearest_pos, new_pos)
+            if extend_pos is None:
+                continue
+
+            parent = nearest
+            near = []
+            if is_star:
+                near = tree.near(extend_pos, self._rewire_radius(len(tree)))
+                parent = self._choose_parent(tree, near, nearest, extend_pos)
+            node = tree.add(extend_pos, parent)
+            if is_star:
+                self._rewire(tree, near, node)
+
+            if np.linalg.norm(extend_pos - goal_xy) < goal_radius:
+                if not is_star:
+                    goal_node = node
+                    break
+                if goal_node is None or tree.cost(node) < tree.cost(goal_node):
+                    goal_node = node
+            if goal_node is not None:
+                # (rewiring may have shortened the best path)
+                best_cost = tree.cost(goal_node) + \
+                    np.linalg.norm(tree.position(goal_node) - goal_xy)
+
+        if goal_node is None:
+            return PlanResult(planner, False, [], np.inf,
+                              time.perf_counter() - start_time,
+                              iterations, len(tree))
+        # (leave out the start position)
+        path = self.smooth(tree.path_to(goal_node)[1:], goal_xy)
+        waypoints = path + [goal_pos]
+        points = np.array([start_xy] + [p[:2] for p in path] + [goal_xy])
+        length = np.linalg.norm(np.diff(points, axis=0), axis=1).sum()
+        return PlanResult(planner, True, waypoints, length,
+                          time.perf_counter() - start_time,
+                          iterations, len(tree))
+
+    def _add_seed_path(self, tree, seed_path, goal_pos):
+        """add the collision free start of seed_path to the tree as a chain
+           from the root, returns the node reaching the goal (if any)"""
+        goal_radius = self._world.ROBOT_RADIUS
+        node = 0
+        for pos in seed_path:
+            pos = np.asarray(pos[:2], dtype=float)
+            if (pos == tree.position(node)).all():
+                continue
+            if self.is_path_blocked(tree.position(node), pos):
+                return None
+            node = tree.add(pos, node)
+            if np.linalg.norm(pos - goal_pos) < goal_radius:
+                return node
+        return None
+
+    def _choose_parent(self, tree, near, nearest, pos):
+        """cheapest node (by cost to reach pos) that can reach pos directly"""
+        candidates = [n for n in near if n != nearest]
+        if not candidates:
+            return nearest
+        candidate_positions = tree.positions[candidates]
+        is_blocked = self.are_paths_blocked(
+            candidate_positions, np.tile(pos, (len(candidates), 1)),
+            self.TREE_BUFFER
+        )
+        costs = tree.costs[candidates] + \
+            np.linalg.norm(candidate_positions - pos, axis=1)
+        costs[is_blocked] = np.inf
+        best = int(np.argmin(costs))
+        nearest_cost = tree.cost(nearest) + \
+            np.linalg.norm(tree.position(nearest) - pos)
+        if costs[best] < nearest_cost:
+            return candidates[best]
+        return nearest
+
+    def _rewire(self, tree, near, node):
+        """reroute near nodes through node wherever that is cheaper"""
+        candidates = [n for n in near if n != tree.parent(node)]
+        if not candidates:
+            return
+        pos = tree.position(node)
+        candidate_positions = tree.positions[candidates]
+        new_costs = tree.cost(node) + \
+            np.linalg.norm(candidate_positions - pos, axis=1)
+        is_cheaper = new_costs < tree.costs[candidates]
+        if not is_cheaper.any():
+            return
+        candidates = [n for n, c in zip(candidates, is_cheaper) if c]
+        is_blocked = self.are_paths_blocked(
+            np.tile(pos, (len(candidates), 1)), tree.positions[candidates],
+            self.TREE_BUFFER
+        )
+        for candidate, blocked in zip(candidates, is_blocked):
+            if not blocked:
+                tree.set_parent(candidate, node)
+
+    def smooth(self, path, goal_pos):
+        """remove zig zags + waypoints that aren't needed to reach the goal
+           (path is a list of (x, y) positions, goal_pos is (x, y))"""
+        path = list(path)
+        # Smooth path to reduce zig zagging
+        i = 0
+        while i < len(path) - 2:
+            if not self.is_path_blocked(path[i], path[i+2]):
+                del path[i+1]
+                continue
+            i += 1
+        # Cut out the "dead-weight" waypoints
+        if path:
+            is_blocked = self.are_paths_blocked(
+                path, np.tile(goal_pos, (len(path), 1))
+            )
+            if not is_blocked.all():
+                path = path[:np.argmin(is_blocked) + 1]
+        return path
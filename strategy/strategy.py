@@ -2,11 +2,18 @@ import threading
 import traceback
 import numpy as np
 import time
+from comms import RobotDynamics
+
+# fraction of each control loop that path planning may take up
+# (shared between all robots planning in the same loop)
+PLANNING_TIME_FRACTION = .5
 
 # import lower-level strategy logic that we've separated for readability
 try:
     from utils import Utils
     from analysis import Analysis
+    from planner_service import PlannerService
+    from nav_grid import NavigationGrid
     from actions import Actions
     from routines import Routines
     from roles import Roles
@@ -18,6 +25,8 @@ except (SystemError, ImportError):
     from .routines import Routines
     from .roles import Roles
     from .analysis import Analysis
+    from .planner_service import PlannerService
+    from .nav_grid import NavigationGrid
     from .coaches import *
     from .plays import Plays
 
@@ -33,7 +42,11 @@ class Strategy(Utils, Analysis, Actions, Routines, Roles, Plays):
         self._is_controlling = False
         self._control_thread = None
         self._control_loop_sleep = None
+        self._wait_for_vision = False
         self._last_control_loop_time = None
+        # (gamestate clock) time of the last tick, for how long commands
+        # from each tick are followed
+        self._last_tick_time = None
         self._mode = None
         self._goalie_id = goalie_id
 
@@ -41,10 +54,32 @@ class Strategy(Utils, Analysis, Actions, Routines, Roles, Plays):
         # (this also helps reduce oscillation)
         self._last_RRT_times = {}  # robot_id : timestamp
 
-    def start_controlling(self, mode, loop_sleep):
-        """Spins up control thread specified by mode, to command the robots"""
-        self._mode = mode
-        self._control_loop_sleep = loop_sleep
+        # how our robots follow commands, for predicting where they'll be
+        self._dynamics = RobotDynamics()
+
+        # path planning settings (see set_planner)
+        self._planner = 'rrt'
+        self._planner_lim = 1000
+        self._planner_time_budget = None
+        self._last_plan_results = {}  # robot_id : PlanResult
+        # time (perf_counter) when planning must stop for this control loop
+        self._planning_deadline = None
+        # optional pool of planning processes (see use_planner_service)
+        self._planner_service = None
+        self._planning_requests = {}  # robot_id : (start, goal, seed_path)
+
+        # read-only copy of the world, refreshed once at the start of each
+        # control loop so every calculation in a tick sees the same data
+        self._world = gamestate.snapshot()
+        # static field costs for the grid planners, built once
+        self._nav_grid = NavigationGrid(self._world)
+
+    def start_controlling(self, mode, loop_sleep, wait_for_vision=False):
+        """Spins up control thread specified by mode, to command the robots
+        If wait_for_vision, each loop starts as soon as new vision data
+        arrives (waiting at most loop_sleep) instead of sleeping loop_sleep"""
+        self.set_mode(mode, loop_sleep)
+        self._wait_for_vision = wait_for_vision
         self._is_controlling = True
         self._control_thread = threading.Thread(target=self.control_loop)
         # set to daemon mode so it will be easily killed
@@ -69,45 +104,49 @@ class Strategy(Utils, Analysis, Actions, Routines, Roles, Plays):
 
         if self._mode == "entry_video":
             print("2020 Registration Video Procedure!")
-            self.video_phase = 1
 
         if self._mode == "full_game":
             print("default strategy for playing a full game")
 
+    def set_mode(self, mode, loop_sleep):
+        """Choose the strategy to run each tick, and how often ticks happen
+        (without starting the control thread, e.g. to call tick directly)"""
+        self._mode = mode
+        self._control_loop_sleep = loop_sleep
+        if self._mode == "entry_video":
+            self.video_phase = 1
+
+    def set_planner(self, planner, lim=1000, time_budget=None):
+        """Choose the path planner used by path_find
+        ('rrt', 'rrt_star', 'informed_rrt_star', 'a_star' or 'theta_star'),
+        with its iteration limit (RRT only) and time budget (seconds) per
+        planning call."""
+        self._planner = planner
+        self._planner_lim = lim
+        self._planner_time_budget = time_budget
+
+    def use_planner_service(self, num_workers=None):
+        """Plan paths for all robots in parallel on worker processes.
+        path_find then queues its planning, which runs for all robots at
+        once at the end of each control loop."""
+        if self._planner_service is None:
+            self._planner_service = PlannerService(num_workers)
+        self._planner_service.start()
+
     def stop_controlling(self):
         if self._is_controlling:
             self._is_controlling = False
             self._control_thread.join()
             self._control_thread = None
+        if self._planner_service is not None:
+            self._planner_service.stop()
 
     def control_loop(self):
         # wait until game begins (while other threads are initializing)
         self._gs.wait_until_game_begins()
         try:
             while self._is_controlling:
-                # run the strategy corresponding to the given mode
-                if self._mode == "UI":
-                    self.UI()
-                elif self._mode == "goalie_test":
-                    self.goalie_test()
-                elif self._mode == "entry_video":
-                    self.entry_video()
-                elif self._mode == "full_game":
-                    self.full_game()
-                else:
-                    print('(unrecognized mode, doing nothing)')
-
-                # tell all robots to refresh their speeds based on waypoints
-                team_commands = self._gs.get_team_commands(self._team)
-                team_commands = list(team_commands.items())
-                for robot_id, robot_commands in team_commands:
-                    # stop the robot if we've lost track of it
-                    if self._gs.is_robot_lost(self._team, robot_id):
-                        robot_commands.set_speeds(0, 0, 0)
-                    else:
-                        # recalculate the speed the robot should be commanded at
-                        pos = self._gs.get_robot_position(self._team, robot_id)
-                        robot_commands.derive_speeds(pos)
+                self.tick()
 
                 if self._last_control_loop_time is not None:
                     delta = time.time() - self._last_control_loop_time
@@ -115,11 +154,57 @@ class Strategy(Utils, Analysis, Actions, Routines, Roles, Plays):
                         print("Control loop large delay: " + str(delta))
                 self._last_control_loop_time = time.time()
                 # yield to other threads
-                time.sleep(self._control_loop_sleep)
+                if self._wait_for_vision:
+                    self._gs.wait_for_vision_update(self._control_loop_sleep)
+                else:
+                    self._gs.clock.sleep(self._control_loop_sleep)
         except Exception:
             print('Unexpected Error!')
             print(traceback.format_exc())
 
+    def tick(self, is_planning_time_limited=True):
+        """Run the strategy once on the latest gamestate, and refresh the
+        commands of all our robots. Without the planning time limit,
+        planners always run to their iteration limits (so results don't
+        depend on how fast the computer is)."""
+        self._world = self._gs.snapshot()
+        # time since the last tick (ticks can come much more often than the
+        # loop sleep, e.g. once per vision frame)
+        now = self._gs.clock.time()
+        tick_time = self._control_loop_sleep
+        if self._last_tick_time is not None:
+            tick_time = min(now - self._last_tick_time, tick_time)
+        self._last_tick_time = now
+        self._planning_deadline = None
+        if is_planning_time_limited:
+            self._planning_deadline = time.perf_counter() + \
+                self._control_loop_sleep * PLANNING_TIME_FRACTION
+        # run the strategy corresponding to the given mode
+        if self._mode == "UI":
+            self.UI()
+        elif self._mode == "goalie_test":
+            self.goalie_test()
+        elif self._mode == "entry_video":
+            self.entry_video()
+        elif self._mode == "full_game":
+            self.full_game()
+        else:
+            print('(unrecognized mode, doing nothing)')
+        # plan any queued paths (if using the planner service)
+        self.run_planning_requests()
+
+        # tell all robots to refresh their speeds based on waypoints
+        team_commands = self._gs.get_team_commands(self._team)
+        team_commands = list(team_commands.items())
+        for robot_id, robot_commands in team_commands:
+            # stop the robot if we've lost track of it
+            if self._world.is_robot_lost(self._team, robot_id):
+                robot_commands.set_speeds(0, 0, 0)
+            else:
+                # recalculate the speed the robot should be commanded at
+                pos = self._world.get_robot_position(self._team, robot_id)
+                robot_commands.derive_speeds(pos, tick_time)
+
     # follow the user-input commands through visualizer
     def UI(self):
         gs = self._gs
@@ -208,7 +293,7 @@ class Strategy(Utils, Analysis, Actions, Routines, Roles, Plays):
             self.video_phase += 1
             print("Moving to video phase {}".format(self.video_phase))
         elif self.video_phase == 7:
-            if self._gs.get_ball_position()[0] > 3000:
+            if self._world.get_ball_position()[0] > 3000:
                 return
             # Wait for person to place a ball, then have robot 1 go to it
             got_ball = self.get_ball(robot_id_0, charge_during=shoot_velocity)
@@ -230,7 +315,7 @@ class Strategy(Utils, Analysis, Actions, Routines, Roles, Plays):
             self.video_phase += 1
             print("Moving to video phase {}".format(self.video_phase))
         elif self.video_phase == 10:
-            if self._gs.get_ball_position()[0] > 3000:
+            if self._world.get_ball_position()[0] > 3000:
                 self.video_phase = 7
                 print("Moving back to video phase {}".format(self.video_phase))
         else:
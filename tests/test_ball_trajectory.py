@@ -0,0 +1,104 @@
+import numpy as np
+import pytest
+from gamestate.ball_trajectory import BallTrajectory
+
+DECELERATION = 350
+
+
+def test_rolls_to_a_stop():
+    trajectory = BallTrajectory([0, 0], [700, 0], DECELERATION)
+    assert trajectory.stop_time == pytest.approx(2)
+    assert trajectory.stop_distance == pytest.approx(700)
+    np.testing.assert_allclose(trajectory.stop_position(), [700, 0])
+    np.testing.assert_allclose(trajectory.positions_at([1, 2, 5]),
+                               [[525, 0], [700, 0], [700, 0]])
+    np.testing.assert_allclose(trajectory.velocities_at(1), [350, 0])
+    assert trajectory.time_at_distance(525) == pytest.approx(1)
+    assert trajectory.time_at_distance(701) is None
+
+
+def test_still_ball():
+    trajectory = BallTrajectory([10, 20], [0, 0], DECELERATION)
+    assert not trajectory.is_moving()
+    np.testing.assert_allclose(trajectory.position_at(3), [10, 20])
+    np.testing.assert_allclose(trajectory.velocities_at(3), [0, 0])
+
+
+def test_line_crossing_and_exit():
+    trajectory = BallTrajectory([0, 0], [700, 0], DECELERATION)
+    crossing_time, crossing_pos = trajectory.line_crossing([525, -100],
+                                                           [525, 100])
+    assert crossing_time == pytest.approx(1)
+    np.testing.assert_allclose(crossing_pos, [525, 0])
+    assert trajectory.line_crossing([800, -100], [800, 100]) is None
+    assert trajectory.exit_time(-1000, 525, -1000, 1000) == pytest.approx(1)
+
+
+def test_still_ball_intercept():
+    # robots just go to where it is
+    trajectory = BallTrajectory([10, 20], [0, 0], DECELERATION)
+    earliest, latest = trajectory.intercept_windows([[10, 520]], 250)
+    assert earliest[0] == pytest.approx(2)
+    assert latest[0] == pytest.approx(2)
+
+
+def brute_force_windows(trajectory, positions, max_speeds, horizon):
+    """first + last times of the first reachable window, from dense samples"""
+    times = np.arange(0, horizon, .0005)
+    is_reachable = trajectory._reach_margins(
+        positions, max_speeds, np.tile(times, (len(positions), 1))) >= 0
+    windows = []
+    for robot_reachable in is_reachable:
+        if not robot_reachable.any():
+            windows.append(None)
+            continue
+        first = np.argmax(robot_reachable)
+        lost = np.flatnonzero(~robot_reachable[first:])
+        last = times[first + lost[0] - 1] if len(lost) else horizon
+        windows.append((times[first], last))
+    return windows
+
+
+@pytest.mark.parametrize('end_time', [None, 1.5])
+def test_intercept_windows_match_brute_force(end_time):
+    rng = np.random.RandomState(1)
+    for _ in range(200):
+        trajectory = BallTrajectory(rng.uniform(-4000, 4000, 2),
+                                    rng.uniform(-6000, 6000, 2), DECELERATION)
+        positions = rng.uniform(-4000, 4000, (5, 2))
+        max_speeds = rng.uniform(200, 1500, 5)
+        earliest, latest = trajectory.intercept_windows(positions, max_speeds,
+                                                        end_time)
+        horizon = trajectory.stop_time
+        if end_time is not None:
+            horizon = min(horizon, end_time)
+        windows = brute_force_windows(trajectory, positions, max_speeds,
+                                      horizon)
+        for i, window in enumerate(windows):
+            if window is None:
+                continue
+            assert earliest[i] == pytest.approx(window[0], abs=.002)
+            assert latest[i] == pytest.approx(window[1], abs=.002)
+
+
+def test_short_window_as_the_ball_passes():
+    # a slow robot just off a fast ball's path can only touch it briefly
+    trajectory = BallTrajectory([0, 0], [5000, 0], DECELERATION)
+    positions = np.array([[2000, 162]])
+    max_speeds = np.array([400])
+    earliest, latest = trajectory.intercept_windows(positions, max_speeds)
+    window = brute_force_windows(trajectory, positions, max_speeds,
+                                 trajectory.stop_time)[0]
+    assert window is not None and window[1] - window[0] < .01
+    assert earliest[0] == pytest.approx(window[0], abs=.002)
+    assert latest[0] == pytest.approx(window[1], abs=.002)
+
+
+def test_too_slow_robots_meet_the_ball_where_it_stops():
+    trajectory = BallTrajectory([0, 0], [700, 0], DECELERATION)
+    earliest, latest = trajectory.intercept_windows([[700, 2000]], 100)
+    assert earliest[0] == pytest.approx(20)
+    assert latest[0] == pytest.approx(20)
+    # (unless it leaves the field first)
+    earliest, latest = trajectory.intercept_windows([[700, 2000]], 100, 1)
+    assert np.isnan(earliest[0]) and np.isnan(latest[0])
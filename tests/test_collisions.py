@@ -0,0 +1,104 @@
+import numpy as np
+import pytest
+from gamestate import GameState, VirtualClock
+from gamestate.ball_trajectory import BallTrajectory
+from gamestate.collisions import robot_impacts, segment_impacts, \
+    ball_overlaps, bounce
+from simulator import Simulator
+
+ROBOT_RADIUS = GameState.ROBOT_RADIUS
+DRIBBLER_RADIUS = GameState.ROBOT_DRIBBLER_RADIUS
+BALL_RADIUS = GameState.BALL_RADIUS
+
+
+def impacts(start, direction, robot_positions):
+    return robot_impacts(start, direction, robot_positions, ROBOT_RADIUS,
+                         DRIBBLER_RADIUS, BALL_RADIUS)
+
+
+def test_robot_back_and_front():
+    robots = np.array([[0, 0, 0], [0, 0, np.pi]])
+    distances, normals = impacts([-500, 0], [1, 0], robots)
+    # the back of the first robot is round, the second faces the ball
+    np.testing.assert_allclose(distances, [500 - ROBOT_RADIUS - BALL_RADIUS,
+                                           500 - DRIBBLER_RADIUS - BALL_RADIUS])
+    np.testing.assert_allclose(normals, [[-1, 0], [-1, 0]], atol=1e-12)
+
+
+def test_robot_misses():
+    robots = np.array([[0, 0, 0]])
+    # passing by, already past, and leaving from touching it
+    distances, _ = impacts([-500, ROBOT_RADIUS + BALL_RADIUS + 1], [1, 0],
+                           robots)
+    assert distances[0] == np.inf
+    distances, _ = impacts([500, 0], [1, 0], robots)
+    assert distances[0] == np.inf
+    distances, _ = impacts([-ROBOT_RADIUS - BALL_RADIUS, 0], [-1, 0], robots)
+    assert distances[0] == np.inf
+
+
+def test_batched_starts():
+    robots = np.array([[0, 0, 0]])
+    starts = np.array([[-500, 0], [0, -400]])
+    directions = np.array([[1, 0], [0, 1]])
+    distances, normals = impacts(starts, directions, robots)
+    assert distances.shape == (2, 1)
+    assert normals.shape == (2, 1, 2)
+    np.testing.assert_allclose(distances[:, 0],
+                               [500 - ROBOT_RADIUS - BALL_RADIUS,
+                                400 - ROBOT_RADIUS - BALL_RADIUS])
+
+
+def test_segments():
+    walls = np.array([[[1000, -500], [1000, 500]]])
+    distances, normals = segment_impacts([0, 0], [1, 0], walls, BALL_RADIUS)
+    assert distances[0] == pytest.approx(1000 - BALL_RADIUS)
+    np.testing.assert_allclose(normals[0], [-1, 0])
+    # just past the end, the ball clips the rounded corner
+    start = [0, 500 + BALL_RADIUS / 2]
+    distances, normals = segment_impacts(start, [1, 0], walls, BALL_RADIUS)
+    assert 1000 - BALL_RADIUS < distances[0] < 1000
+    assert normals[0][0] < 0 and normals[0][1] > 0
+    distances, _ = segment_impacts([0, 600], [1, 0], walls, BALL_RADIUS)
+    assert distances[0] == np.inf
+
+
+def test_impact_time_along_trajectory():
+    # (distance to impact, then when the ball gets there as it slows down)
+    trajectory = BallTrajectory([-1000, 0], [2000, 0],
+                                GameState.BALL_DECCELERATION)
+    distances, _ = impacts(trajectory.position, trajectory.direction,
+                           np.array([[0, 0, 0]]))
+    hit_time = trajectory.time_at_distance(distances[0])
+    hit_pos = trajectory.position_at(hit_time)
+    assert np.linalg.norm(hit_pos) == pytest.approx(ROBOT_RADIUS + BALL_RADIUS)
+
+
+def test_bounce():
+    velocities = np.array([[3, -4.], [3, 4.]])
+    normal = np.array([0, 1.])
+    np.testing.assert_allclose(bounce(velocities, normal, 1),
+                               [[3, 4], [3, 4]])
+    np.testing.assert_allclose(bounce(velocities, normal, 0),
+                               [[3, 0], [3, 4]])
+
+
+def test_ball_overlaps():
+    robots = np.array([[0, 0, 0], [1000, 0, 0]])
+    overlaps, is_front = ball_overlaps([DRIBBLER_RADIUS, 0], robots,
+                                       ROBOT_RADIUS, DRIBBLER_RADIUS,
+                                       BALL_RADIUS)
+    np.testing.assert_allclose(overlaps, [[BALL_RADIUS, 0], [0, 0]])
+    assert is_front[0]
+
+
+def test_fast_ball_does_not_skip_through_robots():
+    gamestate = GameState(VirtualClock(10.))
+    simulator = Simulator(gamestate, physics_step=.1)
+    simulator.put_fake_robot('blue', 0, np.array([0., 0., 0.]))
+    simulator.put_fake_ball(np.array([-400., 0.]), np.array([6000., 0.]))
+    # (one step is long enough to roll well past the robot)
+    gamestate.clock.advance(.1)
+    simulator.step(.1)
+    ball_pos = gamestate.get_ball_position()
+    assert ball_pos[0] <= -(ROBOT_RADIUS + BALL_RADIUS) + 1e-6
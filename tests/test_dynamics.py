@@ -0,0 +1,22 @@
+import numpy as np
+from gamestate import GameState
+from strategy import Strategy
+
+
+def test_predicted_positions_follow_commands():
+    gamestate = GameState()
+    gamestate.update_robot_position('blue', 1, np.array([0., 0., 0.]))
+    gamestate.update_robot_position('blue', 2, np.array([500., 0., 0.]))
+    strategy = Strategy(gamestate, 'blue')
+    # (robot 2 drives straight ahead, robot 1 has no commands)
+    gamestate.get_robot_commands('blue', 2).set_speeds(0, 500, 0)
+    strategy._world = gamestate.snapshot()
+    robot_ids, positions = strategy.predict_robot_positions(.5)
+    assert robot_ids == [1, 2]
+    np.testing.assert_allclose(positions[0], [0, 0, 0])
+    # (accelerating after the command latency, so short of 250 mm)
+    assert 500 < positions[1][0] < 750
+    np.testing.assert_allclose(positions[1][1:], [0, 0])
+    # no commands get made for robots that had none
+    assert list(gamestate.get_team_commands('blue')) == [2]
+
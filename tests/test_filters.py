@@ -0,0 +1,45 @@
+import numpy as np
+import pytest
+from vision.filters import KinematicFilter
+
+
+def test_tracks_constant_velocity():
+    kinematic_filter = KinematicFilter(2, .5)
+    velocity = np.array([1000., -500.])
+    for i in range(100):
+        t = i / 60
+        position, estimate = kinematic_filter.update(t, velocity * t)
+    np.testing.assert_allclose(position, velocity * t, atol=1e-3)
+    np.testing.assert_allclose(estimate, velocity, atol=1e-3)
+
+
+def test_repeated_and_late_frames_are_ignored():
+    kinematic_filter = KinematicFilter(1, .5)
+    kinematic_filter.update(1., [0.])
+    position, _ = kinematic_filter.update(1.1, [10.])
+    assert kinematic_filter.update(1.1, [50.])[0] == pytest.approx(position)
+    assert kinematic_filter.update(1.05, [50.])[0] == pytest.approx(position)
+
+
+def test_resets_after_losing_the_object():
+    kinematic_filter = KinematicFilter(1, .5)
+    kinematic_filter.update(0., [0.])
+    kinematic_filter.update(.1, [100.])
+    later = .1 + KinematicFilter.RESET_TIME + .1
+    position, velocity = kinematic_filter.update(later, [5000.])
+    np.testing.assert_allclose(position, [5000])
+    np.testing.assert_allclose(velocity, [0])
+
+
+def test_angles_wrap_around():
+    kinematic_filter = KinematicFilter(3, .5, angle_dims=[2])
+    w = 0.
+    for i in range(60):
+        t = i / 60
+        w = np.pi - .5 + 2 * t
+        position, velocity = kinematic_filter.update(
+            t, [0, 0, np.arctan2(np.sin(w), np.cos(w))])
+    # (spinning at 2 rad/s straight through +-pi, without jumping back)
+    assert velocity[2] == pytest.approx(2, abs=.05)
+    assert -np.pi <= position[2] <= np.pi
+    assert np.cos(position[2] - w) == pytest.approx(1, abs=1e-3)
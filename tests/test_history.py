@@ -0,0 +1,73 @@
+import numpy as np
+import pytest
+from gamestate.history import PositionHistory
+
+
+def filled(capacity, num_samples):
+    history = PositionHistory(capacity, 2)
+    for i in range(num_samples):
+        history.append(float(i), [i, -i])
+    return history
+
+
+def test_empty():
+    history = PositionHistory(4, 2)
+    assert len(history) == 0
+    times, positions = history.all()
+    assert times.shape == (0,)
+    assert positions.shape == (0, 2)
+
+
+def test_oldest_to_newest():
+    history = filled(4, 3)
+    assert len(history) == 3
+    times, positions = history.all()
+    np.testing.assert_array_equal(times, [0, 1, 2])
+    np.testing.assert_array_equal(positions, [[0, 0], [1, -1], [2, -2]])
+    assert history.latest_time() == 2
+    np.testing.assert_array_equal(history.latest(), [2, -2])
+
+
+def test_wraps_around_keeping_newest():
+    history = filled(4, 11)
+    assert len(history) == 4
+    times, positions = history.all()
+    np.testing.assert_array_equal(times, [7, 8, 9, 10])
+    np.testing.assert_array_equal(positions[:, 0], [7, 8, 9, 10])
+    times, _ = history.last(2)
+    np.testing.assert_array_equal(times, [9, 10])
+    # (asking for more than there is returns what there is)
+    assert len(history.last(10)[0]) == 4
+
+
+def test_windows_are_read_only_views():
+    history = filled(4, 6)
+    times, positions = history.all()
+    with pytest.raises(ValueError):
+        positions[0] = 0
+    with pytest.raises(ValueError):
+        times[0] = 0
+    # latest is a copy, safe to change
+    latest = history.latest()
+    latest[:] = 100
+    np.testing.assert_array_equal(history.latest(), [5, -5])
+
+
+def test_since():
+    history = filled(8, 8)
+    times, positions = history.since(2)
+    np.testing.assert_array_equal(times, [5, 6, 7])
+    assert len(positions) == 3
+
+
+def test_clear_and_copy():
+    history = filled(4, 6)
+    copy = history.copy()
+    history.clear()
+    assert len(history) == 0
+    history.append(20., [1, 1])
+    np.testing.assert_array_equal(history.all()[0], [20])
+    # the copy is unaffected
+    np.testing.assert_array_equal(copy.all()[0], [2, 3, 4, 5])
+    copy.append(6., [6, -6])
+    np.testing.assert_array_equal(copy.all()[0], [3, 4, 5, 6])
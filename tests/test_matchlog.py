@@ -0,0 +1,55 @@
+import pytest
+from matchlog import MatchRecorder, MatchLogReader, VISION, REFBOX
+
+
+def record(path, records, chunk_max_records=MatchRecorder.CHUNK_MAX_RECORDS):
+    recorder = MatchRecorder(str(path))
+    recorder.CHUNK_MAX_RECORDS = chunk_max_records
+    recorder.start_recording()
+    for timestamp, source, packet in records:
+        recorder.record(source, packet, timestamp)
+    recorder.stop_recording()
+
+
+RECORDS = [(100. + i * .1, VISION if i % 3 else REFBOX, bytes([i]) * i)
+           for i in range(20)]
+
+
+def test_round_trip(tmp_path):
+    path = tmp_path / 'match.log'
+    record(path, RECORDS, chunk_max_records=6)
+    with MatchLogReader(str(path)) as reader:
+        assert len(reader) == len(RECORDS)
+        assert reader.start_time() == RECORDS[0][0]
+        assert reader.end_time() == RECORDS[-1][0]
+        assert list(reader) == RECORDS
+
+
+def test_start_time_and_sources(tmp_path):
+    path = tmp_path / 'match.log'
+    record(path, RECORDS, chunk_max_records=6)
+    with MatchLogReader(str(path)) as reader:
+        start_time = RECORDS[8][0]
+        assert list(reader.records(start_time)) == RECORDS[8:]
+        refbox = list(reader.records(sources=[REFBOX]))
+        assert refbox == [r for r in RECORDS if r[1] == REFBOX]
+
+
+def test_reads_logs_cut_off_before_the_index(tmp_path):
+    path = tmp_path / 'match.log'
+    record(path, RECORDS, chunk_max_records=6)
+    data = path.read_bytes()
+    # drop the index + trailer, and half of the last chunk
+    cut_path = tmp_path / 'cut.log'
+    with MatchLogReader(str(path)) as reader:
+        last_chunk_offset = reader._index[-1][0]
+    cut_path.write_bytes(data[:last_chunk_offset + 10])
+    with MatchLogReader(str(cut_path)) as reader:
+        assert list(reader) == RECORDS[:18]
+
+
+def test_rejects_other_files(tmp_path):
+    path = tmp_path / 'not_a.log'
+    path.write_bytes(b'\x00' * 64)
+    with pytest.raises(ValueError):
+        MatchLogReader(str(path))
@@ -0,0 +1,116 @@
+'''Vision over a local UDP stand-in for ssl-vision (127.0.0.1)'''
+import socket
+import time
+import numpy as np
+import pytest
+import sslclient
+from gamestate import GameState
+from matchlog import MatchRecorder, MatchLogReader, VISION
+from network import NetworkLoop
+from vision import SSLVisionDataProvider
+
+HOST = '127.0.0.1'
+
+
+def free_port():
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sock.bind((HOST, 0))
+    port = sock.getsockname()[1]
+    sock.close()
+    return port
+
+
+def vision_packet():
+    packet = sslclient.messages_robocup_ssl_wrapper_pb2.SSL_WrapperPacket()
+    detection = packet.detection
+    detection.frame_number = 1
+    detection.t_capture = detection.t_sent = time.time()
+    detection.camera_id = 0
+    robot = detection.robots_blue.add()
+    robot.robot_id, robot.x, robot.y, robot.orientation = 3, 1000, -500, .5
+    robot.confidence, robot.pixel_x, robot.pixel_y = 1, 0, 0
+    ball = detection.balls.add()
+    ball.x, ball.y = 200, 300
+    ball.confidence, ball.pixel_x, ball.pixel_y = 1, 0, 0
+    return packet
+
+
+def wait_for_frame(gamestate, timeout=2):
+    """whether the frame from vision_packet got into gamestate in time"""
+    return wait_until(lambda: gamestate.get_robot_last_update_time(
+        'blue', 3) is not None and gamestate.get_ball_position().any(),
+        timeout)
+
+
+def wait_until(condition, timeout):
+    end_time = time.time() + timeout
+    while not condition():
+        if time.time() > end_time:
+            return False
+        time.sleep(.001)
+    return True
+
+
+@pytest.fixture
+def network():
+    network = NetworkLoop()
+    network.start()
+    yield network
+    network.stop()
+    assert not network.is_running()
+
+
+def send(data, port):
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sock.sendto(data, (HOST, port))
+    sock.close()
+
+
+def test_vision_packet_reaches_gamestate(network):
+    gamestate = GameState()
+    port = free_port()
+    vision = SSLVisionDataProvider(gamestate, HOST=HOST, PORT=port)
+    vision.start_updating(.01, is_event_driven=True, network=network)
+    send(vision_packet().SerializeToString(), port)
+    assert wait_for_frame(gamestate)
+    vision.stop_updating()
+    np.testing.assert_allclose(gamestate.get_robot_position('blue', 3),
+                               [1000, -500, .5])
+    np.testing.assert_allclose(gamestate.get_ball_position(), [200, 300])
+
+
+def test_bad_packets_are_dropped(network):
+    gamestate = GameState()
+    port = free_port()
+    vision = SSLVisionDataProvider(gamestate, HOST=HOST, PORT=port)
+    vision.start_updating(.01, is_event_driven=True, network=network)
+    # (the loop keeps going after a packet that fails to decode)
+    send(b'\xff' * 10, port)
+    send(vision_packet().SerializeToString(), port)
+    assert wait_for_frame(gamestate)
+    vision.stop_updating()
+
+
+def test_raw_packets_are_recorded_as_received(network, tmp_path):
+    gamestate = GameState()
+    port = free_port()
+    path = str(tmp_path / 'match.log')
+    recorder = MatchRecorder(path)
+    recorder.start_recording()
+    vision = SSLVisionDataProvider(gamestate, HOST=HOST, PORT=port,
+                                   recorder=recorder)
+    vision.start_updating(.01, is_event_driven=True, network=network)
+    data = vision_packet().SerializeToString()
+    send_time = time.time()
+    send(data, port)
+    assert wait_for_frame(gamestate)
+    vision.stop_updating()
+    recorder.stop_recording()
+    with MatchLogReader(path) as reader:
+        records = list(reader)
+    assert len(records) == 1
+    timestamp, source, packet = records[0]
+    assert source == VISION
+    assert packet == data
+    # (stamped when the datagram came in, before it was decoded)
+    assert send_time <= timestamp <= time.time()
@@ -0,0 +1,68 @@
+import numpy as np
+import pytest
+from gamestate import GameState, VirtualClock
+from simulator import Simulator
+from simulator.batch import BatchSimulator
+
+RADIUS_SUM = GameState.ROBOT_RADIUS * 2
+
+
+def test_pairs_pushed_apart_equally():
+    gamestate = GameState()
+    positions = np.array([[0, 0, 0], [RADIUS_SUM - 20, 0, 0],
+                          [2000, 0, 0]])
+    displacements = gamestate.resolve_robot_overlaps(positions)
+    np.testing.assert_allclose(displacements, [[-10, 0], [10, 0], [0, 0]])
+
+
+def test_coincident_robots_separate():
+    gamestate = GameState()
+    positions = np.zeros((2, 3))
+    displacements = gamestate.resolve_robot_overlaps(positions)
+    separated = positions[:, :2] + displacements
+    assert np.linalg.norm(separated[0] - separated[1]) == \
+        pytest.approx(RADIUS_SUM)
+
+
+def test_stack_of_worlds_same_as_one_at_a_time():
+    gamestate = GameState()
+    rng = np.random.RandomState(0)
+    worlds = rng.uniform(-300, 300, (4, 5, 3))
+    worlds[0, 1] = worlds[0, 0]
+    overlaps = gamestate.pairwise_overlaps(worlds, RADIUS_SUM)
+    for world, world_overlaps in zip(worlds, overlaps):
+        np.testing.assert_allclose(
+            world_overlaps, gamestate.pairwise_overlaps(world, RADIUS_SUM))
+
+
+def test_batch_resolves_like_gamestate():
+    gamestate = GameState()
+    keys = [('blue', 0), ('blue', 1), ('yellow', 0)]
+    batch = BatchSimulator(2, keys)
+    batch.robot_positions[:] = [[0, 0, 0], [0, 0, 0], [100, 0, 0]]
+    # (robots that aren't there don't push anything)
+    batch.is_present[1, 2] = False
+    expected = batch.robot_positions[0].copy()
+    expected[:, :2] += gamestate.resolve_robot_overlaps(expected)
+    batch._resolve_robot_overlaps()
+    np.testing.assert_allclose(batch.robot_positions[0], expected)
+    np.testing.assert_allclose(batch.robot_positions[1, 2], [100, 0, 0])
+    assert np.linalg.norm(batch.robot_positions[1, 0, :2] -
+                          batch.robot_positions[1, 1, :2]) == \
+        pytest.approx(RADIUS_SUM)
+
+
+def test_batch_dribbles_like_simulator():
+    gamestate = GameState(VirtualClock(10.))
+    simulator = Simulator(gamestate)
+    simulator.put_fake_robot('blue', 1, np.array([0., 0., 0.]))
+    simulator.put_fake_ball(np.array([120., 10.]))
+    commands = gamestate.get_robot_commands('blue', 1)
+    commands.is_dribbling = True
+    batch = BatchSimulator.from_gamestate(gamestate, 2)
+    for _ in range(20):
+        gamestate.clock.advance(.05)
+        simulator.step(.05)
+        batch.step(.05)
+    np.testing.assert_allclose(batch.ball_positions,
+                               [gamestate.get_ball_position()] * 2)
@@ -0,0 +1,123 @@
+import numpy as np
+import pytest
+from gamestate import GameState
+from strategy.rrt import RRTTree, RRTPlanner, PLANNERS
+from strategy.nav_grid import NavigationGrid, GRID_PLANNERS
+from strategy.planner_service import PlannerService
+
+START = np.array([-1500., 0., 0.])
+GOAL = np.array([2000., 0., 0.])
+
+
+@pytest.fixture(scope='module')
+def world():
+    # a wall of opponents in the way, with gaps at either end
+    gamestate = GameState()
+    for i in range(6):
+        gamestate.update_robot_position('yellow', i,
+                                        np.array([0, -1200 + 400 * i, 0.]))
+    return gamestate.snapshot()
+
+
+def path_points(result):
+    # (the last waypoint is the whole goal pose, the others just x, y)
+    return np.array([START[:2]] +
+                    [np.asarray(p, dtype=float)[:2] for p in result.waypoints])
+
+
+def assert_path_clear(world, result):
+    assert result.success
+    points = path_points(result)
+    np.testing.assert_allclose(points[-1], GOAL[:2], atol=1)
+    obstacles = np.array([world.get_robot_position('yellow', i)[:2]
+                          for i in range(6)])
+    for start, end in zip(points[:-1], points[1:]):
+        for s in np.linspace(0, 1, 50):
+            pos = start + (end - start) * s
+            distances = np.linalg.norm(obstacles - pos, axis=1)
+            assert distances.min() >= GameState.ROBOT_RADIUS * 2
+    length = np.sum(np.linalg.norm(np.diff(points, axis=0), axis=1))
+    assert result.length == pytest.approx(length, rel=1e-6)
+
+
+def random_tree(rng, num_nodes):
+    tree = RRTTree(np.zeros(2), cell_size=200)
+    for _ in range(num_nodes - 1):
+        pos = rng.uniform(-3000, 3000, 2)
+        tree.add(pos, tree.nearest(pos))
+    return tree
+
+
+def test_tree_nearest_and_near_match_linear_scan():
+    rng = np.random.RandomState(0)
+    # (past LINEAR_SCAN_SIZE, so the grid search is used)
+    tree = random_tree(rng, 500)
+    assert len(tree) == 500
+    for pos in rng.uniform(-4000, 4000, (100, 2)):
+        distances = np.linalg.norm(tree.positions - pos, axis=1)
+        assert tree.nearest(pos) == np.argmin(distances)
+        assert sorted(tree.near(pos, 300)) == \
+            list(np.flatnonzero(distances <= 300))
+
+
+def test_tree_rewiring_updates_subtree_costs():
+    tree = RRTTree(np.zeros(2), cell_size=200)
+    a = tree.add(np.array([0., 300.]), 0)
+    b = tree.add(np.array([400., 300.]), a)
+    c = tree.add(np.array([400., 0.]), b)
+    assert tree.cost(c) == pytest.approx(1000)
+    tree.set_parent(c, 0)
+    tree.set_parent(b, c)
+    assert tree.cost(c) == pytest.approx(400)
+    assert tree.cost(b) == pytest.approx(700)
+    np.testing.assert_allclose(tree.path_to(b), [[0, 0], [400, 0], [400, 300]])
+
+
+@pytest.mark.parametrize('planner', PLANNERS)
+def test_rrt_planners(world, planner):
+    np.random.seed(0)
+    rrt = RRTPlanner(world, 'blue', 1)
+    assert_path_clear(world, rrt.plan(START, GOAL, planner, lim=1000))
+
+
+def test_rrt_star_shortens_paths(world):
+    lengths = dict()
+    for planner in PLANNERS:
+        np.random.seed(0)
+        rrt = RRTPlanner(world, 'blue', 1)
+        lengths[planner] = rrt.plan(START, GOAL, planner, lim=1000).length
+    assert lengths['rrt_star'] <= lengths['rrt']
+    assert lengths['informed_rrt_star'] <= lengths['rrt']
+
+
+@pytest.mark.parametrize('planner', GRID_PLANNERS)
+def test_grid_planners(world, planner):
+    nav_grid = NavigationGrid(world)
+    result = nav_grid.plan(world, 'blue', 1, START, GOAL, planner)
+    assert_path_clear(world, result)
+    # (deterministic)
+    again = nav_grid.plan(world, 'blue', 1, START, GOAL, planner)
+    assert len(result.waypoints) == len(again.waypoints)
+    for point, point_again in zip(result.waypoints, again.waypoints):
+        np.testing.assert_array_equal(point, point_again)
+
+
+def test_grid_covers_the_area_up_to_the_walls(world):
+    nav_grid = NavigationGrid(world)
+    goal = np.array([world.FIELD_MAX_X + world.WALL_MARGIN / 2, 2000., 0.])
+    result = nav_grid.plan(world, 'blue', 1, START, goal, 'theta_star')
+    assert result.success
+
+
+def test_planner_service_first_plan_all_meets_deadline(world):
+    service = PlannerService(num_workers=2)
+    service.start()
+    try:
+        requests = {i: (START, GOAL, None) for i in range(4)}
+        results = service.plan_all(world, 'blue', requests, deadline=1)
+        assert set(results) == set(requests)
+        for result in results.values():
+            assert result is not None
+            assert_path_clear(world, result)
+    finally:
+        service.stop()
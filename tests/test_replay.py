@@ -0,0 +1,40 @@
+import pytest
+import sslclient
+from gamestate import GameState, VirtualClock
+from matchlog import MatchRecorder, VISION
+from matchlog.replay import LogReplayProvider
+
+
+def vision_packet(frame_number, t_capture, x):
+    packet = sslclient.messages_robocup_ssl_wrapper_pb2.SSL_WrapperPacket()
+    detection = packet.detection
+    detection.frame_number = frame_number
+    detection.t_capture = detection.t_sent = t_capture
+    detection.camera_id = 0
+    robot = detection.robots_blue.add()
+    robot.robot_id, robot.x, robot.y, robot.orientation = 3, x, 0, 0
+    robot.confidence, robot.pixel_x, robot.pixel_y = 1, 0, 0
+    return packet.SerializeToString()
+
+
+def test_replay_drives_gamestate_on_recorded_times(tmp_path):
+    path = str(tmp_path / 'match.log')
+    recorder = MatchRecorder(path)
+    recorder.start_recording()
+    for i in range(10):
+        # (vision computer clock is 1000 s behind ours)
+        timestamp = 100 + i / 60
+        recorder.record(VISION, vision_packet(i, timestamp - 1000, 10 * i),
+                        timestamp)
+    recorder.stop_recording()
+
+    gamestate = GameState(VirtualClock())
+    replay = LogReplayProvider(gamestate, path, speed=None)
+    replay.start_updating()
+    assert replay.wait_until_done(5)
+    replay.stop_updating()
+    assert gamestate.clock.time() == 100 + 9 / 60
+    # (frames went straight into gamestate, without a polling thread)
+    assert gamestate.get_robot_last_update_time('blue', 3) == \
+        pytest.approx(100 + 9 / 60)
+    assert gamestate.get_robot_position('blue', 3)[0] == pytest.approx(90, abs=5)
@@ -0,0 +1,52 @@
+import numpy as np
+import pytest
+from comms.trajectory import braking_speeds, next_speeds, arrival_times
+
+MAX_SPEED = 1000.
+MAX_ACCELERATION = 2000.
+
+
+def test_arrival_times_from_rest():
+    # long enough to cruise: 1 s ramping each way + the rest at max speed
+    # short: triangle profile, 2 * sqrt(d / a)
+    times = arrival_times([3000, -3000, 200, 0], 0, MAX_SPEED,
+                          MAX_ACCELERATION)
+    np.testing.assert_allclose(times, [3.5, 3.5, 2 * np.sqrt(.1), 0])
+
+
+def test_arrival_times_while_moving():
+    # already cruising towards it: 0.5 s braking at the end
+    assert arrival_times(2000, MAX_SPEED, MAX_SPEED,
+                         MAX_ACCELERATION) == pytest.approx(2.25)
+    # heading away: stop first (0.5 s, 250 mm), then come back 1250 mm
+    assert arrival_times(1000, -MAX_SPEED, MAX_SPEED, MAX_ACCELERATION) == \
+        pytest.approx(.5 + arrival_times(1250, 0, MAX_SPEED, MAX_ACCELERATION))
+    # too fast to stop in time: overshoot and come back
+    assert arrival_times(100, MAX_SPEED, MAX_SPEED, MAX_ACCELERATION) == \
+        pytest.approx(.5 + arrival_times(150, 0, MAX_SPEED, MAX_ACCELERATION))
+
+
+def test_braking_speeds():
+    speeds = braking_speeds([0, 10, 1e6], MAX_SPEED, MAX_ACCELERATION, .1)
+    assert speeds[0] == 0
+    assert 0 < speeds[1] < MAX_SPEED
+    assert speeds[2] == MAX_SPEED
+
+
+def test_next_speeds_limit_acceleration():
+    step = MAX_ACCELERATION * .1
+    speeds = next_speeds(np.array([5000, -5000, 5000]),
+                         np.array([0, 0, -MAX_SPEED]), MAX_SPEED,
+                         MAX_ACCELERATION, .1)
+    np.testing.assert_allclose(speeds, [step, -step, -MAX_SPEED + step])
+
+
+def test_following_next_speeds_stops_at_the_target():
+    delta_time = .01
+    position, speed = 0., 0.
+    for _ in range(1000):
+        speed = next_speeds(1500 - position, speed, MAX_SPEED,
+                            MAX_ACCELERATION, delta_time)
+        position += speed * delta_time
+    assert position == pytest.approx(1500, abs=1)
+    assert speed == pytest.approx(0, abs=1e-6)
@@ -4,17 +4,36 @@ import sslclient
 import threading
 import time
 import logging
-import numpy as np
-from collections import Counter
 from typing import Tuple
+from matchlog import VISION
+try:
+    from filters import KinematicFilter
+    from fusion import VisionFusion
+except (SystemError, ImportError):
+    from .filters import KinematicFilter
+    from .fusion import VisionFusion
 
 logger = logging.getLogger(__name__)
 
+# (ssl-vision packets are at most one UDP datagram)
+MAX_PACKET_SIZE = 65536
+
+# vision computer + our clocks aren't synced, if frames suddenly seem to
+# take longer than this to arrive assume its clock jumped and resync
+MAX_CAPTURE_DELAY = 1
+
 
 class SSLVisionDataProvider(object):
-    def __init__(self, gamestate, HOST='224.5.23.2', PORT=10006):
+    # how much of the previous estimate filters keep with each new frame
+    BALL_FILTER_SMOOTHING = .5
+    ROBOT_FILTER_SMOOTHING = .6
+
+    def __init__(self, gamestate, HOST='224.5.23.2', PORT=10006, recorder=None,
+                 is_event_driven=False):
         self.HOST = HOST
         self.PORT = PORT
+        # (optional) MatchRecorder to save every received packet to
+        self._recorder = recorder
 
         self._ssl_vision_client = None
         self._ssl_vision_thread = None
@@ -26,26 +45,54 @@ class SSLVisionDataProvider(object):
             2: sslclient.messages_robocup_ssl_detection_pb2.SSL_DetectionFrame(),
             3: sslclient.messages_robocup_ssl_detection_pb2.SSL_DetectionFrame(),
         }
+        # the same frames as numpy arrays, for merging the cameras
+        self._fusion = VisionFusion()
 
         self._gamestate = gamestate
         self._gamestate_update_thread = None
         self._is_running = False
         self._vision_loop_sleep = None
         self._last_update_time = None
+        # whether frames are pushed to gamestate as soon as they arrive
+        # (also set by start_updating, this is for feeding in packets
+        # without starting it, like log replay does)
+        self._is_event_driven = is_event_driven
+        # our time - vision computer time (see _capture_to_local_time)
+        self._capture_time_offset = None
+        # frame number of the data used from each camera in the last update
+        self._last_frame_numbers = None
+        # smooth positions + estimate velocities (they go into gamestate)
+        self._ball_filter = KinematicFilter(2, self.BALL_FILTER_SMOOTHING)
+        self._robot_filters = dict()  # (team, robot_id) : KinematicFilter
 
-    def start_updating(self, loop_sleep):
-        """Starts listening to SSL-vision and updating the gamestate with new data"""
+    def start_updating(self, loop_sleep, is_event_driven=False, network=None):
+        """Starts listening to SSL-vision and updating the gamestate with new data
+        If event driven, each frame goes into gamestate as soon as it is
+        received (instead of polling for the latest frames every loop_sleep)
+        If given a (running) NetworkLoop, packets are received on it instead
+        of on a receive thread of our own.
+        """
         self._is_running = True
-        self._ssl_vision_client = sslclient.client()
-        self._ssl_vision_client.connect()
-        self._ssl_vision_thread = threading.Thread(
-            target=self.receive_data_loop
-        )
-        # set to daemon mode so it will be easily killed
-        self._ssl_vision_thread.daemon = True
-        self._ssl_vision_thread.start()
+        self._is_event_driven = is_event_driven
+        if network is not None:
+            network.add_receiver(
+                self.HOST, self.PORT,
+                sslclient.messages_robocup_ssl_wrapper_pb2.SSL_WrapperPacket.FromString,
+                self.handle_packet, self.record_packet
+            )
+        else:
+            self._ssl_vision_client = sslclient.client(self.HOST, self.PORT)
+            self._ssl_vision_client.connect()
+            self._ssl_vision_thread = threading.Thread(
+                target=self.receive_data_loop
+            )
+            # set to daemon mode so it will be easily killed
+            self._ssl_vision_thread.daemon = True
+            self._ssl_vision_thread.start()
 
         self._vision_loop_sleep = loop_sleep
+        if is_event_driven:
+            return
         self._gamestate_update_thread = threading.Thread(
             target=self.gamestate_update_loop
         )
@@ -56,35 +103,62 @@ class SSLVisionDataProvider(object):
     def stop_updating(self):
         if self._is_running:
             self._is_running = False
-            self._gamestate_update_thread.join()
-            self._gamestate_update_thread = None
-            self._is_receiving = False
-            self._ssl_vision_thread.join()
-            self._ssl_vision_thread = None
+            if self._gamestate_update_thread is not None:
+                self._gamestate_update_thread.join()
+                self._gamestate_update_thread = None
+            if self._ssl_vision_thread is not None:
+                self._ssl_vision_thread.join()
+                self._ssl_vision_thread = None
 
     # loop for reading messages from ssl vision, otherwise they pile up
     def receive_data_loop(self):
+        decode = sslclient.messages_robocup_ssl_wrapper_pb2.SSL_WrapperPacket.FromString
         while self._is_running:
-            data = self._ssl_vision_client.receive()
-            # print(data)
-            # get a detection packet from any camera, and store it
-            if data.HasField('detection'):
-                self._raw_camera_data[data.detection.camera_id] = data.detection
+            # (read from the client's socket instead of receive(), which
+            # only returns the decoded packet, so the raw one can be saved)
+            data, _ = self._ssl_vision_client.sock.recvfrom(MAX_PACKET_SIZE)
+            self.record_packet(data, time.time())
+            self.handle_packet(decode(data))
+
+    def record_packet(self, data, receive_time):
+        """save a raw packet to the recorder (if there is one)"""
+        if self._recorder is not None:
+            self._recorder.record(VISION, data, receive_time)
+
+    def handle_packet(self, data):
+        # get a detection packet from any camera, and store it
+        if data.HasField('detection'):
+            detection = data.detection
+            capture_time = self._capture_to_local_time(detection.t_capture)
+            self._fusion.add_frame(detection, capture_time)
+            self._raw_camera_data[detection.camera_id] = detection
+            if self._is_event_driven:
+                self.update_gamestate(capture_time)
+                self._gamestate.notify_vision_update()
+
+    def _capture_to_local_time(self, t_capture):
+        """Convert a frame's capture time (vision computer clock) to our
+        clock, using the smallest offset seen so far (the frame that had the
+        least delay getting to us), so timing between frames is exact."""
+        offset = self._gamestate.clock.time() - t_capture
+        if self._capture_time_offset is None or \
+           offset < self._capture_time_offset or \
+           offset - self._capture_time_offset > MAX_CAPTURE_DELAY:
+            self._capture_time_offset = offset
+        return t_capture + self._capture_time_offset
 
     def gamestate_update_loop(self):
         # wait until game begins (while other threads are initializing)
         self._gamestate.wait_until_game_begins()
         while self._is_running:
-            # update positions of all robots seen by data feed
-            for team in ['blue', 'yellow']:
-                robot_positions = self.get_robot_positions(team)
-                # print(robot_positions)
-                for robot_id, pos in robot_positions.items():
-                    self._gamestate.update_robot_position(team, robot_id, pos)
-            # update position of the ball
-            ball_data = self._get_ball_position()
-            if ball_data is not None:
-                self._gamestate.update_ball_position(ball_data)
+            # only update when some camera has sent a new frame, so the
+            # filters don't see the same data twice
+            frame_numbers = tuple(raw_data.frame_number for raw_data
+                                  in self._raw_camera_data.values())
+            if frame_numbers != self._last_frame_numbers:
+                self._last_frame_numbers = frame_numbers
+                self.update_gamestate(self._gamestate.clock.time())
+                self._gamestate.notify_vision_update()
 
             if self._last_update_time is not None:
                 delta = time.time() - self._last_update_time
@@ -96,66 +170,45 @@ class SSLVisionDataProvider(object):
             # yield to other threads
             time.sleep(self._vision_loop_sleep)
 
-    def get_robot_positions(self, team='blue'):
-        robot_positions = {}
-        # track how many cameras see each robot, for averaging
-        num_cameras_seen = Counter()
-        for camera_id, raw_data in self._raw_camera_data.items():
-            if team == 'blue':
-                team_data = raw_data.robots_blue
-            else:
-                assert(team == 'yellow')
-                team_data = raw_data.robots_yellow
-            for robot_data in team_data:
-                robot_id = robot_data.robot_id
-                num_cameras_seen[robot_id] += 1
-                # only update data if it has higher confidence
-                CONFIDENCE_THRESHOLD = .5
-                if robot_data.confidence >= CONFIDENCE_THRESHOLD:
-                    # average in the new data
-                    pos = np.array([robot_data.x, robot_data.y, robot_data.orientation])
-                    if robot_id not in robot_positions:
-                        robot_positions[robot_id] = pos
-                    else:
-                        times_seen = num_cameras_seen[robot_id]
-                        current_pos = robot_positions[robot_id]
-                        average_pos = np.array([
-                            (current_pos[0] * (times_seen - 1) + pos[0]) / times_seen, 
-                            (current_pos[1] * (times_seen - 1) + pos[1]) / times_seen, 
-                            # TODO: safely average orientation?
-                            self._circular_mean((times_seen - 1, 1), (robot_data.orientation, pos[2]))
-                        ])
-                        robot_positions[robot_id] = average_pos
-        #if (team == 'blue'):
-        #    print(robot_positions[0])
-        return robot_positions
-    
-    def _circular_mean(self, weights, angles):
-        "helper function for averaging angles by converting to points"
-        x = y = 0.
-        for angle, weight in zip(angles, weights):
-            x += np.cos(angle) * weight
-            y += np.sin(angle) * weight
-        if x == 0 and y == 0:
-            print('freak coincidence?')
-            return 0
-        mean = np.arctan2(y, x)
-        return mean
-
-    def _get_ball_position(self) -> Tuple[float, float]:
-        "Returns average ball readings of the cameras."
-        average_ball = None
-        times_seen = 0
-        # TODO: Do some advanced processing based on which camera has seen the ball
-        for camera_id, raw_data in self._raw_camera_data.items():
-            balls = raw_data.balls
-            CONFIDENCE_THRESHOLD = .5
-            if len(balls) > 0 and balls[0].confidence >= CONFIDENCE_THRESHOLD:
-                ball = balls[0]
-                times_seen += 1
-                if average_ball is None:
-                    average_ball = np.array([ball.x, ball.y])
-                else:
-                    pos = np.array([ball.x, ball.y])
-                    average_ball = (average_ball * (times_seen - 1) + pos) / times_seen
-        return average_ball
+    def update_gamestate(self, timestamp):
+        """filter the latest camera data and put it into gamestate"""
+        gs = self._gamestate
+        # update positions of all robots seen by data feed
+        # (frames from different cameras can arrive out of order, so skip
+        # anything not newer than what gamestate already has for it)
+        for team in ['blue', 'yellow']:
+            robot_positions = self.get_robot_positions(team, timestamp)
+            # print(robot_positions)
+            for robot_id, pos in robot_positions.items():
+                last_time = gs.get_robot_last_update_time(team, robot_id)
+                if last_time is not None and timestamp <= last_time:
+                    continue
+                key = (team, robot_id)
+                if key not in self._robot_filters:
+                    self._robot_filters[key] = KinematicFilter(
+                        3, self.ROBOT_FILTER_SMOOTHING, angle_dims=[2]
+                    )
+                pos, velocity = self._robot_filters[key].update(timestamp, pos)
+                gs.update_robot_position(team, robot_id, pos, timestamp,
+                                         velocity)
+        # update position of the ball
+        ball_data = self._get_ball_position(timestamp)
+        last_time = gs.get_ball_last_update_time()
+        if last_time is not None and timestamp <= last_time:
+            ball_data = None
+        if ball_data is not None:
+            pos, velocity = self._ball_filter.update(timestamp, ball_data)
+            gs.update_ball_position(pos, timestamp, velocity)
+
+    def get_robot_positions(self, team='blue', timestamp=None):
+        "Returns robot_id : position of robots seen by recent camera frames"
+        assert(team in ['blue', 'yellow'])
+        if timestamp is None:
+            timestamp = self._gamestate.clock.time()
+        return self._fusion.robot_positions(team, timestamp)
+
+    def _get_ball_position(self, timestamp=None) -> Tuple[float, float]:
+        "Returns average ball readings of the recent camera frames."
+        if timestamp is None:
+            timestamp = self._gamestate.clock.time()
+        return self._fusion.ball_position(timestamp)
@@ -0,0 +1,63 @@
+'''Filters for smoothing vision data + estimating velocities'''
+import numpy as np
+
+
+class KinematicFilter(object):
+    """Constant acceleration (alpha-beta-gamma) filter for one object.
+       Every measurement nudges the predicted position, velocity and
+       acceleration towards what was seen, so velocity is always ready to
+       read instead of being recomputed from the position history.
+       angle_dims are dimensions holding angles (wrapped to [-pi, pi]).
+    """
+    # restart from scratch if the object hasn't been seen for this long (s)
+    RESET_TIME = .5
+
+    def __init__(self, dimensions, smoothing, angle_dims=()):
+        # gains of a critically damped filter, from how much of the
+        # previous estimate to keep (0 = trust measurements completely)
+        self._alpha = 1 - smoothing ** 3
+        self._beta = 1.5 * (1 - smoothing ** 2) * (1 - smoothing)
+        self._gamma = .5 * (1 - smoothing) ** 3
+        self._dimensions = dimensions
+        self._angle_dims = list(angle_dims)
+        self.position = None
+        self.velocity = np.zeros(dimensions)
+        self.acceleration = np.zeros(dimensions)
+        self.last_time = None
+
+    def _wrap_angles(self, values):
+        if self._angle_dims:
+            angles = values[self._angle_dims]
+            values[self._angle_dims] = np.arctan2(np.sin(angles), np.cos(angles))
+        return values
+
+    def reset(self, timestamp, measurement):
+        self.position = np.array(measurement, dtype=float)
+        self.velocity = np.zeros(self._dimensions)
+        self.acceleration = np.zeros(self._dimensions)
+        self.last_time = timestamp
+
+    def update(self, timestamp, measurement):
+        """add a measurement, returns the filtered (position, velocity)"""
+        if self.position is None or \
+           timestamp - self.last_time > self.RESET_TIME:
+            self.reset(timestamp, measurement)
+            return self.position.copy(), self.velocity.copy()
+        dt = timestamp - self.last_time
+        if dt <= 0:
+            # same (or out of order) frame, nothing new to learn
+            return self.position.copy(), self.velocity.copy()
+        predicted_position = self.position + self.velocity * dt + \
+            .5 * self.acceleration * dt ** 2
+        predicted_velocity = self.velocity + self.acceleration * dt
+        residual = self._wrap_angles(
+            np.array(measurement, dtype=float) - predicted_position
+        )
+        self.position = self._wrap_angles(
+            predicted_position + self._alpha * residual
+        )
+        self.velocity = predicted_velocity + self._beta * residual / dt
+        self.acceleration = self.acceleration + \
+            2 * self._gamma * residual / dt ** 2
+        self.last_time = timestamp
+        return self.position.copy(), self.velocity.copy()
@@ -0,0 +1,108 @@
+'''Merges detections from all cameras into one position per object'''
+import numpy as np
+
+
+class CameraFrame(object):
+    """Detections from one camera frame, converted to numpy arrays once when
+       the frame is received (so fusing never loops over protobuf fields)
+    """
+    def __init__(self, detection, capture_time):
+        self.camera_id = detection.camera_id
+        self.capture_time = capture_time  # (on our clock)
+        self.robots = {
+            'blue': self._robot_arrays(detection.robots_blue),
+            'yellow': self._robot_arrays(detection.robots_yellow),
+        }
+        balls = detection.balls
+        self.ball_positions = np.array([(b.x, b.y) for b in balls],
+                                       dtype=float).reshape(-1, 2)
+        self.ball_confidences = np.array([b.confidence for b in balls],
+                                         dtype=float)
+
+    @staticmethod
+    def _robot_arrays(team_data):
+        """(ids, N x 3 positions (x, y, w), confidences)"""
+        ids = np.array([r.robot_id for r in team_data], dtype=int)
+        positions = np.array([(r.x, r.y, r.orientation) for r in team_data],
+                             dtype=float).reshape(-1, 3)
+        confidences = np.array([r.confidence for r in team_data], dtype=float)
+        return ids, positions, confidences
+
+
+class VisionFusion(object):
+    """Keeps the latest frame from each camera, and averages what they saw.
+       Each detection is weighted by its confidence and by how recent its
+       frame is, and frames that are too old are left out entirely, so a
+       camera that stopped seeing something doesn't keep pulling it back.
+       Objects in the overlap between cameras get the weighted average.
+    """
+    CONFIDENCE_THRESHOLD = .5
+    # frames older than this (seconds) are ignored
+    MAX_FRAME_AGE = .1
+    # a frame this much older than another counts half as much
+    RECENCY_HALF_LIFE = .02
+    # ball detections farther than this from the best one are other objects
+    BALL_MERGE_DISTANCE = 200
+
+    def __init__(self):
+        self._frames = dict()  # camera_id : latest CameraFrame
+
+    def add_frame(self, detection, capture_time):
+        self._frames[detection.camera_id] = CameraFrame(detection, capture_time)
+
+    def _fresh_frames(self, now):
+        """(frame, recency weight) of every frame that isn't too old"""
+        # (copy the values since frames may be added at any time)
+        frames = list(self._frames.values())
+        fresh_frames = []
+        for frame in frames:
+            age = max(now - frame.capture_time, 0)
+            if age <= self.MAX_FRAME_AGE:
+                fresh_frames.append((frame, .5 ** (age / self.RECENCY_HALF_LIFE)))
+        return fresh_frames
+
+    def robot_positions(self, team, now):
+        """dict of robot_id : fused np.array([x, y, w])"""
+        ids, positions, weights = [], [], []
+        for frame, recency in self._fresh_frames(now):
+            frame_ids, frame_positions, confidences = frame.robots[team]
+            is_confident = confidences >= self.CONFIDENCE_THRESHOLD
+            ids.append(frame_ids[is_confident])
+            positions.append(frame_positions[is_confident])
+            weights.append(confidences[is_confident] * recency)
+        if not ids:
+            return dict()
+        ids = np.concatenate(ids)
+        if len(ids) == 0:
+            return dict()
+        positions = np.concatenate(positions)
+        weights = np.concatenate(weights)
+        # weighted sums per robot id (angles are averaged as unit vectors)
+        unique_ids, rows = np.unique(ids, return_inverse=True)
+        total_weights = np.bincount(rows, weights)
+        x = np.bincount(rows, weights * positions[:, 0]) / total_weights
+        y = np.bincount(rows, weights * positions[:, 1]) / total_weights
+        w = np.arctan2(np.bincount(rows, weights * np.sin(positions[:, 2])),
+                       np.bincount(rows, weights * np.cos(positions[:, 2])))
+        return {int(robot_id): np.array([x[i], y[i], w[i]])
+                for i, robot_id in enumerate(unique_ids)}
+
+    def ball_position(self, now):
+        """fused ball np.array([x, y]), or None if no camera sees it"""
+        positions, weights = [], []
+        for frame, recency in self._fresh_frames(now):
+            is_confident = frame.ball_confidences >= self.CONFIDENCE_THRESHOLD
+            positions.append(frame.ball_positions[is_confident])
+            weights.append(frame.ball_confidences[is_confident] * recency)
+        if not positions:
+            return None
+        positions = np.concatenate(positions)
+        weights = np.concatenate(weights)
+        if len(positions) == 0:
+            return None
+        # average the detections of the most trusted ball, from every camera
+        best = positions[np.argmax(weights)]
+        is_same_ball = np.linalg.norm(positions - best, axis=1) < \
+            self.BALL_MERGE_DISTANCE
+        return np.average(positions[is_same_ball], axis=0,
+                          weights=weights[is_same_ball])
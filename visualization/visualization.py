@@ -44,7 +44,8 @@ class Visualizer(object):
     """Robocup homegrown visualization library that essentially does the same
     as the modules in OpenAI gym."""
 
-    def __init__(self, gamestate, home_strategy, away_strategy):
+    def __init__(self, gamestate, home_strategy, away_strategy,
+                 simulator=None):
         self._viewer = None
         self._clock = None
 
@@ -56,6 +57,10 @@ class Visualizer(object):
         self._home_strategy = home_strategy
         self._away_strategy = away_strategy
         self._updating = True
+        # read-only copy of the world, refreshed once per frame
+        self._world = gamestate.snapshot()
+        # (optional) simulator to draw smoothed positions from
+        self._simulator = simulator
 
         # derive screen dimentions from field dimensions
         self._TOTAL_SCREEN_WIDTH = int((self._gs.FIELD_X_LENGTH + 2 * WINDOW_BUFFER) * SCALE)
@@ -123,6 +128,7 @@ class Visualizer(object):
         while self._updating:
             # make sure prints from all threads get flushed to terminal
             sys.stdout.flush()
+            self._world = self._gs.snapshot()
             for event in pygame.event.get():
                 if event.type == pygame.QUIT:
                     self._updating = False
@@ -171,11 +177,11 @@ class Visualizer(object):
                     # ball/robot selection
                     down, up = self.user_click_down, self.user_click_up
                     robot_clicked = \
-                        self._gs.robot_at_position(down) and \
-                        self._gs.robot_at_position(up)
+                        self._world.robot_at_position(down) and \
+                        self._world.robot_at_position(up)
                     ball_clicked = \
-                        self._gs.ball_overlap(down).any() and \
-                        self._gs.ball_overlap(up).any()
+                        self._world.ball_overlap(down).any() and \
+                        self._world.ball_overlap(up).any()
                     if robot_clicked or ball_clicked:
                         self.user_click_down = None
                         self._gs.user_click_position = None
@@ -236,10 +242,17 @@ class Visualizer(object):
             self.draw_line(GOAL_COLOR, *goalposts, FIELD_LINE_WIDTH * 2)
 
         # Draw all the robots
-        for (team, robot_id), pos in self._gs.get_all_robot_positions():
-            pos = self._gs.get_robot_position(team, robot_id)
+        world = self._world
+        # (if simulating, draw in between physics steps so motion is smooth)
+        render_positions = None
+        if self._simulator is not None and self._simulator.is_simulating():
+            render_positions = self._simulator.render_positions()
+        for i, (team, robot_id) in enumerate(world.robot_keys):
+            pos = world.robot_positions[i]
+            if render_positions is not None:
+                pos = render_positions[0].get((team, robot_id), pos)
             robot_color = BLUE_TEAM_COLOR if team == 'blue' else YELLOW_TEAM_COLOR
-            if self._gs.is_robot_lost(team, robot_id):
+            if world.is_lost[i]:
                 robot_color = ROBOT_LOST_COLOR
             (x, y, w) = pos
             self.draw_circle(robot_color, pos, self._gs.ROBOT_RADIUS)
@@ -265,7 +278,7 @@ class Visualizer(object):
             if robot_commands.is_dribbling:
                 self.draw_circle(
                     TRAJECTORY_COLOR,
-                    self._gs.dribbler_pos(team, robot_id),
+                    world.dribbler_pos(team, robot_id),
                     20
                 )
             # draw waypoints for this robot
@@ -296,15 +309,17 @@ class Visualizer(object):
                 )
 
         # Draw ball
-        ball_pos = self._gs.get_ball_position()
-        if not self._gs.is_ball_lost():
+        ball_pos = world.ball_position
+        if render_positions is not None and render_positions[1] is not None:
+            ball_pos = render_positions[1]
+        if not world.is_ball_lost():
             # draw where the best position is to kick towards the mouse.
             # mouse_pos = self.screen_to_field(pygame.mouse.get_pos())
             # kick_pos = self._home_strategy.best_kick_pos(ball_pos, mouse_pos)
             # self.draw_waypoint(kick_pos)
 
             # draw where we think ball will be in 1s
-            predicted_pos = self._gs.predict_ball_pos(1)
+            predicted_pos = world.predict_ball_pos(1)
             self.draw_circle((0, 0, 0), predicted_pos, self._gs.BALL_RADIUS)
             # draw actual ball
             self.draw_circle(BALL_COLOR, ball_pos, self._gs.BALL_RADIUS)
@@ -318,7 +333,7 @@ class Visualizer(object):
                 )
 
             # draw ball velocity
-            velocity = self._gs.get_ball_velocity()
+            velocity = world.ball_velocity
             self.draw_line(
                 TRAJECTORY_COLOR,
                 ball_pos,